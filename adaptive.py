@@ -0,0 +1,195 @@
+import bisect
+import math
+import threading
+
+import quiz_app as qa
+import storage
+
+# Adaptive question selection with Elo-style ratings.
+# Every user and every question has a rating (1500 to start). After each answer
+# both move towards the observed result. The next question is the unasked one
+# whose rating is closest to the rating at which the user is expected to
+# succeed TARGET_SUCCESS of the time. Questions of a category are kept in a
+# sorted ratings index, so a pick is a binary search instead of a scan.
+# Several processes can share ratings.json: each one saves its own changes as
+# deltas on top of what the others wrote since it last read the file.
+
+INITIAL_RATING = 1500.0
+USER_K = 32.0
+QUESTION_K = 16.0
+TARGET_SUCCESS = 0.5
+
+
+def question_key(question):
+    """Identity of a question in the ratings file: its stable uid, or its text in a legacy bank."""
+    return question.get('uid') or question['question']
+
+def expected_success(user_rating, question_rating):
+    return 1.0 / (1.0 + 10 ** ((question_rating - user_rating) / 400.0))
+
+def target_rating(user_rating, success=TARGET_SUCCESS):
+    """Question rating the user is expected to answer correctly with probability `success`."""
+    return user_rating - 400.0 * math.log10(success / (1.0 - success))
+
+
+class CategoryIndex:
+    """Questions of one category ordered by rating."""
+
+    def __init__(self, category, ratings):
+        self.source = category  # the cached category this index was built from
+        self.questions = {question_key(q): q for q in category.get('questions', [])}
+        # (rating, key) pairs: equal ratings are ordered by key, so an entry is found by bisection alone
+        self.entries = sorted((ratings.get(key, {}).get("rating", INITIAL_RATING), key) for key in self.questions)
+
+    def closest(self, target, exclude):
+        """The question whose rating is nearest to `target`, skipping keys in `exclude`."""
+        entries = self.entries
+        right = bisect.bisect_left(entries, (target,))
+        left = right - 1
+        # Walk outwards from the insertion point; only already-asked questions are skipped
+        while left >= 0 or right < len(entries):
+            take_left = right >= len(entries) or (
+                left >= 0 and target - entries[left][0] <= entries[right][0] - target)
+            position = left if take_left else right
+            if take_left:
+                left -= 1
+            else:
+                right += 1
+            if entries[position][1] not in exclude:
+                return self.questions[entries[position][1]]
+        return None
+
+    def move(self, key, old_rating, new_rating):
+        position = bisect.bisect_left(self.entries, (old_rating, key))
+        if position < len(self.entries) and self.entries[position] == (old_rating, key):
+            del self.entries[position]
+        bisect.insort(self.entries, (new_rating, key))
+
+
+class AdaptiveEngine:
+    """User and question ratings, persisted in a small JSON file."""
+
+    def __init__(self, filename='ratings.json'):
+        self.file_path = qa.get_file_path(filename)
+        self._lock = threading.Lock()
+        self._indexes = {}
+        self._changes = {}  # ("user", id) or ("question", category, key) -> [rating delta, answers delta]
+        self._load()
+
+    def _load(self):
+        self._signature = storage.file_signature(self.file_path)
+        data = storage.read_json(self.file_path, {})
+        self.users = data.get("users", {})          # str(user_id) -> {"rating", "answers"}
+        self.questions = data.get("questions", {})  # category name -> {question key -> {"rating", "answers"}}
+        self._indexes = {}
+
+    def _index(self, category):
+        index = self._indexes.get(category['name'])
+        if index is None or index.source is not category:  # the bank was reloaded
+            index = CategoryIndex(category, self.questions.get(category['name'], {}))
+            self._indexes[category['name']] = index
+        return index
+
+    def user_rating(self, user_id):
+        return self.users.get(str(user_id), {}).get("rating", INITIAL_RATING)
+
+    def question_rating(self, category_name, question):
+        return self.questions.get(category_name, {}).get(question_key(question), {}).get("rating", INITIAL_RATING)
+
+    def next_question(self, user_id, category, asked=()):
+        """Pick the unasked question of `category` that best matches the user's ability."""
+        with self._lock:
+            exclude = {question_key(q) for q in asked}
+            return self._index(category).closest(target_rating(self.user_rating(user_id)), exclude)
+
+    def record_answer(self, user_id, category, question, is_correct):
+        """Update the user and question ratings after one answer."""
+        with self._lock:
+            key = question_key(question)
+            user = self.users.setdefault(str(user_id), {"rating": INITIAL_RATING, "answers": 0})
+            ratings = self.questions.setdefault(category['name'], {})
+            item = ratings.setdefault(key, {"rating": INITIAL_RATING, "answers": 0})
+
+            surprise = (1.0 if is_correct else 0.0) - expected_success(user["rating"], item["rating"])
+            old_rating = item["rating"]
+            user["rating"] += USER_K * surprise
+            item["rating"] -= QUESTION_K * surprise
+            user["answers"] += 1
+            item["answers"] += 1
+            for change_key, delta in ((("user", str(user_id)), USER_K * surprise),
+                                      (("question", category['name'], key), -QUESTION_K * surprise)):
+                change = self._changes.setdefault(change_key, [0.0, 0])
+                change[0] += delta
+                change[1] += 1
+
+            index = self._indexes.get(category['name'])
+            if index is not None and key in index.questions:
+                index.move(key, old_rating, item["rating"])
+
+    def save(self, replace=False):
+        """Persist the ratings if they changed (called once per finished quiz).
+
+        Changes saved by other processes since this one read the file are kept:
+        this process's own updates are applied to them as deltas. With
+        `replace`, the file is overwritten with this process's ratings.
+        """
+        with self._lock, storage.file_lock(self.file_path):
+            if not self._changes and not replace:
+                return
+            if not replace and storage.file_signature(self.file_path) != self._signature:
+                changes = self._changes
+                self._load()
+                for change_key, (delta, answers) in changes.items():
+                    table = (self.users if change_key[0] == "user"
+                             else self.questions.setdefault(change_key[1], {}))
+                    item = table.setdefault(change_key[-1], {"rating": INITIAL_RATING, "answers": 0})
+                    item["rating"] += delta
+                    item["answers"] += answers
+            storage.write_json_atomic(self.file_path, {"users": self.users, "questions": self.questions}, indent=2)
+            self._signature = storage.file_signature(self.file_path)
+            self._changes = {}
+
+    def rebuild_from_history(self, filename='history.json'):
+        """Replay every stored answer, oldest first, to recompute all ratings."""
+        with self._lock:
+            self.users, self.questions, self._indexes, self._changes = {}, {}, {}, {}
+        categories = {cat['name']: cat for cat in qa.load_quiz()}
+        # Legacy answers only carry the question text; map it to the current question when possible
+        by_text = {q['question']: q for cat in categories.values() for q in cat.get('questions', [])}
+        backend = storage.get_storage()
+        replayed = 0
+        for game, _ in backend.history_since(qa.get_file_path(filename)):
+            category = categories.get(game.get('category'), {"name": game.get('category'), "questions": []})
+            for answer in game.get('questions', []):
+                if isinstance(answer, list):  # compact [uid, user_answer, correct, hash] record
+                    question, is_correct = {"uid": answer[0]}, answer[2]
+                else:
+                    question, is_correct = by_text.get(answer.get('question'), answer), answer.get('is_correct')
+                self.record_answer(game.get('user_id'), category, question, is_correct)
+                replayed += 1
+        self.save(replace=True)
+        return replayed
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+def get_engine():
+    """The process-wide adaptive engine."""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = AdaptiveEngine()
+    return _engine
+
+
+if __name__ == "__main__":
+    import sys
+
+    # python adaptive.py rebuild: recompute all ratings from the quiz history
+    if len(sys.argv) >= 2 and sys.argv[1] == "rebuild":
+        engine = get_engine()
+        print(f"Replayed {engine.rebuild_from_history()} answers into '{engine.file_path}'.")
+    else:
+        print("Usage: python adaptive.py rebuild")
@@ -1,6 +1,12 @@
-import json
+import copy
 import os
 import sys
+import metrics
+import storage
+import quiz_app
+import question_ids
+import bulk_io
+import search_index
 
 # Dynamically resolves the base path for file operations
 def get_base_path():
@@ -14,34 +20,45 @@ def get_file_path(filename):
     return os.path.join(get_base_path(), filename)
 
 
+@metrics.timed("af.load_json_file")
 def load_json_file(filename):
-    """Load JSON data from a file."""
-    
+    """Load the question bank through the configured storage backend."""
     file_path = get_file_path(filename)
-    try:
-        with open(file_path, 'r', encoding='utf-8') as file:
-            data = json.load(file)
-            if not data:  # Check if the file is empty
-                print("The file is empty.")
-                return {"categories": []}
-            return data
-    except FileNotFoundError:
-        print("File not found. A new file will be created.")
-        return {"categories": []}  # Return an empty structure if the file doesn't exist
-    except json.JSONDecodeError:
-        print("The file contains invalid JSON. A new structure will be created.")
-        return {"categories": []}  # Return an empty structure if JSON is invalid
+    data = storage.get_storage().load_bank(file_path)
+    if not data.get("categories"):
+        print("The question bank is empty. A new structure will be created.")
+        return {"categories": []}
+    return data
 
+@metrics.timed("af.save_json_file")
 def save_json_file(filename, data):
-    """Save data to a JSON file."""
+    """Save the question bank through the configured storage backend."""
     file_path = get_file_path(filename)
-    with open(file_path, 'w', encoding='utf-8') as file:
-        json.dump(data, file, indent=2, ensure_ascii=False)
+    question_ids.ensure_uids(data)  # every saved question gets its stable id
+    storage.get_storage().save_bank(file_path, data)
+    quiz_app.bank_cache.invalidate()  # the quiz pages must see the edit right away
+
+def load_categories(filename):
+    """Category summaries (id, name, count), without the questions."""
+    return storage.get_storage().load_categories(get_file_path(filename))
+
+def load_category(filename, category_id):
+    """A copy of one category to edit and pass to save_category(), or None."""
+    category = storage.get_storage().load_category(get_file_path(filename), category_id)
+    if category is None:
+        return None
+    return dict(category, questions=[q if q.get("uid") else copy.deepcopy(q) for q in category.get("questions", [])])
+
+@metrics.timed("af.save_category")
+def save_category(filename, category):
+    """Save one added or edited category; a sharded bank only rewrites that category's file."""
+    question_ids.ensure_uids({"categories": [category]})
+    storage.get_storage().save_category(get_file_path(filename), category)
+    quiz_app.bank_cache.invalidate(filename, category["id"])  # the other categories stay cached
 
 def add_category(filename):
     """Add a new category to the quiz."""
-    file_path = get_file_path(filename)
-    data = load_json_file(file_path)
+    categories = load_categories(filename)
 
     # Ask for the category name
     while True:
@@ -51,31 +68,43 @@ def add_category(filename):
         print("Error: Category name cannot be empty.")
 
     # Check if the category already exists
-    category = next((cat for cat in data["categories"] if cat["name"].lower() == category_name.lower()), None)
+    category = next((cat for cat in categories if cat["name"].lower() == category_name.lower()), None)
 
     if category:
         print(f"Category '{category_name}' already exists.")
         return
 
     # Create a new category
-    new_category_id = 1 if not data["categories"] else data["categories"][-1]["id"] + 1
+    new_category_id = 1 if not categories else categories[-1]["id"] + 1
     new_category = {
         "id": new_category_id,
         "name": category_name,
         "questions": []
     }
-    data["categories"].append(new_category)
-    save_json_file(file_path, data)
+    save_category(filename, new_category)
     print(f"Category '{category_name}' with ID {new_category_id} has been added successfully!")
 
+def similar_questions(filename, question):
+    """Likely duplicates of `question` in the bank, or [] when numpy is not installed."""
+    try:
+        import dedup  # needs numpy
+    except ImportError:
+        return []
+    return dedup.find_similar(question, filename)
+
+def remember_question(filename, category, question):
+    """Let the duplicate check see a question that is not saved yet."""
+    try:
+        import dedup
+    except ImportError:
+        return
+    dedup.get_duplicate_index(filename).add(category, question)
+
 def add_question(filename):
     """Add a new question to an existing category."""
-    file_path = get_file_path(filename)
-    data = load_json_file(file_path)
-
     # Show existing categories
     print("Existing Categories:")
-    for category in data["categories"]:
+    for category in load_categories(filename):
         print(f"{category['id']}. {category['name']}")
 
     # Ask for category ID
@@ -86,8 +115,8 @@ def add_question(filename):
         except ValueError:
             print("Error: Invalid input. Please enter a valid number.")
 
-    # Find the selected category
-    category = next((cat for cat in data["categories"] if cat["id"] == category_id), None)
+    # Load only the selected category
+    category = load_category(filename, category_id)
     if not category:
         print("Category not found.")
         return
@@ -114,14 +143,27 @@ def add_question(filename):
                 break
             print("Invalid input. Please enter one of: a, b, c, or d.")
 
-        # Add the question to the category
-        question_id = len(category["questions"]) + 1
-        category["questions"].append({
-            "id": question_id,
+        new_question = {
+            "id": question_ids.next_question_id(category),
+            "uid": question_ids.new_uid(),
             "question": question_text,
             "options": options,
             "correct_answer": correct_answer
-        })
+        }
+
+        # Warn about likely duplicates already in the bank (or added earlier in this session)
+        duplicates = similar_questions(filename, new_question)
+        add_it = True
+        if duplicates:
+            print("Warning: this question looks like:")
+            for hit in duplicates[:5]:
+                print(f"  [{hit['category']}] Q{hit['id']}: {hit['question']} ({hit['similarity']:.0%} similar)")
+            add_it = input("Add it anyway? (yes/no): ").strip().lower() == "yes"
+
+        # Add the question to the category
+        if add_it:
+            category["questions"].append(new_question)
+            remember_question(filename, category, new_question)
 
         while True:
             add_more = input("Do you want to add another question? (yes/no): ").strip().lower()
@@ -132,8 +174,8 @@ def add_question(filename):
         if add_more == "no":
             break
 
-    # Save the updated data to the file
-    save_json_file(file_path, data)
+    # Save the updated category
+    save_category(filename, category)
     print(f"Questions have been added to category '{category['name']}' successfully!")
 
 def delete_category(filename):
@@ -163,13 +205,10 @@ def delete_category(filename):
         print("Category not found.")
 
 def delete_question(filename):
-    file_path = get_file_path(filename)
     """Delete a question from a category."""
-    data = load_json_file(file_path)
-
     # Show categories
     print("Categories:")
-    for category in data["categories"]:
+    for category in load_categories(filename):
         print(f"{category['id']}. {category['name']}")
 
     # Ask for category ID
@@ -180,15 +219,25 @@ def delete_question(filename):
         except ValueError:
             print("Error: Invalid input. Please enter a valid number.")
 
-    category = next((cat for cat in data["categories"] if cat["id"] == category_id), None)
+    category = load_category(filename, category_id)
     if not category:
         print("Category not found.")
         return
 
-    # Show questions in the selected category
-    print("Questions:")
-    for question in category["questions"]:
-        print(f"{question['id']}. {question['question']}")
+    # Show questions in the selected category, narrowed down by a search if one is given
+    query = input("Search the questions (leave empty to list all): ").strip()
+    if query:
+        hits = search_index.search(query, filename, category_id=category_id)
+        if not hits:
+            print("No matching questions.")
+            return
+        print("Matching questions:")
+        for hit in hits:
+            print(f"{hit['id']}. {hit['question']}")
+    else:
+        print("Questions:")
+        for question in category["questions"]:
+            print(f"{question['id']}. {question['question']}")
 
     # Ask for question ID to delete
     while True:
@@ -202,6 +251,38 @@ def delete_question(filename):
     if question:
         category["questions"].remove(question)
         print("Question deleted successfully.")
-        save_json_file(file_path, data)
+        save_category(filename, category)
     else:
         print("Question not found.")
+
+def import_questions(filename):
+    """Add the questions of a CSV or JSONL file to the bank in one save."""
+    path = input("Enter the path of the CSV/JSONL file to import: ").strip()
+    if not os.path.exists(path):
+        print("File not found.")
+        return
+
+    report = bulk_io.import_file(path, bank_file=filename, dry_run=True)
+    report.print()
+    if not report.added:
+        print("Nothing to import.")
+        return
+    if report.error_count:
+        choice = input("Import the valid rows and skip the invalid ones? (yes/no): ").strip().lower()
+        if choice != "yes":
+            print("Import cancelled.")
+            return
+    if not report.save():
+        # The bank was edited while we were asking: apply the file to the current bank
+        report = bulk_io.import_file(path, bank_file=filename, allow_errors=True)
+    print(report.summary())
+
+def export_questions(filename):
+    """Write the bank, or one category of it, to a CSV or JSONL file."""
+    path = input("Enter the path of the file to create (.csv or .jsonl): ").strip()
+    if not path:
+        print("Error: Path cannot be empty.")
+        return
+    category_name = input("Category to export (leave empty for all): ").strip() or None
+    count = bulk_io.export_file(path, category_name=category_name)
+    print(f"{count} questions exported to '{path}'.")
@@ -0,0 +1,266 @@
+import threading
+
+import numpy as np
+
+import question_ids
+import quiz_app as qa
+import storage
+
+# Question difficulty and user performance analytics over the quiz history.
+# Games are streamed from the history store into columnar NumPy arrays (one row
+# per answered question) and every statistic is computed with vectorized
+# bincounts. Only games stored since the last refresh are parsed again.
+
+OPTIONS = ["a", "b", "c", "d"]
+_OPTION_CODES = {option: code for code, option in enumerate(OPTIONS)}
+CHUNK_ROWS = 200_000
+DISCRIMINATION_GROUP = 0.27  # classic upper/lower 27% split
+
+
+def _parse_score(score):
+    """'7/10' -> (7, 10)"""
+    try:
+        correct, total = str(score).split("/")
+        return int(correct), int(total)
+    except ValueError:
+        return 0, 0
+
+
+class _Interner:
+    """Maps labels (usernames, categories, questions) to dense integer codes."""
+
+    def __init__(self):
+        self.codes = {}
+        self.labels = []
+
+    def code(self, label):
+        code = self.codes.get(label)
+        if code is None:
+            code = self.codes[label] = len(self.labels)
+            self.labels.append(label)
+        return code
+
+    def __len__(self):
+        return len(self.labels)
+
+
+class HistoryAnalytics:
+    """Columnar, incrementally updated statistics over the quiz history."""
+
+    def __init__(self, filename='history.json'):
+        self.filename = filename
+        self._lock = threading.Lock()
+        self._cursor = None
+        self.users = _Interner()
+        self.categories = _Interner()
+        self.questions = _Interner()
+        self.question_category = []  # question code -> category code of its first appearance
+        # Answer rows
+        self.row_game = np.empty(0, dtype=np.int64)
+        self.row_question = np.empty(0, dtype=np.int32)
+        self.row_answer = np.empty(0, dtype=np.int8)   # 0-3 for a-d, -1 for anything else
+        self.row_correct = np.empty(0, dtype=bool)
+        # Game rows
+        self.game_user = np.empty(0, dtype=np.int32)
+        self.game_category = np.empty(0, dtype=np.int32)
+        self.game_correct = np.empty(0, dtype=np.int32)
+        self.game_total = np.empty(0, dtype=np.int32)
+
+    # Ingestion
+    def refresh(self):
+        """Ingest the games stored since the last refresh. Returns how many were added."""
+        with self._lock:
+            backend = storage.get_storage()
+            path = qa.get_file_path(self.filename)
+            first_game = len(self.game_user)
+            row_chunks = []
+            games = ([], [], [], [])
+            rows = ([], [], [], [])
+            # Hot loop over every answer: bind everything it touches to locals
+            question_codes = self.questions.codes
+            option_codes = _OPTION_CODES
+            game_index = first_game
+            for game, cursor in backend.history_since(path, self._cursor):
+                self._cursor = cursor
+                category = self.categories.code(game.get("category"))
+                answers = game.get("questions") or []
+                add_game, add_question, add_answer, add_correct = (column.append for column in rows)
+                correct_count = 0
+                for answer in answers:
+                    if answer.__class__ is list:  # compact [uid, user_answer, correct, hash] record
+                        key, user_answer, is_correct = answer[0], answer[1], bool(answer[2])
+                    else:
+                        key = answer.get("question", "")
+                        user_answer, is_correct = answer.get("user_answer"), bool(answer.get("is_correct"))
+                    question = question_codes.get(key)
+                    if question is None:
+                        question = self.questions.code(key)
+                        self.question_category.append(category)
+                    correct_count += is_correct
+                    add_game(game_index)
+                    add_question(question)
+                    add_answer(option_codes.get(user_answer, -1))
+                    add_correct(is_correct)
+                if not answers:
+                    correct_count, total = _parse_score(game.get("score"))
+                else:
+                    total = len(answers)
+                games[0].append(self.users.code(game.get("user_id")))
+                games[1].append(category)
+                games[2].append(correct_count)
+                games[3].append(total)
+                game_index += 1
+                if len(rows[0]) >= CHUNK_ROWS:  # keep the Python-side buffers bounded
+                    row_chunks.append(self._row_arrays(rows))
+                    rows = ([], [], [], [])
+            row_chunks.append(self._row_arrays(rows))
+            new_games = self._game_arrays(games)
+
+            self.row_game = np.concatenate([self.row_game] + [c[0] for c in row_chunks])
+            self.row_question = np.concatenate([self.row_question] + [c[1] for c in row_chunks])
+            self.row_answer = np.concatenate([self.row_answer] + [c[2] for c in row_chunks])
+            self.row_correct = np.concatenate([self.row_correct] + [c[3] for c in row_chunks])
+            self.game_user = np.concatenate([self.game_user, new_games[0]])
+            self.game_category = np.concatenate([self.game_category, new_games[1]])
+            self.game_correct = np.concatenate([self.game_correct, new_games[2]])
+            self.game_total = np.concatenate([self.game_total, new_games[3]])
+            return game_index - first_game
+
+    def _row_arrays(self, rows):
+        return (np.array(rows[0], dtype=np.int64), np.array(rows[1], dtype=np.int32),
+                np.array(rows[2], dtype=np.int8), np.array(rows[3], dtype=bool))
+
+    def _game_arrays(self, games):
+        return tuple(np.array(column, dtype=np.int32) for column in games)
+
+    # Statistics
+    def question_stats(self):
+        """Per question: attempts, p-value (share correct), discrimination index, option shares."""
+        n = len(self.questions)
+        attempts = np.bincount(self.row_question, minlength=n)
+        correct = np.bincount(self.row_question, weights=self.row_correct, minlength=n)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            p_value = correct / attempts
+            valid = self.row_answer >= 0
+            option_counts = np.bincount(
+                self.row_question[valid].astype(np.int64) * len(OPTIONS) + self.row_answer[valid],
+                minlength=n * len(OPTIONS)
+            ).reshape(n, len(OPTIONS))
+            option_share = option_counts / attempts[:, None]
+        discrimination = self._discrimination(n)
+        resolver = question_ids.get_resolver()
+
+        stats = []
+        for code in range(n):
+            stats.append({
+                "question": resolver.text(self.questions.labels[code]),
+                "category": self.categories.labels[self.question_category[code]],
+                "attempts": int(attempts[code]),
+                "p_value": float(p_value[code]),
+                "discrimination": float(discrimination[code]),
+                **{f"picked_{option}": float(option_share[code, i]) for i, option in enumerate(OPTIONS)}
+            })
+        return stats
+
+    def _discrimination(self, n):
+        """Upper-lower index: p(correct | top 27% games) - p(correct | bottom 27% games), per category."""
+        with np.errstate(invalid="ignore", divide="ignore"):
+            fraction = self.game_correct / np.maximum(self.game_total, 1)
+        upper = np.zeros(len(fraction), dtype=bool)
+        lower = np.zeros(len(fraction), dtype=bool)
+        for category in np.unique(self.game_category):
+            in_category = self.game_category == category
+            scores = fraction[in_category]
+            low_cut, high_cut = np.quantile(scores, [DISCRIMINATION_GROUP, 1 - DISCRIMINATION_GROUP])
+            upper[in_category] = scores >= high_cut
+            lower[in_category] = scores <= low_cut
+
+        def p_correct(game_mask):
+            rows = game_mask[self.row_game]
+            attempts = np.bincount(self.row_question[rows], minlength=n)
+            correct = np.bincount(self.row_question[rows], weights=self.row_correct[rows], minlength=n)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                return correct / attempts
+
+        return p_correct(upper) - p_correct(lower)
+
+    def user_category_stats(self):
+        """Per (user, category): games played, answers, accuracy and best score."""
+        n_users, n_categories = len(self.users), len(self.categories)
+        key = self.game_user.astype(np.int64) * n_categories + self.game_category
+        size = n_users * n_categories
+        games = np.bincount(key, minlength=size)
+        answered = np.bincount(key, weights=self.game_total, minlength=size)
+        correct = np.bincount(key, weights=self.game_correct, minlength=size)
+        best = np.zeros(size)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            np.maximum.at(best, key, self.game_correct / np.maximum(self.game_total, 1))
+            accuracy = correct / answered
+
+        stats = []
+        for flat in np.flatnonzero(games):
+            user, category = divmod(int(flat), n_categories)
+            stats.append({
+                "user_id": self.users.labels[user],
+                "category": self.categories.labels[category],
+                "games": int(games[flat]),
+                "answers": int(answered[flat]),
+                "accuracy": float(accuracy[flat]),
+                "best_score": float(best[flat])
+            })
+        return stats
+
+    def summary(self):
+        return {
+            "games": int(len(self.game_user)),
+            "answers": int(len(self.row_question)),
+            "users": len(self.users),
+            "categories": len(self.categories),
+            "questions": len(self.questions)
+        }
+
+
+_analytics = {}
+_analytics_lock = threading.Lock()
+
+def get_analytics(filename='history.json'):
+    """Shared, refreshed analytics for a history file."""
+    with _analytics_lock:
+        analytics = _analytics.get(filename)
+        if analytics is None:
+            analytics = _analytics[filename] = HistoryAnalytics(filename)
+    analytics.refresh()
+    return analytics
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Question difficulty and user performance report")
+    parser.add_argument("--history", default="history.json")
+    parser.add_argument("--category", default=None, help="only show this category")
+    parser.add_argument("--top", type=int, default=10, help="rows per table")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    report = get_analytics(args.history)
+    questions = [q for q in report.question_stats() if args.category in (None, q["category"])]
+    users = [u for u in report.user_category_stats() if args.category in (None, u["category"])]
+    elapsed = time.perf_counter() - started
+
+    summary = report.summary()
+    print(f"{summary['games']} games, {summary['answers']} answers, {summary['questions']} questions "
+          f"({elapsed:.2f}s)")
+
+    print("\nHardest questions (lowest p-value):")
+    print(f"{'p':>5} {'D':>6} {'n':>6}  {'a':>4} {'b':>4} {'c':>4} {'d':>4}  question")
+    for q in sorted(questions, key=lambda q: q["p_value"])[:args.top]:
+        print(f"{q['p_value']:5.2f} {q['discrimination']:6.2f} {q['attempts']:6d}  "
+              + " ".join(f"{q['picked_' + option]:4.2f}" for option in OPTIONS)
+              + f"  [{q['category']}] {str(q['question'])[:60]}")
+
+    print("\nUser accuracy per category:")
+    for u in sorted(users, key=lambda u: u["accuracy"], reverse=True)[:args.top]:
+        print(f"user {u['user_id']!s:>6} {u['category']:<12} games {u['games']:4d}  "
+              f"accuracy {u['accuracy']:5.1%}  best {u['best_score']:5.1%}")
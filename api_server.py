@@ -0,0 +1,417 @@
+import asyncio
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import time
+from urllib.parse import parse_qs, urlsplit
+
+import adaptive
+import metrics
+import quiz_app as qa
+import quiz_session
+import session_store
+import user_functions as uf
+
+# JSON HTTP API for quiz clients, on the stdlib asyncio event loop.
+#   GET  /health                      readiness probe
+#   POST /login                       {"username", "password"} -> {"token", "user_id"}
+#   GET  /categories                  category ids, names and sizes
+#   POST /attempts                    {"category_id", "num_questions", "adaptive"} -> first question
+#   GET  /attempts/<id>               state of an attempt
+#   POST /attempts/<id>/answer        {"answer": "a"} -> result and next question
+#   GET  /history?page=&category=     newest-first page of the user's games
+#   GET  /metrics                     Prometheus text (only with QCM_METRICS=1)
+# Every request but /health, /login and /metrics needs "Authorization: Bearer <token>".
+# /metrics is left open for scrapers, which can't log in: it only exists while
+# metrics are switched on, and exposes call counts and latencies, no user data.
+# Connections are kept alive and pipelined requests are answered in order.
+# Banks and users come from the in-memory caches, attempts live in the session
+# store (QCM_SESSIONS=sqlite lets several API workers share them) and finished
+# attempts go to the background result writer. Every call that can touch the
+# disk (session store, cache reloads, login, storing an attempt, history
+# pages) runs in the default thread pool so the loop keeps serving.
+#
+#   python api_server.py serve --port 8080
+#   python api_server.py bench --port 8080 --connections 50 --requests 20000 --username u --password p
+
+SECRET_ENV = "QCM_API_SECRET"  # set the same value on every worker so they accept each other's tokens
+TOKEN_TTL = 12 * 3600
+MAX_HEADER_BYTES = 16 * 1024
+MAX_BODY_BYTES = 64 * 1024
+STATUS = {200: "OK", 201: "Created", 400: "Bad Request", 401: "Unauthorized", 404: "Not Found",
+          405: "Method Not Allowed", 409: "Conflict", 413: "Payload Too Large", 500: "Internal Server Error"}
+
+
+class ApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def public_question(session):
+    """The current question of an attempt, without its answer."""
+    question = session.question()
+    if question is None:
+        return None
+    return {
+        "number": session.cursor + 1,
+        "of": session.length,
+        "question": question['question'],
+        "options": question.get('options', [])
+    }
+
+def attempt_state(attempt_id, session):
+    return {
+        "attempt_id": attempt_id,
+        "state": session.state,
+        "score": session.score,
+        "answered": len(session.answers),
+        "length": session.length,
+        "remaining": round(session.remaining(), 1),
+        "question": public_question(session)
+    }
+
+
+async def blocking(function, *args):
+    """Run a call that may wait on the disk in the default thread pool."""
+    return await asyncio.get_running_loop().run_in_executor(None, function, *args)
+
+
+class QuizApi:
+    """Routes of the API; login tokens are signed and attempts are kept in the session store."""
+
+    def __init__(self, users_file='users.json', history_file='history.json'):
+        self.users_file = users_file
+        self.history_file = history_file
+        self.secret = (os.environ.get(SECRET_ENV) or secrets.token_hex(32)).encode()
+        self.attempts = session_store.get_session_store()
+        self.routes = {
+            ("GET", "health"): self.health,
+            ("POST", "login"): self.login,
+            ("GET", "categories"): self.categories,
+            ("POST", "attempts"): self.start_attempt,
+            ("GET", "attempt"): self.get_attempt,
+            ("POST", "answer"): self.answer,
+            ("GET", "history"): self.history,
+            ("GET", "metrics"): self.metrics,
+        }
+
+    # Routing
+    def _route(self, method, path):
+        parts = [part for part in path.split("/") if part]
+        if len(parts) == 1:
+            name, args = parts[0], ()
+        elif len(parts) == 2 and parts[0] == "attempts":
+            name, args = "attempt", (parts[1],)
+        elif len(parts) == 3 and parts[0] == "attempts" and parts[2] == "answer":
+            name, args = "answer", (parts[1],)
+        else:
+            raise ApiError(404, "Not found")
+        handler = self.routes.get((method, name))
+        if handler is None:
+            if any(route[1] == name for route in self.routes):
+                raise ApiError(405, "Method not allowed")
+            raise ApiError(404, "Not found")
+        return handler, args
+
+    async def handle(self, method, target, headers, body):
+        """Answer one request with (status, payload)."""
+        url = urlsplit(target)
+        handler, args = self._route(method, url.path)
+        request = {
+            "query": {key: values[-1] for key, values in parse_qs(url.query).items()},
+            "headers": headers,
+            "json": self._json(body) if method == "POST" else {}
+        }
+        with metrics.timer(f"api.{handler.__name__}"):
+            return await handler(request, *args)
+
+    def _json(self, body):
+        if not body:
+            return {}
+        try:
+            data = json.loads(body)
+        except ValueError:
+            raise ApiError(400, "Body is not valid JSON")
+        if not isinstance(data, dict):
+            raise ApiError(400, "Body must be a JSON object")
+        return data
+
+    def _sign(self, payload):
+        return hmac.new(self.secret, payload.encode(), hashlib.sha256).hexdigest()[:32]
+
+    def _user(self, request):
+        token = request["headers"].get("authorization", "").removeprefix("Bearer ").strip()
+        payload, _, mac = token.rpartition(".")
+        user_id, _, issued = payload.partition(".")
+        if (not mac or not hmac.compare_digest(mac, self._sign(payload))
+                or not issued.isdigit() or int(issued) + TOKEN_TTL < time.time()):
+            raise ApiError(401, "Missing, invalid or expired token, log in first")
+        return int(user_id)
+
+    async def _attempt(self, request, attempt_id):
+        user_id = self._user(request)
+        session = await blocking(self.attempts.get, attempt_id)
+        if session is None or session.user_id != user_id:
+            raise ApiError(404, "Unknown attempt")
+        return session
+
+    # Handlers
+    async def health(self, request):
+        # Counting the SQLite sessions is a query; the memory store answers at once
+        count = len(self.attempts) if self.attempts.name == "memory" else await blocking(len, self.attempts)
+        return 200, {"status": "ok", "attempts": count}
+
+    async def metrics(self, request):
+        if not metrics.ENABLED:
+            raise ApiError(404, "Metrics are off, start the server with QCM_METRICS=1")
+        return 200, metrics.prometheus_text()
+
+    async def login(self, request):
+        username = str(request["json"].get("username", "")).strip()
+        password = str(request["json"].get("password", ""))
+        users_path = qa.get_file_path(self.users_file)
+        if not username or not await blocking(uf.login, username, password, users_path):
+            raise ApiError(401, "Invalid username or password")
+        user = await blocking(uf.get_user_store(users_path).find, username)
+        payload = f"{user['id']}.{int(time.time())}"  # user id and issue time, signed
+        token = f"{payload}.{self._sign(payload)}"
+        return 200, {"token": token, "user_id": user["id"]}
+
+    async def categories(self, request):
+        self._user(request)
+        return 200, {"categories": await blocking(qa.load_categories)}
+
+    async def start_attempt(self, request):
+        user_id = self._user(request)
+        data = request["json"]
+        num_questions = data.get("num_questions", 10)
+        if num_questions not in (10, 20, 30):
+            raise ApiError(400, "num_questions must be 10, 20 or 30")
+        category = await blocking(qa.load_category, data.get("category_id"))
+        if not category or not category.get('questions'):
+            raise ApiError(404, "Unknown or empty category")
+
+        adaptive_mode = bool(data.get("adaptive"))
+        session = quiz_session.QuizSession.start(user_id, category, num_questions, qa.SECONDS_PER_QUESTION,
+                                                 adaptive_mode)
+        if adaptive_mode:
+            session.pick_adaptive(adaptive.get_engine())
+        attempt_id = session_store.new_token()
+        await blocking(self.attempts.put, attempt_id, session)
+        return 201, attempt_state(attempt_id, session)
+
+    async def get_attempt(self, request, attempt_id):
+        session = await self._attempt(request, attempt_id)
+        await self._finish_if_over(attempt_id, session)
+        return 200, attempt_state(attempt_id, session)
+
+    async def answer(self, request, attempt_id):
+        session = await self._attempt(request, attempt_id)
+        question = session.question()
+        choice = str(request["json"].get("answer", "")).strip().lower()
+        if choice not in ("a", "b", "c", "d"):
+            raise ApiError(400, "answer must be one of a, b, c, d")
+
+        is_correct = session.answer(choice)  # None once the deadline has passed
+        if is_correct is None:
+            await self._finish_if_over(attempt_id, session)
+            raise ApiError(409, f"The attempt is {session.state}")
+        if session.adaptive:
+            engine = adaptive.get_engine()
+            engine.record_answer(session.user_id, session.category, question, is_correct)
+            session.pick_adaptive(engine)
+        session.next()
+        if not await self._finish_if_over(attempt_id, session):
+            await blocking(self.attempts.put, attempt_id, session)
+        return 200, dict(attempt_state(attempt_id, session), correct=is_correct,
+                         correct_answer=question['correct_answer'])
+
+    async def history(self, request):
+        user_id = self._user(request)
+        query = request["query"]
+        try:
+            page = max(int(query.get("page", 1)), 1)
+            page_size = min(max(int(query.get("page_size", 10)), 1), 100)
+        except ValueError:
+            raise ApiError(400, "page and page_size must be numbers")
+        games, total = await blocking(qa.load_history_page, user_id, self.history_file, page, page_size,
+                                      query.get("category"))
+        return 200, {"games": games, "total": total, "page": page, "page_size": page_size}
+
+    async def _finish_if_over(self, attempt_id, session):
+        """Queue a finished or expired attempt for storage, once. Returns whether it was over."""
+        if session.check_deadline() == quiz_session.ACTIVE:
+            return False
+        await blocking(session_store.finish, attempt_id, session, self.history_file, True)
+        return True
+
+
+# HTTP/1.1 plumbing
+async def read_request(reader):
+    """One request from the stream as (method, target, headers, body, keep_alive), or None at EOF."""
+    try:
+        head = await reader.readuntil(b"\r\n\r\n")
+    except asyncio.IncompleteReadError:
+        return None
+    except asyncio.LimitOverrunError:
+        raise ApiError(413, "Headers too large")
+    lines = head.decode("latin-1").split("\r\n")
+    try:
+        method, target, version = lines[0].split(" ", 2)
+    except ValueError:
+        raise ApiError(400, "Malformed request line")
+    headers = {}
+    for line in lines[1:]:
+        if ":" in line:
+            name, value = line.split(":", 1)
+            headers[name.strip().lower()] = value.strip()
+    if "transfer-encoding" in headers:
+        raise ApiError(400, "Chunked bodies are not supported, send Content-Length")
+    length = headers.get("content-length", "0") or "0"
+    if not (length.isascii() and length.isdigit()):
+        raise ApiError(400, "Invalid Content-Length")
+    length = int(length)
+    if length > MAX_BODY_BYTES:
+        raise ApiError(413, "Body too large")
+    body = await reader.readexactly(length) if length else b""
+    connection = headers.get("connection", "").lower()
+    keep_alive = connection != "close" if version == "HTTP/1.1" else connection == "keep-alive"
+    return method.upper(), target, headers, body, keep_alive
+
+def encode_response(status, payload, keep_alive):
+    if isinstance(payload, str):  # plain text, e.g. /metrics
+        body, content_type = payload.encode("utf-8"), "text/plain; version=0.0.4"
+    else:
+        body, content_type = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8"), "application/json"
+    head = (f"HTTP/1.1 {status} {STATUS.get(status, '')}\r\n"
+            f"Content-Type: {content_type}; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+    return head.encode("latin-1") + body
+
+async def serve_connection(api, reader, writer):
+    try:
+        while True:
+            try:
+                request = await read_request(reader)
+                if request is None:
+                    break
+                method, target, headers, body, keep_alive = request
+                try:
+                    status, payload = await api.handle(method, target, headers, body)
+                except ApiError as e:
+                    status, payload = e.status, {"error": str(e)}
+                except Exception as e:
+                    print(f"Error: {method} {target} failed: {e}")
+                    status, payload = 500, {"error": "Internal server error"}
+            except ApiError as e:  # the request itself could not be read
+                status, payload, keep_alive = e.status, {"error": str(e)}, False
+            writer.write(encode_response(status, payload, keep_alive))
+            await writer.drain()  # returns at once unless the client stopped reading
+            if not keep_alive:
+                break
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+async def serve(host="127.0.0.1", port=8080, api=None):
+    api = api or QuizApi()
+    # Warm the caches before the first request instead of during it
+    qa.load_categories()
+    uf.get_user_store(qa.get_file_path(api.users_file))
+    server = await asyncio.start_server(lambda r, w: serve_connection(api, r, w), host, port,
+                                        limit=MAX_HEADER_BYTES, backlog=1024)
+    print(f"Quiz API listening on http://{host}:{port}")
+    async with server:
+        await server.serve_forever()
+
+
+# Local benchmark client
+async def bench(host, port, connections, requests, pipeline, path, username=None, password=None):
+    """Hammer `path` over keep-alive connections, `pipeline` requests in flight per connection.
+
+    Routes other than /health are called as `username`, an existing account of the server.
+    """
+    request = f"GET {path} HTTP/1.1\r\nHost: {host}\r\n\r\n".encode("latin-1")
+    if path != "/health":
+        reader, writer = await asyncio.open_connection(host, port)
+        body = json.dumps({"username": username, "password": password}).encode()
+        writer.write(f"POST /login HTTP/1.1\r\nHost: {host}\r\nContent-Length: {len(body)}\r\n\r\n".encode() + body)
+        await writer.drain()
+        status, payload = await _read_response(reader)
+        writer.close()
+        if status != 200:
+            raise RuntimeError(f"Login as '{username}' failed: {payload.get('error')}")
+        request = (f"GET {path} HTTP/1.1\r\nHost: {host}\r\nAuthorization: Bearer {payload['token']}\r\n\r\n"
+                   .encode("latin-1"))
+    per_connection = requests // connections
+    latencies = []
+
+    async def client():
+        reader, writer = await asyncio.open_connection(host, port)
+        sent = 0
+        while sent < per_connection:
+            batch = min(pipeline, per_connection - sent)
+            started = time.perf_counter()
+            writer.write(request * batch)
+            await writer.drain()
+            for _ in range(batch):
+                status, _ = await _read_response(reader)
+                if status != 200:
+                    raise RuntimeError(f"HTTP {status}")
+            latencies.append((time.perf_counter() - started) / batch)
+            sent += batch
+        writer.close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(connections)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    total = per_connection * connections
+    print(f"{total} requests to {path} over {connections} connections (pipeline {pipeline}): "
+          f"{total / elapsed:.0f} req/s, p50 {1000 * latencies[len(latencies) // 2]:.2f} ms, "
+          f"p99 {1000 * latencies[int(len(latencies) * 0.99)]:.2f} ms")
+
+async def _read_response(reader):
+    head = await reader.readuntil(b"\r\n\r\n")
+    lines = head.decode("latin-1").split("\r\n")
+    status = int(lines[0].split(" ")[1])
+    length = next(int(line.split(":", 1)[1]) for line in lines if line.lower().startswith("content-length"))
+    return status, json.loads(await reader.readexactly(length))
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Quiz JSON API")
+    commands = parser.add_subparsers(dest="command", required=True)
+    server_args = commands.add_parser("serve", help="run the API server")
+    server_args.add_argument("--host", default="127.0.0.1")
+    server_args.add_argument("--port", type=int, default=8080)
+    bench_args = commands.add_parser("bench", help="load a running server")
+    bench_args.add_argument("--host", default="127.0.0.1")
+    bench_args.add_argument("--port", type=int, default=8080)
+    bench_args.add_argument("--connections", type=int, default=50)
+    bench_args.add_argument("--requests", type=int, default=20000)
+    bench_args.add_argument("--pipeline", type=int, default=1, help="requests in flight per connection")
+    bench_args.add_argument("--path", default="/categories")
+    bench_args.add_argument("--username", help="existing account to log in with (all routes but /health)")
+    bench_args.add_argument("--password")
+    args = parser.parse_args()
+
+    if args.command == "bench" and args.path != "/health" and not (args.username and args.password):
+        print(f"Error: Benchmarking {args.path} needs --username and --password of an existing account.")
+        raise SystemExit(1)
+    try:
+        if args.command == "serve":
+            asyncio.run(serve(args.host, args.port))
+        else:
+            asyncio.run(bench(args.host, args.port, args.connections, args.requests, args.pipeline, args.path,
+                              args.username, args.password))
+    except (KeyboardInterrupt, RuntimeError) as e:
+        if isinstance(e, RuntimeError):
+            print(f"Error: {e}")
@@ -0,0 +1,437 @@
+import hashlib
+import json
+import mmap
+import os
+import struct
+import threading
+from collections.abc import Mapping, Sequence
+
+import bank_snapshot
+
+# Read-only, memory-mapped question bank for very large banks.
+#   qcm.qbm = header
+#           + category records  (id, name, first question, count)
+#           + question records  (fixed width: id, option ids, correct answer,
+#                                content hash, string heap offsets)
+#           + uid table         sorted, for lookups by uid
+#           + hash table        sorted, for lookups by content hash
+#           + string heap       UTF-8, each distinct string stored once
+# The file is opened with mmap, so its pages live in the OS page cache and are
+# shared by every worker instead of each one holding its own parsed copy. A
+# category is a small dict whose "questions" decode one question at a time
+# when indexed, so drawing 10 questions only reads those 10 records. Like
+# qcm.bank, the file records the qcm.json it was built from and is ignored
+# once that file changes (admin saves rebuild it).
+#
+#   python bank_mmap.py build [qcm.json]
+#   python bank_mmap.py bench --questions 300000
+
+MAGIC = b"QCMMMAP1"
+# magic, source size, source mtime_ns, source sha256, categories, questions, uids,
+# then the offsets of the category, question, uid and hash tables and of the heap
+HEADER = struct.Struct("<8sQq32sIII4xQQQQQ")
+CATEGORY = struct.Struct("<qIIII")  # id, name offset, name length, first question, question count
+# id, flags, correct answer, 4 option ids, content hash, uid, text, 4 option texts (offset, length), extra JSON
+QUESTION = struct.Struct("<qBc4s12sIIII4I4III")
+UID_ENTRY = struct.Struct("<III")   # uid offset, uid length, question index
+HASH_ENTRY = struct.Struct("<12sI")  # content hash, question index
+RAW = 1  # flag: the question doesn't fit the record, its whole JSON is in "extra"
+_FIELDS = {"id", "question", "options", "correct_answer", "uid"}
+
+
+def mapped_path_for(json_path):
+    """qcm.json -> qcm.qbm"""
+    return os.path.splitext(json_path)[0] + ".qbm"
+
+
+class _Heap:
+    def __init__(self):
+        self.chunks = []
+        self.size = 0
+        self.offsets = {}
+
+    def add(self, text):
+        """(offset, length) of `text` in the heap, storing it once."""
+        if text in self.offsets:
+            return self.offsets[text]
+        raw = text.encode("utf-8")
+        self.offsets[text] = (self.size, len(raw))
+        self.chunks.append(raw)
+        self.size += len(raw)
+        return self.offsets[text]
+
+def _is_plain(question):
+    """True when a question fits the fixed-width record (4 single-letter options, known keys)."""
+    options = question.get("options", [])
+    return (len(options) == 4
+            and all(isinstance(opt, dict) and set(opt) == {"id", "text"} and len(str(opt["id"]).encode()) == 1
+                    and isinstance(opt["text"], str) for opt in options)
+            and len(str(question.get("correct_answer", "")).encode()) <= 1
+            and isinstance(question.get("question", ""), str) and isinstance(question.get("id", 0), int))
+
+def build(json_path, mapped_path=None):
+    """Compile `json_path` into the memory-mapped format and return the file path."""
+    import question_ids  # late: question_ids imports the storage layer, which imports this module
+
+    mapped_path = mapped_path or mapped_path_for(json_path)
+    with open(json_path, 'rb') as file:
+        raw = file.read()
+    stat = os.stat(json_path)
+    data = json.loads(raw.decode("utf-8"))
+
+    heap = _Heap()
+    categories = []
+    records = []
+    uids = []
+    hashes = []
+    for category in data.get("categories", []):
+        questions = category.get("questions", [])
+        categories.append(CATEGORY.pack(category["id"], *heap.add(category.get("name", "")), len(records), len(questions)))
+        for question in questions:
+            index = len(records)
+            digest = question_ids.content_hash(question).encode("ascii")
+            uid = question.get("uid") or ""
+            uid_ref = heap.add(uid) if uid else (0, 0)
+            if uid:
+                uids.append((uid.encode("utf-8"), uid_ref, index))
+            hashes.append((digest, index))
+            if _is_plain(question):
+                options = question["options"]
+                extra = {key: value for key, value in question.items() if key not in _FIELDS}
+                texts = [heap.add(opt["text"]) for opt in options]
+                records.append(QUESTION.pack(
+                    question.get("id", 0), 0, str(question.get("correct_answer", "")).encode() or b"\0",
+                    "".join(opt["id"] for opt in options).encode(), digest, *uid_ref,
+                    *heap.add(question.get("question", "")),
+                    *[offset for offset, _ in texts], *[length for _, length in texts],
+                    *(heap.add(json.dumps(extra, ensure_ascii=False)) if extra else (0, 0))
+                ))
+            else:
+                encoded = heap.add(json.dumps(question, ensure_ascii=False))
+                records.append(QUESTION.pack(question.get("id", 0) if isinstance(question.get("id"), int) else 0,
+                                             RAW, b"\0", b"\0" * 4, digest, *uid_ref, 0, 0,
+                                             *[0] * 8, *encoded))
+    uids.sort()
+    hashes.sort()
+
+    category_offset = HEADER.size
+    question_offset = category_offset + len(categories) * CATEGORY.size
+    uid_offset = question_offset + len(records) * QUESTION.size
+    hash_offset = uid_offset + len(uids) * UID_ENTRY.size
+    heap_offset = hash_offset + len(hashes) * HASH_ENTRY.size
+    header = HEADER.pack(MAGIC, stat.st_size, stat.st_mtime_ns, hashlib.sha256(raw).digest(), len(categories),
+                         len(records), len(uids), category_offset, question_offset, uid_offset, hash_offset,
+                         heap_offset)
+
+    tmp_path = mapped_path + ".tmp"
+    with open(tmp_path, 'wb') as file:
+        file.write(header)
+        file.write(b"".join(categories))
+        file.write(b"".join(records))
+        file.write(b"".join(UID_ENTRY.pack(*ref, index) for _, ref, index in uids))
+        file.write(b"".join(HASH_ENTRY.pack(digest, index) for digest, index in hashes))
+        file.write(b"".join(heap.chunks))
+    os.replace(tmp_path, mapped_path)
+    return mapped_path
+
+
+class LazyQuestions(Sequence):
+    """The questions of one category, decoded from the mapped file when accessed."""
+
+    __slots__ = ("bank", "first", "count", "_keys")
+
+    def __init__(self, bank, first, count):
+        self.bank = bank
+        self.first = first
+        self.count = count
+        self._keys = None
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self.count))]
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError("question index out of range")
+        return self.bank.question(self.first + index)
+
+    def by_key(self):
+        """Mapping of question key (uid, else text) to question, decoding only what is looked up.
+
+        Reads the uid of every question of the category once; quiz sessions
+        index their drawn positions directly and only fall back to this.
+        """
+        if self._keys is None:
+            # Only the uid strings are read to build the map, not the questions
+            self._keys = _QuestionsByKey(self, {self.bank.question_key(self.first + i): i for i in range(self.count)})
+        return self._keys
+
+
+class _QuestionsByKey(Mapping):
+    __slots__ = ("questions", "positions")
+
+    def __init__(self, questions, positions):
+        self.questions = questions
+        self.positions = positions
+
+    def __getitem__(self, key):
+        return self.questions[self.positions[key]]
+
+    def __contains__(self, key):
+        return key in self.positions
+
+    def __iter__(self):
+        return iter(self.positions)
+
+    def __len__(self):
+        return len(self.positions)
+
+
+class MappedBank:
+    """A compiled bank opened with mmap."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as file:
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        fields = HEADER.unpack_from(self._map, 0)
+        if fields[0] != MAGIC:
+            raise ValueError(f"'{path}' is not a compiled question bank")
+        (_, self.source_size, self.source_mtime_ns, self.source_sha256, self.category_count, self.question_count,
+         self.uid_count, self._categories_at, self._questions_at, self._uids_at, self._hashes_at,
+         self._heap_at) = fields
+
+    def _text(self, offset, length):
+        start = self._heap_at + offset
+        return self._map[start:start + length].decode("utf-8")
+
+    def _record(self, index):
+        return QUESTION.unpack_from(self._map, self._questions_at + index * QUESTION.size)
+
+    # Categories
+    def _category_record(self, position):
+        return CATEGORY.unpack_from(self._map, self._categories_at + position * CATEGORY.size)
+
+    def categories(self):
+        """Category summaries: id, name and question count."""
+        summaries = []
+        for position in range(self.category_count):
+            category_id, name_offset, name_length, _, count = self._category_record(position)
+            summaries.append({"id": category_id, "name": self._text(name_offset, name_length), "count": count})
+        return summaries
+
+    def category(self, category_id):
+        """One category with lazily decoded questions, or None."""
+        for position in range(self.category_count):
+            record = self._category_record(position)
+            if record[0] == category_id:
+                return {"id": category_id, "name": self._text(record[1], record[2]),
+                        "questions": LazyQuestions(self, record[3], record[4])}
+        return None
+
+    # Questions
+    def question(self, index):
+        """Decode question `index` (bank order) into the usual dict."""
+        (question_id, flags, correct, option_ids, _, uid_offset, uid_length, text_offset, text_length,
+         *option_fields, extra_offset, extra_length) = self._record(index)
+        if flags & RAW:
+            return json.loads(self._text(extra_offset, extra_length))
+        option_ids = option_ids.decode()
+        question = {
+            "id": question_id,
+            "question": self._text(text_offset, text_length),
+            "options": [{"id": option_ids[i], "text": self._text(option_fields[i], option_fields[4 + i])}
+                        for i in range(4)],
+            "correct_answer": "" if correct == b"\0" else correct.decode()
+        }
+        if uid_length:
+            question["uid"] = self._text(uid_offset, uid_length)
+        if extra_length:
+            question.update(json.loads(self._text(extra_offset, extra_length)))
+        return question
+
+    def question_key(self, index):
+        """What adaptive.question_key() would return, reading only the uid when there is one."""
+        record = self._record(index)
+        if record[6]:  # uid length
+            return self._text(record[5], record[6])
+        return self.question(index).get("question")
+
+    def content_hash(self, index):
+        return self._record(index)[4].decode("ascii")
+
+    def find_uid(self, uid):
+        """Index of the question with this uid (binary search in the uid table), or None."""
+        target = uid.encode("utf-8")
+        low, high = 0, self.uid_count
+        while low < high:
+            middle = (low + high) // 2
+            offset, length, index = UID_ENTRY.unpack_from(self._map, self._uids_at + middle * UID_ENTRY.size)
+            start = self._heap_at + offset
+            found = self._map[start:start + length]
+            if found == target:
+                return index
+            if found < target:
+                low = middle + 1
+            else:
+                high = middle
+        return None
+
+    def find_hash(self, digest):
+        """Index of a question with this content hash, or None."""
+        target = digest.encode("ascii")
+        low, high = 0, self.question_count
+        while low < high:
+            middle = (low + high) // 2
+            found, index = HASH_ENTRY.unpack_from(self._map, self._hashes_at + middle * HASH_ENTRY.size)
+            if found < target:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.question_count:
+            found, index = HASH_ENTRY.unpack_from(self._map, self._hashes_at + low * HASH_ENTRY.size)
+            if found == target:
+                return index
+        return None
+
+    def __len__(self):
+        return self.question_count
+
+    @property
+    def closed(self):
+        return self._map.closed
+
+    def close(self):
+        self._map.close()
+
+
+_banks = {}  # json path -> (json stat signature, MappedBank or None)
+_banks_lock = threading.Lock()
+
+def open_fresh(json_path):
+    """The mapped bank built from `json_path` in its current state, or None (missing or stale)."""
+    try:
+        stat = os.stat(json_path)
+        signature = (stat.st_size, stat.st_mtime_ns)
+    except FileNotFoundError:
+        stat = signature = None  # a build may ship the compiled bank alone
+    mapped_path = mapped_path_for(json_path)
+    try:
+        mapped_stat = os.stat(mapped_path)
+        key = (signature, mapped_stat.st_mtime_ns, mapped_stat.st_ino)
+    except FileNotFoundError:
+        key = None
+    cached = _banks.get(json_path)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+    with _banks_lock:
+        cached = _banks.get(json_path)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        old = cached[1] if cached else None
+        if key is None:
+            bank = None
+        elif old is not None and cached[0][1:] == key[1:]:
+            bank = old  # same compiled file, only the stat of qcm.json changed
+        else:
+            try:
+                bank = MappedBank(mapped_path)
+            except (OSError, ValueError, struct.error):
+                bank = None
+        if bank is not None and stat is not None and (bank.source_size, bank.source_mtime_ns) != signature:
+            # Same content can come back with a new mtime (copies, PyInstaller extraction)
+            if bank.source_size != stat.st_size or bank_snapshot._sha256_file(json_path) != bank.source_sha256:
+                bank = None
+        if old is not None and old is not bank:
+            # Unmap the superseded file; attempts still holding its categories reload them (QuizSession.question)
+            old.close()
+        _banks[json_path] = (key, bank)
+        return bank
+
+
+_BENCH_CODE = """
+import json, os, sys, time
+mode, json_path = sys.argv[1], sys.argv[2]
+import bank_mmap, sampler  # module imports are not part of the measurement
+
+def rss_kb():
+    with open("/proc/self/statm") as file:  # resident and resident shared (file-backed) pages
+        resident, shared = (int(x) for x in file.read().split()[1:3])
+    return resident * os.sysconf("SC_PAGE_SIZE") // 1024, (resident - shared) * os.sysconf("SC_PAGE_SIZE") // 1024
+
+def peak_kb():
+    with open("/proc/self/status") as file:  # high-water mark of this process (ru_maxrss survives exec)
+        return next(int(line.split()[1]) for line in file if line.startswith("VmHWM:"))
+
+before, before_private = rss_kb()
+start = time.perf_counter()
+if mode == "json":
+    with open(json_path, "r", encoding="utf-8") as file:
+        category = json.load(file)["categories"][0]
+else:
+    category = bank_mmap.open_fresh(json_path).category(1)
+opened = time.perf_counter()
+questions = sampler.draw(category["questions"], 10, 42)
+drawn = time.perf_counter()
+print(json.dumps({"open": opened - start, "draw": drawn - opened,
+                  "peak_kb": peak_kb() - before,
+                  "private_kb": rss_kb()[1] - before_private,
+                  "first": questions[0]["question"]}))
+"""
+
+def benchmark(questions, directory):
+    """Whole-bank json.load vs the mapped bank: open time, draw time and memory of one worker."""
+    import random
+    import subprocess
+    import sys
+
+    json_path = os.path.join(directory, "bench.json")
+    rng = random.Random(1)
+    per_category = questions // 10
+    data = {"categories": [
+        {"id": c, "name": f"category {c}", "questions": [
+            {"id": q, "uid": f"{c:04d}{q:012d}", "question": f"Question {q} of category {c}: " + " ".join(
+                rng.choice(["what", "which", "value", "list", "loop", "class", "index"]) for _ in range(10)),
+             "options": [{"id": o, "text": f"answer {o} {rng.randrange(1000)}"} for o in "abcd"],
+             "correct_answer": rng.choice("abcd")}
+            for q in range(1, per_category + 1)]}
+        for c in range(1, 11)]}
+    with open(json_path, 'w', encoding='utf-8') as file:
+        json.dump(data, file, indent=2)
+    del data
+    build(json_path)
+    print(f"{questions} questions: qcm.json {os.path.getsize(json_path) / 1e6:.1f} MB, "
+          f"compiled {os.path.getsize(mapped_path_for(json_path)) / 1e6:.1f} MB")
+    here = os.path.dirname(os.path.abspath(__file__))
+    for mode in ("json", "mapped"):
+        result = json.loads(subprocess.run([sys.executable, "-c", _BENCH_CODE, mode, json_path], cwd=here,
+                                           capture_output=True, text=True, check=True).stdout)
+        print(f"{mode:>6}: open {1000 * result['open']:8.1f} ms, draw 10 {1000 * result['draw']:6.2f} ms, "
+              f"peak memory {result['peak_kb'] / 1024:7.1f} MB, private after {result['private_kb'] / 1024:6.1f} MB")
+
+
+if __name__ == "__main__":
+    import argparse
+    import tempfile
+
+    import storage
+
+    parser = argparse.ArgumentParser(description="Compile the question bank into a memory-mapped file")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build_args = commands.add_parser("build", help="compile qcm.json into qcm.qbm")
+    build_args.add_argument("bank", nargs="?", default=None)
+    bench_args = commands.add_parser("bench", help="compare with json.load on a generated bank")
+    bench_args.add_argument("--questions", type=int, default=300000)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        path = build(args.bank or storage.get_file_path("qcm.json"))
+        bank = MappedBank(path)
+        print(f"Built '{path}': {bank.category_count} categories, {len(bank)} questions, "
+              f"{os.path.getsize(path)} bytes.")
+    else:
+        with tempfile.TemporaryDirectory(prefix="qcm-mmap-") as directory:
+            benchmark(args.questions, directory)
@@ -0,0 +1,184 @@
+import hashlib
+import json
+import os
+import threading
+
+import storage
+
+# Sharded question bank layout:
+#   qcm/manifest.json        small list of categories (id, name, shard file, question count, hash)
+#   qcm/category-<id>.json   one file per category, same shape as a category of qcm.json
+# The storage layer uses this layout instead of qcm.json as soon as the manifest exists.
+
+MANIFEST_NAME = "manifest.json"
+MANIFEST_FORMAT = "qcm-shards"
+MANIFEST_VERSION = 1
+
+
+def shard_dir_for(json_path):
+    """qcm.json -> qcm/"""
+    return os.path.splitext(json_path)[0]
+
+def is_sharded(json_path):
+    return os.path.exists(os.path.join(shard_dir_for(json_path), MANIFEST_NAME))
+
+def category_hash(category):
+    """Content hash used to detect which shards an edit actually touched."""
+    encoded = json.dumps(category, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha1(encoded.encode("utf-8")).hexdigest()
+
+def _stat_signature(path):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+class ShardedBank:
+    """Question bank stored as a manifest plus one JSON file per category."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.manifest_path = os.path.join(directory, MANIFEST_NAME)
+        self._lock = threading.RLock()
+
+    def _shard_path(self, file_name):
+        return os.path.join(self.directory, file_name)
+
+    # Reading
+    def signature(self):
+        # Every save rewrites the manifest, so its stat covers the whole bank
+        return _stat_signature(self.manifest_path)
+
+    def load_manifest(self):
+        manifest = storage.read_json(self.manifest_path, {})
+        manifest.setdefault("categories", [])
+        return manifest
+
+    def _entry(self, category_id):
+        return next((entry for entry in self.load_manifest()["categories"] if entry["id"] == category_id), None)
+
+    def categories(self):
+        """Category summaries (id, name, count) without reading any shard."""
+        return [{"id": entry["id"], "name": entry["name"], "count": entry.get("count", 0)}
+                for entry in self.load_manifest()["categories"]]
+
+    def category_signature(self, category_id):
+        entry = self._entry(category_id)
+        if entry is None:
+            return None
+        return (entry.get("hash"), _stat_signature(self._shard_path(entry["file"])))
+
+    def load_category(self, category_id):
+        entry = self._entry(category_id)
+        if entry is None:
+            return None
+        category = storage.read_json(self._shard_path(entry["file"]), None)
+        if category is None:
+            print(f"Error: shard '{entry['file']}' is missing or invalid.")
+            return {"id": entry["id"], "name": entry["name"], "questions": []}
+        return category
+
+    def load_all(self):
+        """Load every shard, in manifest order, as a qcm.json-shaped document."""
+        categories = []
+        for entry in self.load_manifest()["categories"]:
+            category = storage.read_json(self._shard_path(entry["file"]), None)
+            categories.append(category or {"id": entry["id"], "name": entry["name"], "questions": []})
+        return {"categories": categories}
+
+    # Writing
+    def save_all(self, data):
+        """Persist a whole bank, rewriting only the shards whose content changed."""
+        os.makedirs(self.directory, exist_ok=True)
+        with self._lock, storage.file_lock(self.manifest_path):
+            old_entries = {entry["id"]: entry for entry in self.load_manifest()["categories"]}
+            new_entries = []
+            written = 0
+            for category in data.get("categories", []):
+                digest = category_hash(category)
+                old = old_entries.get(category["id"])
+                file_name = f"category-{category['id']}.json"
+                if old is None or old.get("hash") != digest or not os.path.exists(self._shard_path(file_name)):
+                    storage.write_json_atomic(self._shard_path(file_name), category, indent=2)
+                    written += 1
+                new_entries.append({
+                    "id": category["id"],
+                    "name": category["name"],
+                    "file": file_name,
+                    "count": len(category.get("questions", [])),
+                    "hash": digest
+                })
+            self._write_manifest(new_entries)
+
+            # Remove shards of deleted categories only once the manifest no longer lists them
+            kept = {entry["file"] for entry in new_entries}
+            for entry in old_entries.values():
+                if entry["file"] not in kept and os.path.exists(self._shard_path(entry["file"])):
+                    os.remove(self._shard_path(entry["file"]))
+            return written
+
+    def save_category(self, category):
+        """Add or replace one category, touching only its shard and the manifest."""
+        os.makedirs(self.directory, exist_ok=True)
+        with self._lock, storage.file_lock(self.manifest_path):
+            entries = self.load_manifest()["categories"]
+            file_name = f"category-{category['id']}.json"
+            storage.write_json_atomic(self._shard_path(file_name), category, indent=2)
+            new_entry = {
+                "id": category["id"],
+                "name": category["name"],
+                "file": file_name,
+                "count": len(category.get("questions", [])),
+                "hash": category_hash(category)
+            }
+            for position, entry in enumerate(entries):
+                if entry["id"] == category["id"]:
+                    entries[position] = new_entry
+                    break
+            else:
+                entries.append(new_entry)
+            self._write_manifest(entries)
+
+    def _write_manifest(self, entries):
+        storage.write_json_atomic(self.manifest_path, {
+            "format": MANIFEST_FORMAT,
+            "version": MANIFEST_VERSION,
+            "categories": entries
+        }, indent=2)
+
+
+def convert(json_path, directory=None):
+    """Split a monolithic qcm.json into the sharded layout."""
+    directory = directory or shard_dir_for(json_path)
+    data = storage.read_json(json_path, {"categories": []})
+    bank = ShardedBank(directory)
+    bank.save_all(data)
+    print(f"Wrote {len(data.get('categories', []))} category shards to '{directory}'.")
+    return bank
+
+def join(directory, json_path):
+    """Merge a sharded bank back into a single qcm.json-shaped file."""
+    data = ShardedBank(directory).load_all()
+    storage.write_json_atomic(json_path, data, indent=2)
+    print(f"Wrote {len(data['categories'])} categories to '{json_path}'.")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Convert between qcm.json and the sharded bank layout")
+    sub = parser.add_subparsers(dest="command", required=True)
+    convert_cmd = sub.add_parser("convert", help="split qcm.json into a manifest and one file per category")
+    convert_cmd.add_argument("source", nargs="?", default="qcm.json")
+    convert_cmd.add_argument("target", nargs="?", default=None, help="shard directory (default: qcm/)")
+    join_cmd = sub.add_parser("join", help="merge a shard directory back into one JSON file")
+    join_cmd.add_argument("source", nargs="?", default="qcm")
+    join_cmd.add_argument("target", nargs="?", default="qcm.json")
+    args = parser.parse_args()
+
+    if args.command == "convert":
+        convert(args.source, args.target)
+    else:
+        join(args.source, args.target)
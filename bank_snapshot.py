@@ -0,0 +1,171 @@
+import hashlib
+import json
+import marshal
+import os
+import struct
+import sys
+
+# Precompiled snapshot of the question bank, built at packaging time.
+#   qcm.bank = header + marshal(bank)
+# The header records the size, mtime and SHA-256 of the qcm.json it was built
+# from. The snapshot is only used while it still matches that source; after an
+# admin edit the loader silently falls back to qcm.json.
+# main.spec bundles qcm.bank into the executable: a onefile build extracts it to
+# sys._MEIPASS, while qcm.json is read next to the executable, so the frozen app
+# looks for the snapshot in both places.
+
+MAGIC = b"QCMSNAP1"
+HEADER = struct.Struct("<8sQq32sQ")  # magic, source size, source mtime_ns, source sha256, payload size
+MARSHAL_VERSION = 4
+
+
+def snapshot_path_for(json_path):
+    """qcm.json -> qcm.bank"""
+    return os.path.splitext(json_path)[0] + ".bank"
+
+def bundled_path_for(json_path):
+    """The snapshot packed into a PyInstaller build (extracted to sys._MEIPASS), or None when not frozen."""
+    bundle_dir = getattr(sys, '_MEIPASS', None)
+    if not getattr(sys, 'frozen', False) or bundle_dir is None:
+        return None
+    return os.path.join(bundle_dir, os.path.basename(snapshot_path_for(json_path)))
+
+def _sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            digest.update(block)
+    return digest.digest()
+
+def build(json_path, snapshot_path=None):
+    """Compile `json_path` into a binary snapshot and return the snapshot path."""
+    snapshot_path = snapshot_path or snapshot_path_for(json_path)
+    with open(json_path, 'rb') as file:
+        raw = file.read()
+    stat = os.stat(json_path)
+    payload = marshal.dumps(json.loads(raw.decode('utf-8')), MARSHAL_VERSION)
+    header = HEADER.pack(MAGIC, stat.st_size, stat.st_mtime_ns, hashlib.sha256(raw).digest(), len(payload))
+
+    tmp_path = snapshot_path + ".tmp"
+    with open(tmp_path, 'wb') as file:
+        file.write(header)
+        file.write(payload)
+    os.replace(tmp_path, snapshot_path)
+    return snapshot_path
+
+def load_fresh(json_path, snapshot_path=None):
+    """Return the bank from the snapshot if it matches `json_path`, else None.
+
+    Without `snapshot_path`, the snapshot next to `json_path` is tried first,
+    then the one bundled into the executable.
+    """
+    if snapshot_path is not None:
+        return _load(json_path, snapshot_path)
+    data = _load(json_path, snapshot_path_for(json_path))
+    bundled = bundled_path_for(json_path)
+    if data is None and bundled is not None:
+        data = _load(json_path, bundled)
+    return data
+
+def _load(json_path, snapshot_path):
+    try:
+        with open(snapshot_path, 'rb') as file:
+            header = file.read(HEADER.size)
+            if len(header) != HEADER.size:
+                return None
+            magic, size, mtime_ns, checksum, payload_size = HEADER.unpack(header)
+            if magic != MAGIC:
+                return None
+
+            try:
+                stat = os.stat(json_path)
+            except FileNotFoundError:
+                stat = None  # a build may ship the snapshot alone
+            if stat is not None and (stat.st_size, stat.st_mtime_ns) != (size, mtime_ns):
+                # Same content can come back with a new mtime (copies, PyInstaller extraction)
+                if stat.st_size != size or _sha256_file(json_path) != checksum:
+                    return None
+
+            payload = file.read(payload_size)
+            if len(payload) != payload_size:
+                return None
+            return marshal.loads(payload)
+    except (FileNotFoundError, ValueError, EOFError, TypeError):
+        return None
+
+
+_BENCH_CODE = """
+import json, sys, time, tracemalloc
+try:
+    import resource
+except ImportError:
+    resource = None
+mode, json_path = sys.argv[1], sys.argv[2]
+if mode == "snapshot":
+    import bank_snapshot  # module import is not part of the load being measured
+
+def load():
+    if mode == "json":
+        with open(json_path, "r", encoding="utf-8") as file:
+            return json.load(file)
+    data = bank_snapshot.load_fresh(json_path)
+    assert data is not None, "snapshot is stale"
+    return data
+
+rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss if resource else 0
+start = time.perf_counter()
+data = load()
+elapsed = time.perf_counter() - start
+rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss if resource else 0
+# Allocation size comes from a second load: tracemalloc would distort the timing above
+del data
+tracemalloc.start()
+data = load()
+allocated = tracemalloc.get_traced_memory()[0]
+print(json.dumps({"seconds": elapsed, "allocated": allocated, "rss_kb": rss_after - rss_before}))
+"""
+
+def benchmark(json_path, runs=5):
+    """Compare cold load time and memory of qcm.json vs its snapshot, one fresh interpreter per run."""
+    import subprocess
+
+    if load_fresh(json_path) is None:
+        build(json_path)
+    here = os.path.dirname(os.path.abspath(__file__))
+    results = {}
+    for mode in ("json", "snapshot"):
+        samples = []
+        for _ in range(runs):
+            output = subprocess.run(
+                [sys.executable, "-c", _BENCH_CODE, mode, json_path],
+                cwd=here, capture_output=True, text=True, check=True
+            ).stdout
+            samples.append(json.loads(output))
+        samples.sort(key=lambda sample: sample["seconds"])
+        results[mode] = samples[len(samples) // 2]  # median run
+
+    print(f"Cold load of '{json_path}' (median of {runs} fresh interpreters):")
+    for mode, sample in results.items():
+        print(f"  {mode:<9} {sample['seconds'] * 1000:8.2f} ms   "
+              f"{sample['allocated'] / 1024:8.1f} KiB allocated   {sample['rss_kb']:6d} KiB RSS growth")
+    speedup = results["json"]["seconds"] / results["snapshot"]["seconds"] if results["snapshot"]["seconds"] else 0
+    print(f"  snapshot is {speedup:.1f}x faster")
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Build or benchmark the binary question bank snapshot")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build_cmd = sub.add_parser("build", help="compile qcm.json into qcm.bank")
+    build_cmd.add_argument("source", nargs="?", default="qcm.json")
+    bench_cmd = sub.add_parser("bench", help="compare cold load time and memory of JSON vs snapshot")
+    bench_cmd.add_argument("source", nargs="?", default="qcm.json")
+    bench_cmd.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        print(f"Wrote snapshot '{build(args.source)}'.")
+    else:
+        benchmark(args.source, args.runs)
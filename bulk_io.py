@@ -0,0 +1,266 @@
+import csv
+import json
+import os
+
+import question_ids
+import quiz_app as qa
+import storage
+
+# Bulk import/export of questions as CSV or JSONL.
+# Rows are streamed through generators (read -> validate -> apply), so the input
+# file is never held in memory; only the bank being edited is. All valid rows
+# are applied to the bank copy and saved with a single atomic write at the end.
+#
+# CSV columns:  category,question,option_a,option_b,option_c,option_d,correct_answer[,uid]
+# JSONL lines:  {"category": ..., "question": ..., "options": [{"id": "a", "text": ...}, ...],
+#                "correct_answer": "a", "uid": ...}   (option_a..option_d are accepted too)
+
+OPTION_IDS = ["a", "b", "c", "d"]
+CSV_FIELDS = ["category", "question"] + [f"option_{o}" for o in OPTION_IDS] + ["correct_answer", "uid"]
+MAX_REPORTED_ERRORS = 50
+
+
+def detect_format(path):
+    return "jsonl" if os.path.splitext(path)[1].lower() in (".jsonl", ".ndjson") else "csv"
+
+def read_rows(file, fmt):
+    """Yield (line number, row dict) from an open text file, or (line number, error message)."""
+    if fmt == "csv":
+        reader = csv.DictReader(file)
+        for row in reader:
+            yield reader.line_num, row
+    else:
+        for line_number, line in enumerate(file, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                yield line_number, f"invalid JSON ({e.msg})"
+                continue
+            yield line_number, row if isinstance(row, dict) else "expected a JSON object"
+
+def _text(value):
+    return value.strip() if isinstance(value, str) else ""
+
+def validate_row(row):
+    """Return (category name, question) for a valid row, or raise ValueError with the reason."""
+    if isinstance(row, str):
+        raise ValueError(row)
+    category = _text(row.get("category"))
+    question_text = _text(row.get("question"))
+    if not category:
+        raise ValueError("missing category")
+    if not question_text:
+        raise ValueError("missing question text")
+
+    if isinstance(row.get("options"), list):
+        texts = {opt.get("id"): _text(opt.get("text")) for opt in row["options"] if isinstance(opt, dict)}
+        if len(row["options"]) != len(OPTION_IDS):
+            raise ValueError(f"expected 4 options, got {len(row['options'])}")
+    else:
+        texts = {o: _text(row.get(f"option_{o}")) for o in OPTION_IDS}
+    missing = [o for o in OPTION_IDS if not texts.get(o)]
+    if missing:
+        raise ValueError("empty option " + ", ".join(missing))
+
+    correct_answer = _text(row.get("correct_answer")).lower()
+    if correct_answer not in OPTION_IDS:
+        raise ValueError(f"correct answer must be one of a, b, c, d (got '{row.get('correct_answer')}')")
+
+    question = {
+        "question": question_text,
+        "options": [{"id": o, "text": texts[o]} for o in OPTION_IDS],
+        "correct_answer": correct_answer
+    }
+    if _text(row.get("uid")):
+        question["uid"] = _text(row.get("uid"))
+    return category, question
+
+def validated(rows, errors):
+    """Yield (line number, category name, question) for valid rows; bad rows go to `errors`."""
+    for line_number, row in rows:
+        try:
+            category, question = validate_row(row)
+        except ValueError as e:
+            errors.append((line_number, str(e)))
+            continue
+        yield line_number, category, question
+
+
+class _BoundedErrors(list):
+    """List that keeps only the first MAX_REPORTED_ERRORS items but counts all of them."""
+
+    def __init__(self, report):
+        super().__init__()
+        self.report = report
+
+    def append(self, item):
+        self.report.error_count += 1
+        if len(self) < MAX_REPORTED_ERRORS:
+            super().append(item)
+
+
+class ImportReport:
+    def __init__(self):
+        self.added = 0  # valid new questions, whether or not they were saved
+        self.saved = False
+        self.dry_run = False
+        self.duplicates = 0
+        self.new_categories = []
+        self.error_count = 0
+        self.errors = _BoundedErrors(self)  # (line number, reason)
+        # The bank copy with the valid rows applied, and the bank signature it was taken at
+        self.bank = None
+        self.bank_file = None
+        self.signature = None
+
+    def summary(self):
+        if self.saved or not self.added:
+            added = f"{self.added} questions added"
+        elif self.dry_run:
+            added = f"{self.added} questions to add (dry run)"
+        else:
+            added = f"{self.added} valid questions not imported"
+        return f"{added}, {self.duplicates} duplicates skipped, {self.error_count} invalid rows."
+
+    def print(self):
+        for line_number, reason in self.errors:
+            print(f"  line {line_number}: {reason}")
+        if self.error_count > len(self.errors):
+            print(f"  ... and {self.error_count - len(self.errors)} more invalid rows")
+        print(self.summary())
+        if self.new_categories:
+            print("New categories: " + ", ".join(self.new_categories))
+
+    def save(self):
+        """Save the valid rows of a dry run without reading the file again.
+
+        Returns False, saving nothing, if there is nothing to add or the bank
+        changed since the dry run (import the file again then).
+        """
+        if self.saved:
+            return True
+        if not self.added or _bank_signature(self.bank_file) != self.signature:
+            return False
+        qa.save_bank(self.bank, self.bank_file)
+        self.saved = True
+        self.dry_run = False
+        return True
+
+
+def _bank_signature(bank_file):
+    return storage.get_storage().bank_signature(qa.get_file_path(bank_file))
+
+
+def import_questions(file, fmt="csv", bank_file='qcm.json', dry_run=False, allow_errors=False):
+    """Stream rows from `file` into the bank and save it once.
+
+    Nothing is saved when any row is invalid unless `allow_errors` is set, in
+    which case only the valid rows are applied. A dry run keeps the edited
+    bank in the report: report.save() applies it without reading the file again.
+    """
+    report = ImportReport()
+    report.dry_run = dry_run
+    report.bank_file = bank_file
+    report.signature = _bank_signature(bank_file)  # taken first: an edit made meanwhile makes save() refuse
+    data = report.bank = qa.edit_bank(bank_file)
+    data.setdefault("categories", [])
+    categories = {cat["name"].lower(): cat for cat in data["categories"]}
+    known = {}  # category id -> (set of question texts for duplicate detection, next question id)
+    uids = {q["uid"] for cat in data["categories"] for q in cat.get("questions", []) if q.get("uid")}
+
+    for line_number, name, question in validated(read_rows(file, fmt), report.errors):
+        category = categories.get(name.lower())
+        if category is None:
+            new_id = max((cat["id"] for cat in data["categories"]), default=0) + 1
+            category = {"id": new_id, "name": name, "questions": []}
+            data["categories"].append(category)
+            categories[name.lower()] = category
+            report.new_categories.append(name)
+        if category["id"] not in known:
+            known[category["id"]] = ({q["question"].lower() for q in category["questions"]},
+                                     question_ids.next_question_id(category))
+        texts, next_id = known[category["id"]]
+        if question["question"].lower() in texts:
+            report.duplicates += 1
+            continue
+        texts.add(question["question"].lower())
+        known[category["id"]] = (texts, next_id + 1)
+        uid = question.pop("uid", None)
+        if uid is None or uid in uids:
+            uid = question_ids.new_uid()  # keep uids unique inside the bank
+        question = {"id": next_id, "uid": uid, **question}
+        uids.add(question["uid"])
+        category["questions"].append(question)
+        report.added += 1
+
+    if not dry_run and report.added and (allow_errors or not report.error_count):
+        qa.save_bank(data, bank_file)
+        report.saved = True
+    return report
+
+def export_rows(category_name=None):
+    """Yield one row dict per question, a category at a time."""
+    for summary in qa.load_categories():
+        if category_name is not None and summary["name"].lower() != category_name.lower():
+            continue
+        category = qa.load_category(summary["id"])
+        for question in category.get("questions", []):
+            yield category["name"], question
+
+def export_questions(file, fmt="csv", category_name=None):
+    """Stream the bank (or one category) to an open text file. Returns the number of rows."""
+    count = 0
+    writer = csv.DictWriter(file, fieldnames=CSV_FIELDS) if fmt == "csv" else None
+    if writer:
+        writer.writeheader()
+    for name, question in export_rows(category_name=category_name):
+        options = {opt["id"]: opt["text"] for opt in question.get("options", [])}
+        if writer:
+            writer.writerow({
+                "category": name,
+                "question": question["question"],
+                **{f"option_{o}": options.get(o, "") for o in OPTION_IDS},
+                "correct_answer": question.get("correct_answer", ""),
+                "uid": question.get("uid", "")
+            })
+        else:
+            row = {"category": name, "question": question["question"], "options": question.get("options", []),
+                   "correct_answer": question.get("correct_answer"), "uid": question.get("uid")}
+            file.write(json.dumps(row, ensure_ascii=False) + "\n")
+        count += 1
+    return count
+
+def import_file(path, fmt=None, **kwargs):
+    with open(path, 'r', encoding='utf-8-sig', newline='') as file:
+        return import_questions(file, fmt or detect_format(path), **kwargs)
+
+def export_file(path, fmt=None, category_name=None):
+    with open(path, 'w', encoding='utf-8', newline='') as file:
+        return export_questions(file, fmt or detect_format(path), category_name)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Bulk import/export of quiz questions")
+    commands = parser.add_subparsers(dest="command", required=True)
+    importer = commands.add_parser("import", help="add the questions of a CSV/JSONL file to the bank")
+    importer.add_argument("path")
+    importer.add_argument("--format", choices=["csv", "jsonl"], default=None)
+    importer.add_argument("--dry-run", action="store_true", help="only validate the file")
+    importer.add_argument("--allow-errors", action="store_true", help="import the valid rows even if some are invalid")
+    exporter = commands.add_parser("export", help="write the bank to a CSV/JSONL file")
+    exporter.add_argument("path")
+    exporter.add_argument("--format", choices=["csv", "jsonl"], default=None)
+    exporter.add_argument("--category", default=None)
+    args = parser.parse_args()
+
+    if args.command == "import":
+        report = import_file(args.path, args.format, dry_run=args.dry_run, allow_errors=args.allow_errors)
+        report.print()
+        if report.error_count and not (args.allow_errors or args.dry_run):
+            print("Nothing was imported. Fix the rows above or use --allow-errors.")
+    else:
+        print(f"Exported {export_file(args.path, args.format, args.category)} questions to '{args.path}'.")
@@ -0,0 +1,247 @@
+import marshal
+import os
+import threading
+import zlib
+
+import numpy as np
+
+import question_ids
+import quiz_app as qa
+import search_index
+import storage
+
+# Near-duplicate question detection with MinHash and LSH banding.
+# Each question (text and options) is reduced to its set of character
+# shingles, and then to a MinHash signature of NUM_PERM values whose agreement
+# rate estimates the Jaccard similarity of two shingle sets. Signatures are cut
+# into BANDS bands of ROWS values; questions sharing any whole band land in the
+# same bucket and become candidate pairs, so only a tiny fraction of all pairs
+# is ever compared. Signatures are kept in qcm.dedup and follow bank edits the
+# same way the search index does.
+
+MAGIC = "QCMDUP01"
+MARSHAL_VERSION = 4
+SHINGLE = 5           # characters per shingle
+NUM_PERM = 128
+BANDS = 16
+ROWS = NUM_PERM // BANDS  # candidates from about (1 / BANDS) ** (1 / ROWS) = 0.71 similarity
+THRESHOLD = 0.8
+
+# One 64-bit seed per hash function; fixed because signatures are persisted
+_SEEDS = np.random.RandomState(20250101).randint(0, 2 ** 63 - 1, size=NUM_PERM, dtype=np.int64).astype(np.uint64)
+
+
+def dedup_path_for(bank_path):
+    """qcm.json -> qcm.dedup"""
+    return os.path.splitext(bank_path)[0] + ".dedup"
+
+def shingles(question):
+    """Character shingles of the normalized question and option text."""
+    parts = [question.get("question", "")] + [opt.get("text", "") for opt in question.get("options", [])]
+    text = " ".join(search_index.tokenize(" ".join(parts)))
+    if len(text) <= SHINGLE:
+        return {text}
+    return {text[i:i + SHINGLE] for i in range(len(text) - SHINGLE + 1)}
+
+def _mix(values):
+    """splitmix64 finalizer: a fast, well-spread 64-bit hash (uint64 overflow wraps on purpose)."""
+    values = (values ^ (values >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    values = (values ^ (values >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return values ^ (values >> np.uint64(31))
+
+def minhash(question):
+    """MinHash signature of a question, as a uint32 array of NUM_PERM values."""
+    hashes = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingles(question)), dtype=np.uint64)
+    with np.errstate(over="ignore"):
+        values = _mix(_SEEDS[:, None] ^ hashes[None, :])  # one hash function per row
+    return (values.min(axis=1) >> np.uint64(32)).astype(np.uint32)
+
+def similarity(signature_a, signature_b):
+    """Estimated Jaccard similarity of two signatures."""
+    return float(np.count_nonzero(signature_a == signature_b)) / NUM_PERM
+
+_BAND_BYTES = ROWS * 4
+
+def _bands(signature):
+    """The BANDS byte strings a signature is bucketed by."""
+    raw = signature.tobytes()
+    return [raw[start:start + _BAND_BYTES] for start in range(0, BANDS * _BAND_BYTES, _BAND_BYTES)]
+
+
+class DuplicateIndex:
+    """MinHash signatures of the bank with LSH buckets for candidate lookup."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self.signature = None
+        self.docs = {}     # key -> (category id, category name, question id, question text, content hash)
+        self.minhashes = {}  # key -> signature array
+        self.buckets = [{} for _ in range(BANDS)]  # per band: band bytes -> [keys]
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, 'rb') as file:
+                stored = marshal.loads(file.read())
+        except (FileNotFoundError, ValueError, EOFError, TypeError):
+            return
+        if not isinstance(stored, dict) or stored.get("magic") != MAGIC:
+            return
+        self.signature = stored["signature"]
+        for key, (doc, raw) in stored["docs"].items():
+            self._insert(key, doc, np.frombuffer(raw, dtype=np.uint32))
+
+    def save(self):
+        with self._lock:
+            docs = {key: (doc, self.minhashes[key].tobytes()) for key, doc in self.docs.items()}
+            payload = marshal.dumps({"magic": MAGIC, "signature": self.signature, "docs": docs}, MARSHAL_VERSION)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'wb') as file:
+            file.write(payload)
+        os.replace(tmp_path, self.path)
+
+    # Maintenance (callers hold self._lock)
+    def _insert(self, key, doc, signature):
+        self.docs[key] = doc
+        self.minhashes[key] = signature
+        for buckets, band in zip(self.buckets, _bands(signature)):
+            buckets.setdefault(band, []).append(key)
+
+    def _remove(self, key):
+        del self.docs[key]
+        for buckets, band in zip(self.buckets, _bands(self.minhashes.pop(key))):
+            bucket = buckets[band]
+            bucket.remove(key)
+            if not bucket:
+                del buckets[band]
+
+    def add(self, category, question):
+        """Index one question (e.g. a new one not saved yet)."""
+        key = search_index.doc_key(category, question)
+        doc = (category["id"], category["name"], question["id"], question.get("question", ""),
+               question_ids.content_hash(question))
+        with self._lock:
+            if key in self.docs:
+                self._remove(key)
+            self._insert(key, doc, minhash(question))
+
+    def sync(self, data, signature):
+        """Bring the index in line with `data`, hashing only changed questions."""
+        with self._lock:
+            seen = set()
+            changed = 0
+            for category in data.get("categories", []):
+                for question in category.get("questions", []):
+                    key = search_index.doc_key(category, question)
+                    seen.add(key)
+                    doc = (category["id"], category["name"], question["id"], question.get("question", ""),
+                           question_ids.content_hash(question))
+                    if self.docs.get(key) == doc:
+                        continue
+                    if key in self.docs:
+                        self._remove(key)
+                    self._insert(key, doc, minhash(question))
+                    changed += 1
+            removed = [key for key in self.docs if key not in seen]
+            for key in removed:
+                self._remove(key)
+            self.signature = signature
+            return changed, len(removed)
+
+    # Queries
+    def similar(self, question, threshold=THRESHOLD, exclude=None):
+        """Indexed questions likely to duplicate `question`, most similar first."""
+        signature = minhash(question)
+        with self._lock:
+            candidates = set()
+            for buckets, band in zip(self.buckets, _bands(signature)):
+                candidates.update(buckets.get(band, ()))
+            candidates.discard(exclude)
+            hits = []
+            for key in candidates:
+                score = similarity(signature, self.minhashes[key])
+                if score >= threshold:
+                    doc = self.docs[key]
+                    hits.append({"key": key, "category_id": doc[0], "category": doc[1], "id": doc[2],
+                                 "question": doc[3], "similarity": score})
+        hits.sort(key=lambda hit: -hit["similarity"])
+        return hits
+
+    def clusters(self, threshold=THRESHOLD):
+        """Groups of questions whose pairwise chains are all above `threshold`, largest first."""
+        with self._lock:
+            parent = {}
+
+            def find(key):
+                while parent.get(key, key) != key:
+                    parent[key] = parent.get(parent[key], parent[key])
+                    key = parent[key]
+                return key
+
+            for bucket in (bucket for buckets in self.buckets for bucket in buckets.values()):
+                if len(bucket) < 2:
+                    continue
+                members = sorted(bucket)
+                for i, first in enumerate(members):
+                    for second in members[i + 1:]:
+                        if find(first) == find(second):
+                            continue  # already linked through another pair
+                        if similarity(self.minhashes[first], self.minhashes[second]) >= threshold:
+                            parent.setdefault(first, first)
+                            parent[find(second)] = find(first)
+
+            groups = {}
+            for key in parent:
+                groups.setdefault(find(key), []).append(key)
+            return sorted(
+                ([dict(zip(("category_id", "category", "id", "question"), self.docs[key][:4]), key=key)
+                  for key in sorted(members, key=lambda k: self.docs[k][:3])]
+                 for members in groups.values()),
+                key=len, reverse=True
+            )
+
+    def __len__(self):
+        return len(self.docs)
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+def get_duplicate_index(filename='qcm.json'):
+    """The duplicate index of a bank, synced with the bank's current content."""
+    bank_path = qa.get_file_path(filename)
+    with _indexes_lock:
+        index = _indexes.get(filename)
+        if index is None:
+            index = _indexes[filename] = DuplicateIndex(dedup_path_for(bank_path))
+    signature = repr(storage.get_storage().bank_signature(bank_path))
+    if index.signature != signature:
+        changed, removed = index.sync(qa.bank_cache.get(filename), signature)
+        if changed or removed or not os.path.exists(index.path):
+            index.save()
+    return index
+
+def find_similar(question, filename='qcm.json', threshold=THRESHOLD):
+    return get_duplicate_index(filename).similar(question, threshold)
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Report near-duplicate questions")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD, help="minimum estimated similarity")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    index = get_duplicate_index()
+    indexed = time.perf_counter()
+    clusters = index.clusters(args.threshold)
+    finished = time.perf_counter()
+    for number, cluster in enumerate(clusters, 1):
+        print(f"\nCluster {number} ({len(cluster)} questions):")
+        for item in cluster:
+            print(f"  [{item['category']}] Q{item['id']}: {item['question']}")
+    print(f"\n{len(clusters)} clusters among {len(index)} questions "
+          f"(index {indexed - started:.2f}s, clustering {finished - indexed:.2f}s)")
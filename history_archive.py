@@ -0,0 +1,322 @@
+import datetime
+import gzip
+import json
+import lzma
+import os
+import threading
+
+import history_log
+
+# Monthly archive of old quiz games (JSON storage backend).
+# Compaction moves the oldest games of history.jsonl, whole calendar months at a
+# time, into immutable compressed segments next to it:
+#   history.archive/manifest.json        segments, oldest first, with id ranges and per-user counts
+#   history.archive/2024-03.jsonl.gz     the games of one month, one per line (.jsonl.xz with lzma)
+#   history.archive/2024-03.sum.json.gz  their summaries grouped by user, for history pages
+#   history.archive/rollup.json          per user and category: attempts, accuracy, best score
+# The active log keeps only the recent games. History pages read the archive
+# only when a user pages back past them, and skip whole months by their counts.
+# Segments are fsynced, then the manifest is written: its last_id marks what
+# has been archived, so an interrupted compaction is finished by the next one,
+# and only then are the archived games dropped from the log.
+#
+#   python history_archive.py compact --days 90 [--lzma]
+#   python history_archive.py stats <user id>
+
+KEEP_DAYS = 90
+COMPRESSION = {"gzip": ".jsonl.gz", "lzma": ".jsonl.xz"}
+_SUMMARY_CACHE = 8  # segments whose user summaries are kept in memory
+
+
+def archive_dir_for(log_path):
+    """history.jsonl -> history.archive"""
+    return os.path.splitext(log_path)[0] + ".archive"
+
+def _open_segment(path, mode='rb'):
+    return (lzma.open if path.endswith(".xz") else gzip.open)(path, mode)
+
+def _write_atomic(path, payload):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'wb') as file:
+        file.write(payload)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_path, path)
+    history_log.fsync_dir(os.path.dirname(path))
+
+def _write_compressed(path, payload):
+    """Compress `payload` into `path` (xz or gzip by extension); the data is on disk before the rename."""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'wb') as raw:
+        with (lzma.LZMAFile(raw, 'wb') if path.endswith(".xz") else gzip.GzipFile(fileobj=raw, mode='wb')) as file:
+            file.write(payload)
+        raw.flush()
+        os.fsync(raw.fileno())
+    os.replace(tmp_path, path)
+
+def _user_key(user_id):
+    return str(user_id)  # JSON object keys are strings
+
+def _parse_score(score):
+    try:
+        correct, total = str(score).split("/")
+        return int(correct), int(total)
+    except ValueError:
+        return 0, 0
+
+
+class HistoryArchive:
+    """Read side of the archive of one history log."""
+
+    def __init__(self, log_path):
+        self.directory = archive_dir_for(log_path)
+        self.manifest_path = os.path.join(self.directory, "manifest.json")
+        self.rollup_path = os.path.join(self.directory, "rollup.json")
+        self._lock = threading.Lock()
+        self._signature = None
+        self.segments = []  # oldest first
+        self.last_id = 0    # every game up to this id is archived
+        self._summaries = {}  # segment name -> {user key: [summaries]}
+        self._games = (None, {})  # last segment read in full: (name, {id: game})
+
+    def refresh(self):
+        """Reload the manifest if a compaction changed it."""
+        try:
+            stat = os.stat(self.manifest_path)
+            signature = (stat.st_mtime_ns, stat.st_size)
+        except FileNotFoundError:
+            signature = None
+        if signature == self._signature:
+            return
+        with self._lock:
+            manifest = {}
+            if signature is not None:
+                with open(self.manifest_path, 'r', encoding='utf-8') as file:
+                    manifest = json.load(file)
+            self.segments = manifest.get("segments", [])
+            self.last_id = manifest.get("last_id", 0)
+            self._summaries = {}
+            self._signature = signature
+
+    def _segment(self, name):
+        return next((segment for segment in self.segments if segment["name"] == name), None)
+
+    # History pages
+    def _user_summaries(self, segment, key):
+        """Summaries of one user's games in a segment, oldest first."""
+        with self._lock:
+            by_user = self._summaries.get(segment["name"])
+            if by_user is None:
+                with _open_segment(os.path.join(self.directory, segment["summary"])) as file:
+                    by_user = json.loads(file.read())
+                for summaries in by_user.values():
+                    for summary in summaries:
+                        summary["ref"] = f"{segment['name']}:{summary['id']}"
+                if len(self._summaries) >= _SUMMARY_CACHE:
+                    self._summaries.clear()
+                self._summaries[segment["name"]] = by_user
+            return by_user.get(key, [])
+
+    def _segment_count(self, segment, key, category, date_from, date_to):
+        counts = segment["users"].get(key)
+        if not counts:
+            return 0
+        start = date_from.isoformat() if date_from else None
+        end = date_to.isoformat() if date_to else None
+        if (start and segment["last_date"] < start) or (end and segment["first_date"] > end):
+            return 0
+        if (start and segment["first_date"] < start) or (end and segment["last_date"] > end):
+            # The month straddles the date range: count from its summaries
+            return len(history_log.filter_summaries(self._user_summaries(segment, key), category, date_from, date_to))
+        return counts.get(category, 0) if category is not None else sum(counts.values())
+
+    def count(self, user_id, category=None, date_from=None, date_to=None):
+        """Archived games of a user matching the filters, mostly from the manifest counts."""
+        key = _user_key(user_id)
+        return sum(self._segment_count(segment, key, category, date_from, date_to) for segment in self.segments)
+
+    def summaries(self, user_id, category=None, date_from=None, date_to=None, skip=0, limit=10):
+        """Newest-first archived summaries of a user, after skipping `skip` matching games."""
+        key = _user_key(user_id)
+        found = []
+        for segment in reversed(self.segments):
+            count = self._segment_count(segment, key, category, date_from, date_to)
+            if skip >= count:
+                skip -= count  # the whole month is before the requested page
+                continue
+            matching = history_log.filter_summaries(self._user_summaries(segment, key), category, date_from, date_to)
+            found.extend(matching[skip:skip + limit - len(found)])
+            skip = 0
+            if len(found) >= limit:
+                break
+        return found
+
+    # Full records
+    def read_game(self, ref):
+        """The full record of an archived game from its "<segment>:<id>" ref."""
+        name, _, game_id = str(ref).rpartition(":")
+        with self._lock:
+            cached_name, games = self._games
+            if cached_name != name:
+                segment = self._segment(name)
+                if segment is None:
+                    return None
+                games = {game["id"]: game for game in self._read_segment(segment)}
+                self._games = (name, games)
+            return games.get(int(game_id))
+
+    def _read_segment(self, segment):
+        with _open_segment(os.path.join(self.directory, segment["file"])) as file:
+            for line in file:
+                yield json.loads(line)
+
+    def iter_games(self, after_id=0):
+        """Archived games with an id above `after_id`, oldest first."""
+        for segment in self.segments:
+            if segment["last_id"] <= after_id:
+                continue
+            for game in self._read_segment(segment):
+                if game.get("id", 0) > after_id:
+                    yield game
+
+    def rollup(self, user_id):
+        """Per-category totals of a user's archived games."""
+        try:
+            with open(self.rollup_path, 'r', encoding='utf-8') as file:
+                users = json.load(file).get("users", {})
+        except FileNotFoundError:
+            return {}
+        result = {}
+        for category, totals in users.get(_user_key(user_id), {}).items():
+            accuracy = totals["correct"] / totals["answered"] if totals["answered"] else 0.0
+            result[category] = dict(totals, accuracy=round(accuracy, 4))
+        return result
+
+    # Compaction
+    def compact(self, log, keep_days=KEEP_DAYS, compression="gzip", now=None):
+        """Archive the log's games from the months ending more than `keep_days` ago.
+
+        Returns (games archived, names of the new segments).
+        """
+        extension = COMPRESSION[compression]
+        now = now or datetime.datetime.now()
+        cutoff = (now - datetime.timedelta(days=keep_days)).strftime("%Y-%m")  # first month kept
+        self.refresh()
+
+        # Only a prefix of the log is archived, so the log keeps consecutive ids
+        months = {}
+        last_id = self.last_id
+        for game in log.iter_all():
+            if game.get("id", 0) <= self.last_id:
+                continue  # archived by an interrupted run, only the log cleanup is missing
+            if str(game.get("date", ""))[:7] >= cutoff:
+                break
+            months.setdefault(str(game.get("date", ""))[:7], []).append(game)
+            last_id = game["id"]
+
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+            history_log.fsync_dir(os.path.dirname(os.path.abspath(self.directory)))
+        segments = list(self.segments)
+        taken = {segment["name"] for segment in segments}
+        created = []
+        for month in sorted(months):
+            games = months[month]
+            name = month
+            part = 1
+            while name in taken:  # a late game from an already archived month
+                part += 1
+                name = f"{month}-{part}"
+            taken.add(name)
+
+            segment_file = name + extension
+            _write_compressed(os.path.join(self.directory, segment_file),
+                              b"".join(history_log._encode(game) for game in games))
+
+            by_user = {}
+            users = {}
+            for game in games:
+                key = _user_key(game.get("user_id"))
+                by_user.setdefault(key, []).append(history_log.summarize(game))
+                counts = users.setdefault(key, {})
+                counts[game.get("category")] = counts.get(game.get("category"), 0) + 1
+            summary_file = name + ".sum.json" + extension[len(".jsonl"):]
+            _write_compressed(os.path.join(self.directory, summary_file),
+                              json.dumps(by_user, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+
+            dates = [str(game.get("date", ""))[:10] for game in games]
+            segments.append({
+                "name": name, "file": segment_file, "summary": summary_file, "games": len(games),
+                "first_id": games[0]["id"], "last_id": games[-1]["id"],
+                "first_date": min(dates), "last_date": max(dates), "users": users
+            })
+            created.append(name)
+
+        if created:
+            history_log.fsync_dir(self.directory)  # the segments must be durable before the manifest points at them
+            self._update_rollup([game for month in sorted(months) for game in months[month]])
+            manifest = {"last_id": last_id, "segments": segments}
+            _write_atomic(self.manifest_path, json.dumps(manifest, ensure_ascii=False, indent=1).encode("utf-8"))
+            self.refresh()
+        log.drop_through(self.last_id)
+        return sum(len(games) for games in months.values()), created
+
+    def _update_rollup(self, games):
+        try:
+            with open(self.rollup_path, 'r', encoding='utf-8') as file:
+                rollup = json.load(file)
+        except FileNotFoundError:
+            rollup = {"last_id": 0, "users": {}}
+        for game in games:
+            if game["id"] <= rollup["last_id"]:
+                continue  # counted by an interrupted run
+            correct, total = _parse_score(game.get("score"))
+            totals = rollup["users"].setdefault(_user_key(game.get("user_id")), {}).setdefault(
+                game.get("category"), {"attempts": 0, "correct": 0, "answered": 0, "best_score": None, "best_date": None}
+            )
+            totals["attempts"] += 1
+            totals["correct"] += correct
+            totals["answered"] += total
+            best_correct, best_total = _parse_score(totals["best_score"])
+            if totals["best_score"] is None or (total and correct * max(best_total, 1) > best_correct * total):
+                totals["best_score"] = game.get("score")
+                totals["best_date"] = game.get("date")
+            rollup["last_id"] = game["id"]
+        _write_atomic(self.rollup_path, json.dumps(rollup, ensure_ascii=False).encode("utf-8"))
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    import storage
+
+    parser = argparse.ArgumentParser(description="Archive old quiz games into monthly compressed segments")
+    commands = parser.add_subparsers(dest="command", required=True)
+    compact_args = commands.add_parser("compact", help="move old months out of the active history")
+    compact_args.add_argument("--days", type=int, default=KEEP_DAYS, help="keep at least this many days active")
+    compact_args.add_argument("--lzma", action="store_true", help="smaller segments, slower to write")
+    stats_args = commands.add_parser("stats", help="show the archived totals of one user")
+    stats_args.add_argument("user_id", type=int)
+    args = parser.parse_args()
+
+    backend = storage.get_storage()
+    if backend.name != "json":
+        print("Error: Archiving applies to the JSON history only; the SQLite history is already indexed.")
+        raise SystemExit(1)
+    path = storage.get_file_path("history.json")
+    archive = backend.history_archive(path)
+    if args.command == "compact":
+        log = backend.history_log(path)
+        before = os.path.getsize(log.path)
+        started = time.perf_counter()
+        archived, created = archive.compact(log, args.days, "lzma" if args.lzma else "gzip")
+        print(f"Archived {archived} games into {len(created)} segments ({', '.join(created) or 'none'}) "
+              f"in {time.perf_counter() - started:.2f}s; active log {before} -> {os.path.getsize(log.path)} bytes.")
+    else:
+        totals = archive.rollup(args.user_id)
+        if not totals:
+            print("No archived games for this user.")
+        for category, row in sorted(totals.items()):
+            print(f"{category}: {row['attempts']} attempts, accuracy {100 * row['accuracy']:.1f}%, "
+                  f"best {row['best_score']} ({str(row['best_date'])[:10]})")
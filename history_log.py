@@ -0,0 +1,463 @@
+import json
+import os
+import struct
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl  # POSIX only, lets several processes share one log
+except ImportError:
+    fcntl = None
+
+# Append-only quiz history.
+#   history.jsonl      one finished game per line, compact JSON
+#   history.jsonl.sum  one short summary line per game (id, category, score, date, size)
+#   history.jsonl.idx  header + one fixed-size (user_id, log offset, summary offset) record per game
+#   history.jsonl.base id of the last game before this log, once older games were archived
+#                      (the first game of the log gives it too; the file matters once the log is empty)
+# The two sidecars are only a cache of the log: anything missing from them (crash
+# between the writes, an old index format) is rebuilt from the log tail, and
+# sidecars that don't describe this log (crash in the middle of a rewrite) are
+# rebuilt from scratch.
+# Games get consecutive ids, so the log holds ids base + 1 .. base + count.
+
+INDEX_MAGIC = b"QHIDX002"
+INDEX_RECORD = struct.Struct("<qQQ")  # user_id (-1 for unknown), log offset, summary offset
+NO_USER = -1
+
+
+def log_path_for(json_path):
+    """history.json -> history.jsonl"""
+    root, ext = os.path.splitext(json_path)
+    return json_path if ext == ".jsonl" else root + ".jsonl"
+
+def summarize(entry):
+    """The part of a game shown in history lists, without the questions."""
+    return {
+        "id": entry.get("id"),
+        "category": entry.get("category"),
+        "score": entry.get("score"),
+        "date": entry.get("date"),
+        "questions": len(entry.get("questions", []))
+    }
+
+def fsync_dir(directory):
+    """Make the renames done in `directory` durable (Windows can't open a directory; skipped there)."""
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def _encode(data):
+    return (json.dumps(data, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+
+
+class HistoryLog:
+    """Append-only JSONL game log with per-user offset and summary indexes."""
+
+    def __init__(self, path):
+        self.path = path
+        self.index_path = path + ".idx"
+        self.summary_path = path + ".sum"
+        self.base_path = path + ".base"
+        self._lock = threading.RLock()
+        with self._lock, self._file_lock():
+            self._load_index()
+
+    @contextmanager
+    def _file_lock(self):
+        """Exclusive lock on the log shared with other processes (no-op without fcntl)."""
+        while True:
+            with open(self.path, 'ab') as file:
+                if fcntl is not None:
+                    fcntl.flock(file.fileno(), fcntl.LOCK_EX)
+                try:
+                    # The log may have been swapped by a rewrite while we waited: lock the new one
+                    if fcntl is None or os.fstat(file.fileno()).st_ino == os.stat(self.path).st_ino:
+                        yield
+                        return
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(file.fileno(), fcntl.LOCK_UN)
+
+    def _generation(self):
+        """Identity of the log and index files, which changes when a rewrite swaps them."""
+        try:
+            return os.stat(self.path).st_ino, os.stat(self.index_path).st_ino
+        except FileNotFoundError:
+            return None
+
+    # Index maintenance (callers hold self._lock and the file lock)
+    def _reset_memory(self):
+        self._games = {}          # user_id -> [(log offset, summary offset)], in log order
+        self._summaries = {}      # user_id -> [summary], built on first use
+        self._count = 0           # number of games indexed
+        self._indexed_end = 0     # byte offset just past the last indexed log line
+        self._summary_end = 0     # byte offset just past the last indexed summary line
+        self._index_size = len(INDEX_MAGIC)
+        self.id_base = 0          # id of the last game before this log (archived games)
+        self._loaded = None       # _generation() the index was loaded from
+
+    def _load_index(self):
+        self._reset_memory()
+        self.id_base = self._read_id_base()
+        records = []
+        if os.path.exists(self.index_path):
+            with open(self.index_path, 'rb') as file:
+                raw = file.read()
+            if raw[:len(INDEX_MAGIC)] == INDEX_MAGIC:
+                records = self._parse_records(raw, len(INDEX_MAGIC))
+
+        log_size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        summary_size = os.path.getsize(self.summary_path) if os.path.exists(self.summary_path) else 0
+        if records and not self._records_match(records, log_size, summary_size):
+            records = []  # the sidecars don't match this log, start over
+
+        # Drop anything past the last complete record (old format, torn writes, orphan summaries)
+        self._index_size = len(INDEX_MAGIC) + len(records) * INDEX_RECORD.size
+        with open(self.index_path, 'wb' if not records else 'r+b') as file:
+            if not records:
+                file.write(INDEX_MAGIC)
+            file.truncate(self._index_size)
+        self._apply_records(records)
+        with open(self.summary_path, 'ab') as file:
+            file.truncate(self._summary_end)
+        self._index_tail()
+        self._loaded = self._generation()
+
+    def _read_id_base(self):
+        """The id before the first game: taken from the log itself, the .base file only matters when it is empty."""
+        first = self._read_line(self.path, 0)
+        if isinstance(first, dict) and isinstance(first.get("id"), int):
+            return first["id"] - 1
+        try:
+            with open(self.base_path, 'r', encoding='utf-8') as file:
+                return int(file.read().strip() or 0)
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def _read_line(self, path, offset):
+        """The JSON line starting at `offset`, or None if there is no complete, valid line there."""
+        try:
+            with open(path, 'rb') as file:
+                file.seek(offset)
+                line = file.readline()
+        except FileNotFoundError:
+            return None
+        if not line.endswith(b"\n"):
+            return None
+        try:
+            return json.loads(line)
+        except ValueError:
+            return None
+
+    def _records_match(self, records, log_size, summary_size):
+        """True if the index records describe this log: the last one must point at the right game in both files."""
+        user_id, log_offset, summary_offset = records[-1]
+        if records[0][1:] != (0, 0) or log_offset >= log_size or summary_offset >= summary_size:
+            return False
+        game = self._read_line(self.path, log_offset) or {}
+        summary = self._read_line(self.summary_path, summary_offset) or {}
+        if game.get("user_id") != (None if user_id == NO_USER else user_id):
+            return False
+        return game.get("id") == summary.get("id") and game.get("id") in (self.id_base + len(records), None)
+
+    def _parse_records(self, raw, start):
+        usable = len(raw) - (len(raw) - start) % INDEX_RECORD.size  # ignore a torn trailing record
+        return [INDEX_RECORD.unpack_from(raw, pos) for pos in range(start, usable, INDEX_RECORD.size)]
+
+    def _apply_records(self, records):
+        for user_id, log_offset, summary_offset in records:
+            user = None if user_id == NO_USER else user_id
+            self._games.setdefault(user, []).append((log_offset, summary_offset))
+            cached = self._summaries.get(user)
+            if cached is not None:
+                cached.append(self._read_summary(log_offset, summary_offset))
+        self._count += len(records)
+        if records:
+            self._indexed_end = self._line_end(self.path, records[-1][1])
+            self._summary_end = self._line_end(self.summary_path, records[-1][2])
+
+    def _line_end(self, path, offset):
+        with open(path, 'rb') as file:
+            file.seek(offset)
+            return offset + len(file.readline())
+
+    def _read_index_tail(self):
+        """Load index records written by other processes since we last looked."""
+        if os.path.getsize(self.index_path) <= self._index_size:
+            return
+        with open(self.index_path, 'rb') as file:
+            file.seek(self._index_size)
+            raw = file.read()
+        records = self._parse_records(raw, 0)
+        self._index_size += len(records) * INDEX_RECORD.size
+        self._apply_records(records)
+
+    def _index_tail(self):
+        """Index every complete log line written after `_indexed_end`."""
+        if not os.path.exists(self.path) or os.path.getsize(self.path) <= self._indexed_end:
+            return
+        entries = []
+        with open(self.path, 'rb') as file:
+            file.seek(self._indexed_end)
+            offset = self._indexed_end
+            for line in file:
+                if not line.endswith(b"\n"):
+                    break  # torn write, it will be cut off before the next append
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    entry = {"user_id": None}  # keep the slot so ids stay in sync with line numbers
+                entries.append((entry, offset))
+                offset += len(line)
+        self._write_index(entries)
+
+    def _write_index(self, entries):
+        """Append the summary lines and index records of (game, log offset) pairs."""
+        if not entries:
+            return
+        summary_lines = []
+        records = []
+        summary_offset = self._summary_end
+        for entry, log_offset in entries:
+            line = _encode(summarize(entry))
+            user_id = entry.get("user_id")
+            records.append((NO_USER if user_id is None else user_id, log_offset, summary_offset))
+            summary_lines.append(line)
+            summary_offset += len(line)
+        with open(self.summary_path, 'ab') as file:
+            file.write(b"".join(summary_lines))
+        with open(self.index_path, 'ab') as file:
+            file.write(b"".join(INDEX_RECORD.pack(*record) for record in records))
+        self._index_size += len(records) * INDEX_RECORD.size
+        self._apply_records(records)
+
+    def refresh(self):
+        """Pick up games appended by other processes, or reload after a rewrite."""
+        with self._lock:
+            if self._generation() != self._loaded:
+                with self._file_lock():
+                    self._load_index()
+                return
+            self._read_index_tail()
+            if os.path.exists(self.path) and os.path.getsize(self.path) > self._indexed_end:
+                with self._file_lock():
+                    self._read_index_tail()
+                    self._index_tail()
+
+    # Writing
+    def append(self, entry, sync=True):
+        """Append one game and return its history id."""
+        return self.append_many([entry], sync=sync)[0]
+
+    def append_many(self, entries, sync=True):
+        """Append several games with a single write, returning their history ids."""
+        with self._lock, self._file_lock():
+            if self._generation() != self._loaded:
+                self._load_index()
+            self._read_index_tail()
+            self._index_tail()
+            with open(self.path, 'ab') as file:
+                file.seek(0, os.SEEK_END)
+                if file.tell() != self._indexed_end:
+                    file.truncate(self._indexed_end)  # drop a torn line left by a crash
+
+                ids = []
+                lines = []
+                indexed = []
+                offset = self._indexed_end
+                for entry in entries:
+                    entry = {"id": self.id_base + self._count + len(ids) + 1,
+                             **{k: v for k, v in entry.items() if k != "id"}}
+                    line = _encode(entry)
+                    indexed.append((entry, offset))
+                    ids.append(entry["id"])
+                    lines.append(line)
+                    offset += len(line)
+
+                file.write(b"".join(lines))
+                file.flush()
+                if sync:
+                    os.fsync(file.fileno())
+            self._write_index(indexed)
+            return ids
+
+    def rewrite(self, entries, id_base=None):
+        """Replace the whole log with `entries` (games keeping their ids), e.g. after a format migration.
+
+        The new log and its sidecars are built next to the old ones and swapped in
+        under the file lock; other processes reload when they see the swap.
+        """
+        with self._lock, self._file_lock():
+            self._replace(entries, self.id_base if id_base is None else id_base)
+
+    def drop_through(self, last_id):
+        """Remove the games with an id up to `last_id` (archived elsewhere) from the log."""
+        with self._lock, self._file_lock():
+            if self._generation() != self._loaded:
+                self._load_index()
+            self._index_tail()
+            if last_id <= self.id_base:
+                return 0
+            kept = [game for game, _ in self._iter_lines(0) if game.get("id", 0) > last_id]
+            dropped = self._count - len(kept)
+            self._replace(kept, max(last_id, self.id_base))
+            return dropped
+
+    def _replace(self, entries, id_base):
+        new_path = self.path + ".new"
+        for leftover in (new_path, new_path + ".idx", new_path + ".sum", new_path + ".base"):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+        with open(new_path, 'wb') as file:
+            file.write(b"".join(_encode(entry) for entry in entries))
+            file.flush()
+            os.fsync(file.fileno())
+        with open(new_path + ".base", 'w', encoding='utf-8') as file:
+            file.write(str(id_base))
+            file.flush()
+            os.fsync(file.fileno())
+        HistoryLog(new_path)  # builds the sidecars of the new log
+        # The id base first (the log's first game overrides it, so it can't pair with the wrong log),
+        # then the log, then its sidecars: after a crash in between, _load_index() sees that
+        # the old sidecars don't match the new log and rebuilds them.
+        os.replace(new_path + ".base", self.base_path)
+        os.replace(new_path, self.path)
+        for sidecar in (".sum", ".idx"):
+            os.replace(new_path + sidecar, self.path + sidecar)
+        fsync_dir(os.path.dirname(os.path.abspath(self.path)))
+        self._load_index()
+
+    # Reading
+    def _read_summary(self, log_offset, summary_offset):
+        with open(self.summary_path, 'rb') as file:
+            file.seek(summary_offset)
+            summary = json.loads(file.readline())
+        summary["ref"] = log_offset  # what read_game() needs to fetch the full record
+        return summary
+
+    def read_game(self, ref):
+        """The full record of the game stored at log offset `ref`."""
+        with open(self.path, 'rb') as file:
+            file.seek(ref)
+            return json.loads(file.readline())
+
+    def user_offsets(self, user_id):
+        self.refresh()
+        with self._lock:
+            return [log_offset for log_offset, _ in self._games.get(user_id, [])]
+
+    def read_offsets(self, offsets):
+        if not offsets:
+            return []
+        with open(self.path, 'rb') as file:
+            games = []
+            for offset in offsets:
+                file.seek(offset)
+                games.append(json.loads(file.readline()))
+            return games
+
+    def read_user(self, user_id):
+        """Return the games of one user, oldest first, reading only their lines."""
+        return self.read_offsets(self.user_offsets(user_id))
+
+    def user_summaries(self, user_id):
+        """Summaries of one user's games, oldest first, from the summary sidecar."""
+        self.refresh()
+        with self._lock:
+            cached = self._summaries.get(user_id)
+            if cached is None:
+                pairs = self._games.get(user_id, [])
+                cached = []
+                if pairs:
+                    with open(self.summary_path, 'rb') as file:
+                        for log_offset, summary_offset in pairs:
+                            file.seek(summary_offset)
+                            summary = json.loads(file.readline())
+                            summary["ref"] = log_offset
+                            cached.append(summary)
+                self._summaries[user_id] = cached
+            return list(cached)
+
+    def iter_all(self):
+        """Stream every game in the log, oldest first."""
+        for game, _ in self.iter_from(0):
+            yield game
+
+    def iter_from(self, offset=0):
+        """Stream (game, end offset) pairs for complete lines starting at byte `offset`.
+
+        The end offset can be passed back later to resume after the last game read.
+        """
+        self.refresh()
+        yield from self._iter_lines(offset)
+
+    def _iter_lines(self, offset):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'rb') as file:
+            file.seek(offset)
+            for line in file:
+                if not line.endswith(b"\n"):
+                    return
+                offset += len(line)
+                try:
+                    yield json.loads(line), offset
+                except ValueError:
+                    continue
+
+    def __len__(self):
+        self.refresh()
+        return self._count
+
+
+def filter_summaries(summaries, category=None, date_from=None, date_to=None):
+    """Game summaries matching the filters, newest first.
+
+    `date_from`/`date_to` are datetime.date objects, both inclusive.
+    """
+    start = date_from.isoformat() if date_from else None
+    end = date_to.isoformat() if date_to else None
+    return [
+        summary for summary in reversed(summaries)
+        if (category is None or summary["category"] == category)
+        and (start is None or str(summary["date"])[:10] >= start)
+        and (end is None or str(summary["date"])[:10] <= end)
+    ]
+
+def filter_page(summaries, page=1, page_size=10, category=None, date_from=None, date_to=None):
+    """Newest-first page of game summaries, with the number of matching games."""
+    matching = filter_summaries(summaries, category, date_from, date_to)
+    first = (page - 1) * page_size
+    return matching[first:first + page_size], len(matching)
+
+def import_json_history(json_path, log):
+    """Seed an empty log from the legacy indented history.json list."""
+    try:
+        with open(json_path, 'r', encoding='utf-8') as file:
+            history = json.load(file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return 0
+    if not isinstance(history, list) or not history:
+        return 0
+    log.append_many(history)
+    return len(history)
+
+
+if __name__ == "__main__":
+    import sys
+
+    # python history_log.py reindex [history.jsonl]: rebuild the sidecars from scratch
+    if len(sys.argv) >= 2 and sys.argv[1] == "reindex":
+        path = sys.argv[2] if len(sys.argv) > 2 else "history.jsonl"
+        for sidecar in (path + ".idx", path + ".sum"):
+            if os.path.exists(sidecar):
+                os.remove(sidecar)
+        print(f"Indexed {len(HistoryLog(path))} games in '{path}'.")
+    else:
+        print("Usage: python history_log.py reindex [history.jsonl]")
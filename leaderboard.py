@@ -0,0 +1,203 @@
+import atexit
+import datetime
+import heapq
+import itertools
+import threading
+import time
+
+import quiz_app as qa
+import storage
+
+# Leaderboards per category ("*" for all categories) and per time window
+# (today, this ISO week, all time). Each board is a min-heap of the K best
+# results, so recording a game costs O(log K) per board and reading a board
+# costs O(K). Boards are fed by quiz_app when a game is stored and kept in
+# memory; a background thread saves them to leaderboard.json every
+# SAVE_INTERVAL seconds and at exit. Workers share the file: before saving,
+# and before showing a board, a process merges in what the others saved.
+# The boards can be rebuilt from the history at any time.
+
+TOP_K = 10
+ALL_CATEGORIES = "*"
+WINDOWS = ["day", "week", "all"]
+KEEP_WINDOWS = {"day": 14, "week": 8}  # older day/week boards are dropped
+SAVE_INTERVAL = 5
+
+
+def parse_score(score):
+    """'7/10' -> (7, 10)"""
+    try:
+        correct, total = str(score).split("/")
+        return int(correct), int(total)
+    except ValueError:
+        return 0, 0
+
+def window_keys(date):
+    """The board keys a game played at `date` counts for."""
+    return {
+        "day": date.strftime("%Y-%m-%d"),
+        "week": "%d-W%02d" % date.isocalendar()[:2],
+        "all": "all"
+    }
+
+def _game_id(entry):
+    """What identifies a game on a board: its history id, or all of its fields for a game stored without one."""
+    if entry["id"] is not None:
+        return entry["id"]
+    return (entry["user_id"], entry["category"], entry["correct"], entry["total"], entry["date"])
+
+def _parse_date(value):
+    try:
+        return datetime.datetime.fromisoformat(str(value))
+    except ValueError:
+        return datetime.datetime.now()
+
+
+class Leaderboards:
+    """Top-K results for every (category, window) pair."""
+
+    def __init__(self, filename='leaderboard.json', k=TOP_K):
+        self.file_path = qa.get_file_path(filename)
+        self.k = k
+        self._lock = threading.Lock()
+        # "category|window|key" -> heap of (fraction, correct, -timestamp, history id, tiebreak, entry)
+        self._boards = {}
+        self._ids = {}  # "category|window|key" -> ids of the games on the board, for O(1) duplicate checks
+        self._tiebreak = itertools.count()
+        self._dirty = False
+        self._signature = None
+        self._merge_file()
+
+    def _merge_file(self):
+        """Add the results saved by other processes, if the file changed since we last read or wrote it."""
+        signature = storage.file_signature(self.file_path)
+        if signature == self._signature:
+            return
+        for board_key, entries in storage.read_json(self.file_path, {}).get("boards", {}).items():
+            for entry in entries:
+                self._offer(board_key, self._rank(entry))
+        self._signature = signature
+
+    def _offer(self, board_key, ranked):
+        heap = self._boards.setdefault(board_key, [])
+        ids = self._ids.setdefault(board_key, set())
+        game_id = _game_id(ranked[5])
+        if game_id in ids:
+            return  # the same game, already merged from the file or replayed
+        if len(heap) < self.k:
+            heapq.heappush(heap, ranked)
+        elif ranked[:5] > heap[0][:5]:
+            ids.discard(_game_id(heapq.heapreplace(heap, ranked)[5]))
+        else:
+            return
+        ids.add(game_id)
+
+    def _rank(self, entry):
+        # Higher share first, then more correct answers, then the earlier game
+        timestamp = _parse_date(entry["date"]).timestamp()
+        return (entry["fraction"], entry["correct"], -timestamp, entry["id"] or 0, next(self._tiebreak), entry)
+
+    def record(self, game):
+        """Add a stored game (with its history id) to every board it belongs to, in memory."""
+        with self._lock:
+            correct, total = parse_score(game.get("score"))
+            if total <= 0:
+                return False
+            date = _parse_date(game.get("date"))
+            entry = {
+                "id": game.get("id"),
+                "user_id": game.get("user_id"),
+                "category": game.get("category"),
+                "correct": correct,
+                "total": total,
+                "fraction": correct / total,
+                "date": str(date)
+            }
+            ranked = self._rank(entry)
+            for category in (game.get("category"), ALL_CATEGORIES):
+                for window, key in window_keys(date).items():
+                    self._offer(f"{category}|{window}|{key}", ranked)
+            self._dirty = True
+        return True
+
+    def _prune(self, now):
+        for window, keep in KEEP_WINDOWS.items():
+            step = datetime.timedelta(days=1 if window == "day" else 7)
+            recent = {window_keys(now - step * i)[window] for i in range(keep)}
+            for board_key in [b for b in self._boards if b.split("|")[1] == window]:
+                if board_key.split("|")[2] not in recent:
+                    del self._boards[board_key]
+                    self._ids.pop(board_key, None)
+
+    def top(self, category=None, window="all", now=None):
+        """Best results of a board, best first."""
+        key = window_keys(now or datetime.datetime.now())[window]
+        with self._lock:
+            self._merge_file()
+            heap = self._boards.get(f"{category or ALL_CATEGORIES}|{window}|{key}", [])
+            ranked = sorted(heap, key=lambda item: item[:5], reverse=True)
+        return [item[5] for item in ranked]
+
+    def save(self, replace=False):
+        """Write the boards if games were recorded since the last save.
+
+        Results saved meanwhile by other processes are merged in first, unless
+        `replace` is set (rebuild).
+        """
+        with self._lock, storage.file_lock(self.file_path):
+            if not self._dirty and not replace:
+                return
+            if not replace:
+                self._merge_file()
+            self._prune(datetime.datetime.now())
+            boards = {board_key: [item[5] for item in heap] for board_key, heap in self._boards.items()}
+            storage.write_json_atomic(self.file_path, {"boards": boards}, indent=2)
+            self._signature = storage.file_signature(self.file_path)
+            self._dirty = False
+
+    def rebuild(self, filename='history.json'):
+        """Recompute every board from the quiz history."""
+        with self._lock:
+            self._boards = {}
+            self._ids = {}
+            self._signature = storage.file_signature(self.file_path)  # don't merge the outdated boards back
+        count = 0
+        for game, _ in storage.get_storage().history_since(qa.get_file_path(filename)):
+            count += self.record(game)
+        self.save(replace=True)
+        return count
+
+
+def _save_forever(boards, interval):
+    while True:
+        time.sleep(interval)
+        try:
+            boards.save()
+        except OSError as e:
+            print(f"Error: Could not save the leaderboards: {e}")
+
+_leaderboards = None
+_leaderboards_lock = threading.Lock()
+
+def get_leaderboards():
+    """The process-wide leaderboards, saved in the background."""
+    global _leaderboards
+    if _leaderboards is None:
+        with _leaderboards_lock:
+            if _leaderboards is None:
+                boards = Leaderboards()
+                threading.Thread(target=_save_forever, args=(boards, SAVE_INTERVAL), daemon=True,
+                                 name="leaderboard-save").start()
+                atexit.register(boards.save)
+                _leaderboards = boards
+    return _leaderboards
+
+
+if __name__ == "__main__":
+    import sys
+
+    # python leaderboard.py rebuild: recompute the boards from the quiz history
+    if len(sys.argv) >= 2 and sys.argv[1] == "rebuild":
+        print(f"Ranked {get_leaderboards().rebuild()} games.")
+    else:
+        print("Usage: python leaderboard.py rebuild")
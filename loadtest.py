@@ -0,0 +1,269 @@
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import history_log
+import question_ids
+import quiz_app as qa
+import result_writer
+import sampler
+import storage
+import user_functions as uf
+
+# Headless load generator for the quiz flow:
+#   sign up -> log in -> pick a category -> answer N questions -> store the game
+# for many simulated students, using threads, processes or asyncio tasks. It
+# runs against the real storage layer (JSON files or SQLite, as selected with
+# QCM_STORAGE) in a scratch directory, so the app's own users, history and
+# leaderboards are never touched. The bank is copied there from the app.
+#
+#   python loadtest.py --mode threads --users 2000 --concurrency 64
+#   python loadtest.py --mode asyncio --users 5000 --concurrency 1000 --think 5
+#
+# The report gives throughput and p50/p95/p99 latency per stage, then checks the
+# stored history against what the simulated students did: lost, duplicated and
+# corrupted games.
+
+STAGES = ["signup", "login", "category", "answer", "store", "session"]
+PASSWORD = "load-test"
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(int(round(fraction * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+class Scratch:
+    """Paths of the scratch data set a load test runs against."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.users = os.path.join(directory, "users.json")
+        self.bank = os.path.join(directory, "qcm.json")
+        self.history = os.path.join(directory, "history.json")
+
+    def prepare(self, data):
+        """Start with the bank `data`, no users and no games."""
+        storage.write_json_atomic(self.users, [], indent=2)
+        storage.write_json_atomic(self.history, [], indent=2)
+        storage.write_json_atomic(self.bank, data, indent=2)
+        backend = storage.get_storage()
+        if backend.name == "sqlite":
+            backend.save_bank(self.bank, data)
+
+
+def run_session(scratch, username, num_questions, think, use_writer, rng):
+    """One simulated student. Returns ({stage: seconds}, expected game) for the report."""
+    timings = {}
+    started = time.perf_counter()
+
+    store = uf.get_user_store(scratch.users)
+    step = time.perf_counter()
+    store.add(username, PASSWORD)
+    timings["signup"] = time.perf_counter() - step
+
+    step = time.perf_counter()
+    if not uf.login(username, PASSWORD, scratch.users):
+        raise RuntimeError(f"login failed for '{username}'")
+    user_id = store.find(username)["id"]
+    timings["login"] = time.perf_counter() - step
+
+    step = time.perf_counter()
+    categories = [c for c in qa.bank_cache.get_categories(scratch.bank) if c.get("count", 1)]
+    category = qa.bank_cache.get_category(scratch.bank, rng.choice(categories)["id"])
+    timings["category"] = time.perf_counter() - step
+
+    step = time.perf_counter()
+    seed = sampler.new_seed()
+    answers = []
+    score = 0
+    for question in sampler.draw(category["questions"], num_questions, seed):
+        if think:
+            time.sleep(think)
+        answer = rng.choice("abcd")
+        is_correct = answer == question.get("correct_answer")
+        score += is_correct
+        answers.append(question_ids.answer_record(question, answer, is_correct))
+    timings["answer"] = time.perf_counter() - step - think * len(answers)
+
+    step = time.perf_counter()
+    entry = qa.make_history_entry(user_id, category["name"], answers, f"{score}/{len(answers)}", seed, num_questions)
+    if use_writer:
+        result_writer.get_result_writer().submit(scratch.history, entry).result()
+    else:
+        storage.get_storage().append_history(scratch.history, entry)
+    timings["store"] = time.perf_counter() - step
+    timings["session"] = time.perf_counter() - started - think * len(answers)
+    return timings, {"user_id": user_id, "score": entry["score"], "answers": len(answers)}
+
+
+def _session_or_error(args):
+    scratch, username, num_questions, think, use_writer = args
+    try:
+        return run_session(scratch, username, num_questions, think, use_writer, random.Random(username))
+    except Exception as e:
+        return None, f"{username}: {type(e).__name__}: {e}"
+
+def run_threads(scratch, usernames, concurrency, num_questions, think, use_writer):
+    jobs = [(scratch, name, num_questions, think, use_writer) for name in usernames]
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        return list(pool.map(_session_or_error, jobs))
+
+def _process_chunk(args):
+    scratch, usernames, threads, num_questions, think, use_writer = args
+    results = run_threads(scratch, usernames, threads, num_questions, think, use_writer)
+    result_writer.get_result_writer().flush()
+    return results
+
+def run_processes(scratch, usernames, concurrency, num_questions, think, use_writer):
+    """`concurrency` worker processes, each running its share of the students on a few threads."""
+    processes = min(concurrency, os.cpu_count() or 1)
+    threads = max(concurrency // processes, 1)
+    chunks = [usernames[i::processes] for i in range(processes)]
+    with multiprocessing.Pool(processes) as pool:
+        parts = pool.map(_process_chunk, [(scratch, chunk, threads, num_questions, think, use_writer)
+                                          for chunk in chunks])
+    return [result for part in parts for result in part]
+
+def run_asyncio(scratch, usernames, concurrency, num_questions, think, use_writer):
+    """Many concurrent sessions on one event loop; blocking storage calls go to a thread pool."""
+
+    async def main():
+        loop = asyncio.get_running_loop()
+        loop.set_default_executor(ThreadPoolExecutor(max_workers=min(concurrency, 64)))
+        limit = asyncio.Semaphore(concurrency)
+
+        async def session(username):
+            async with limit:
+                # Thinking happens on the event loop, only the work itself uses a thread
+                job = (scratch, username, num_questions, 0, use_writer)
+                if think:
+                    await asyncio.sleep(think * num_questions)
+                return await loop.run_in_executor(None, _session_or_error, job)
+
+        return await asyncio.gather(*(session(name) for name in usernames))
+
+    return asyncio.run(main())
+
+MODES = {"threads": run_threads, "processes": run_processes, "asyncio": run_asyncio}
+
+
+def verify(scratch, expected):
+    """Compare the stored history with the games the simulated students played."""
+    backend = storage.get_storage()
+    stored = {}
+    corrupted = 0
+    if backend.name == "json":
+        # Read the raw log so torn or interleaved lines are counted, not skipped
+        log_path = history_log.log_path_for(scratch.history)
+        with open(log_path, 'rb') as file:
+            for line in file:
+                try:
+                    game = json.loads(line)
+                except ValueError:
+                    corrupted += 1
+                    continue
+                stored.setdefault(game.get("user_id"), []).append(game)
+    else:
+        for game, _ in backend.history_since(scratch.history):
+            stored.setdefault(game.get("user_id"), []).append(game)
+
+    lost = duplicated = 0
+    for game in expected:
+        copies = stored.get(game["user_id"], [])  # every simulated student plays exactly once
+        if not copies:
+            lost += 1
+            continue
+        duplicated += len(copies) - 1
+        if any(copy.get("score") != game["score"] or len(copy.get("questions", [])) != game["answers"]
+               for copy in copies):
+            corrupted += 1
+    ids = [copy.get("id") for copies in stored.values() for copy in copies]
+    return {
+        "expected": len(expected),
+        "stored": sum(len(copies) for copies in stored.values()),
+        "lost": lost,
+        "duplicated": duplicated,
+        "corrupted": corrupted,
+        "duplicate_ids": len(ids) - len(set(ids))
+    }
+
+def report(results, elapsed):
+    timings = {stage: [] for stage in STAGES}
+    errors = []
+    for result, problem in results:
+        if result is None:
+            errors.append(problem)
+            continue
+        for stage, seconds in result.items():
+            timings[stage].append(seconds)
+
+    print(f"{'stage':<9} {'count':>7} {'ops/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for stage in STAGES:
+        values = sorted(timings[stage])
+        if not values:
+            continue
+        print(f"{stage:<9} {len(values):>7} {len(values) / elapsed:>9.1f} "
+              + " ".join(f"{1000 * percentile(values, p):>9.2f}" for p in (0.50, 0.95, 0.99))
+              + f" {1000 * values[-1]:>9.2f}")
+    if errors:
+        print(f"\n{len(errors)} sessions failed, for example:")
+        for problem in errors[:5]:
+            print("  " + problem)
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Simulate concurrent quiz sessions against the storage layer")
+    parser.add_argument("--mode", choices=sorted(MODES), default="threads")
+    parser.add_argument("--users", type=int, default=1000, help="simulated students (one session each)")
+    parser.add_argument("--concurrency", type=int, default=32, help="threads, processes or concurrent tasks")
+    parser.add_argument("--questions", type=int, default=10, help="questions answered per session")
+    parser.add_argument("--think", type=float, default=0.0, help="think time per question, in ms")
+    parser.add_argument("--writer", action="store_true", help="store games through the background group-commit writer")
+    parser.add_argument("--dir", default=None, help="scratch directory (default: a new temporary one)")
+    parser.add_argument("--keep", action="store_true", help="keep the scratch directory afterwards")
+    args = parser.parse_args()
+
+    directory = args.dir or tempfile.mkdtemp(prefix="qcm-load-")
+    os.makedirs(directory, exist_ok=True)
+    data = qa.load_bank()  # from the app's own backend, before switching to the scratch one
+    if storage.get_storage().name == "sqlite":
+        os.environ[storage.DB_PATH_ENV] = os.path.join(directory, "qcm.db")  # inherited by worker processes
+        storage.set_storage(storage.make_storage("sqlite"))
+    scratch = Scratch(directory)
+    scratch.prepare(data)
+
+    backend = storage.get_storage()
+    print(f"{args.users} sessions, mode {args.mode}, concurrency {args.concurrency}, {args.questions} questions, "
+          f"backend {backend.name}{', background writer' if args.writer else ''}, data in {directory}\n")
+    usernames = [f"load-{i:06d}" for i in range(args.users)]
+    started = time.perf_counter()
+    results = MODES[args.mode](scratch, usernames, args.concurrency, args.questions, args.think / 1000, args.writer)
+    result_writer.get_result_writer().flush()
+    elapsed = time.perf_counter() - started
+
+    report(results, elapsed)
+    integrity = verify(scratch, [game for result, game in results if result is not None])
+    print(f"\n{len(results) / elapsed:.1f} sessions/s over {elapsed:.2f}s")
+    print("History: " + ", ".join(f"{key} {value}" for key, value in integrity.items()))
+    if args.writer:
+        print("Writer: " + ", ".join(f"{key} {value:.2f}" if isinstance(value, float) else f"{key} {value}"
+                                     for key, value in result_writer.get_result_writer().stats().items()))
+
+    if not (args.keep or args.dir):
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
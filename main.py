@@ -10,7 +10,9 @@ def admin_menu():
         print("2. Add a question")
         print("3. Delete a category")
         print("4. Delete a question")
-        print("5. Exit")
+        print("5. Import questions (CSV/JSONL)")
+        print("6. Export questions (CSV/JSONL)")
+        print("7. Exit")
         choice = input("Enter your choice: ").strip()
 
         if choice == "1":
@@ -22,6 +24,10 @@ def admin_menu():
         elif choice == "4":
             af.delete_question('qcm.json')
         elif choice == "5":
+            af.import_questions('qcm.json')
+        elif choice == "6":
+            af.export_questions('qcm.json')
+        elif choice == "7":
             break
         else:
             print("Invalid choice. Please try again.")
@@ -1,11 +1,20 @@
 # -*- mode: python ; coding: utf-8 -*-
+import os
+import sys
 
+sys.path.insert(0, SPECPATH)
+import bank_snapshot
+
+# Precompile the question bank so the executable doesn't parse qcm.json at startup.
+# Paths are relative to this file, not to the directory PyInstaller is run from.
+# The bundled qcm.bank is extracted to sys._MEIPASS, where bank_snapshot looks for it.
+bank_snapshot.build(os.path.join(SPECPATH, 'qcm.json'))
 
 a = Analysis(
     ['main.py'],
     pathex=[],
     binaries=[],
-    datas=[('users.json', '.'), ('history.json', '.'), ('qcm.json', '.')],
+    datas=[('users.json', '.'), ('history.json', '.'), ('qcm.json', '.'), ('qcm.bank', '.')],
     hiddenimports=[],
     hookspath=[],
     hooksconfig={},
@@ -0,0 +1,234 @@
+import atexit
+import bisect
+import json
+import os
+import threading
+import time
+from contextlib import nullcontext
+from functools import wraps
+
+# Lightweight instrumentation of the hot paths (file I/O and quiz steps).
+# Switched on with QCM_METRICS=1; otherwise @timed returns the function
+# unchanged and timer() a shared no-op context, so disabled metrics cost
+# nothing on decorated functions and one attribute lookup elsewhere.
+# Each metric name gets a call count, a latency histogram and byte counters.
+# While enabled, a background thread writes every QCM_METRICS_INTERVAL seconds
+#   metrics.json : snapshot with counts, p50/p95/p99 and raw buckets
+#   metrics.prom : the same in Prometheus text format (textfile collector)
+# and the API server exposes the live values on GET /metrics.
+# QCM_PROFILE=<file> additionally captures a cProfile of the instrumented calls
+# (one thread at a time), saved to <file> with each snapshot and at exit:
+#   python -m pstats qcm.prof
+
+METRICS_ENV = "QCM_METRICS"
+METRICS_FILE_ENV = "QCM_METRICS_FILE"
+INTERVAL_ENV = "QCM_METRICS_INTERVAL"
+PROFILE_ENV = "QCM_PROFILE"
+DEFAULT_METRICS_FILE = "metrics.json"
+
+ENABLED = os.environ.get(METRICS_ENV, "").strip().lower() not in ("", "0", "false", "no")
+PROFILE_PATH = os.environ.get(PROFILE_ENV) or None
+
+# Latency bucket upper bounds in seconds, 100 us to 10 s
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Metric:
+    __slots__ = ("count", "total", "buckets", "bytes_read", "bytes_written")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.buckets = [0] * (len(BUCKETS) + 1)  # the last one is +Inf
+        self.bytes_read = 0
+        self.bytes_written = 0
+
+    def quantile(self, fraction):
+        """Upper bound of the bucket holding the given fraction of the calls."""
+        if not self.count:
+            return 0.0
+        rank = fraction * self.count
+        seen = 0
+        for bound, hits in zip(BUCKETS + (float("inf"),), self.buckets):
+            seen += hits
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+
+_lock = threading.Lock()
+_metrics = {}
+
+def _metric(name):
+    metric = _metrics.get(name)
+    if metric is None:
+        metric = _metrics.setdefault(name, Metric())
+    return metric
+
+def observe(name, seconds):
+    with _lock:
+        metric = _metric(name)
+        metric.count += 1
+        metric.total += seconds
+        metric.buckets[bisect.bisect_left(BUCKETS, seconds)] += 1
+
+def count_bytes(name, read=0, written=0):
+    """Bytes moved by an instrumented call; callers check ENABLED first."""
+    with _lock:
+        metric = _metric(name)
+        metric.bytes_read += read
+        metric.bytes_written += written
+
+
+# cProfile capture: only one thread profiles at a time, nested calls are part of the outer one
+_profiler = None
+_profiler_lock = threading.Lock()
+_profiling = threading.local()
+
+def _profiled(call):
+    if getattr(_profiling, "active", False) or not _profiler_lock.acquire(blocking=False):
+        return call()
+    _profiling.active = True
+    _profiler.enable()
+    try:
+        return call()
+    finally:
+        _profiler.disable()
+        _profiling.active = False
+        _profiler_lock.release()
+
+def save_profile():
+    if _profiler is None:
+        return
+    with _profiler_lock:
+        _profiler.dump_stats(PROFILE_PATH)
+
+
+class _Timer:
+    __slots__ = ("name", "started")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observe(self.name, time.perf_counter() - self.started)
+        return False
+
+_disabled = nullcontext()
+
+def timer(name):
+    """Context manager timing a block under `name`."""
+    return _Timer(name) if ENABLED else _disabled
+
+def timed(name):
+    """Decorator recording the latency of every call under `name`."""
+    def decorate(function):
+        if not ENABLED:
+            return function
+
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                if _profiler is not None:
+                    return _profiled(lambda: function(*args, **kwargs))
+                return function(*args, **kwargs)
+            finally:
+                observe(name, time.perf_counter() - started)
+        return wrapper
+    return decorate
+
+
+# Export
+def snapshot():
+    with _lock:
+        return {
+            "time": time.time(),
+            "buckets": list(BUCKETS),
+            "metrics": {
+                name: {
+                    "count": m.count,
+                    "sum": round(m.total, 6),
+                    "p50": m.quantile(0.50),
+                    "p95": m.quantile(0.95),
+                    "p99": m.quantile(0.99),
+                    "bytes_read": m.bytes_read,
+                    "bytes_written": m.bytes_written,
+                    "histogram": list(m.buckets)
+                }
+                for name, m in sorted(_metrics.items())
+            }
+        }
+
+def prometheus_text(data=None):
+    """Metrics in the Prometheus text exposition format (from a snapshot, or the live values)."""
+    data = data or snapshot()
+    lines = ["# HELP qcm_call_duration_seconds Latency of instrumented calls.",
+             "# TYPE qcm_call_duration_seconds histogram"]
+    for name, m in data["metrics"].items():
+        cumulative = 0
+        for bound, hits in zip(data["buckets"] + ["+Inf"], m["histogram"]):
+            cumulative += hits
+            lines.append(f'qcm_call_duration_seconds_bucket{{name="{name}",le="{bound}"}} {cumulative}')
+        lines.append(f'qcm_call_duration_seconds_sum{{name="{name}"}} {m["sum"]}')
+        lines.append(f'qcm_call_duration_seconds_count{{name="{name}"}} {m["count"]}')
+    for kind in ("read", "written"):
+        lines.append(f"# HELP qcm_bytes_{kind}_total Bytes {kind} by instrumented calls.")
+        lines.append(f"# TYPE qcm_bytes_{kind}_total counter")
+        lines.extend(f'qcm_bytes_{kind}_total{{name="{name}"}} {m["bytes_" + kind]}'
+                     for name, m in data["metrics"].items() if m["bytes_" + kind])
+    return "\n".join(lines) + "\n"
+
+def write_snapshot(path=None):
+    """Write metrics.json and metrics.prom (and the profile, when capturing)."""
+    path = path or os.environ.get(METRICS_FILE_ENV) or _default_path()
+    data = snapshot()
+    for target, text in ((path, json.dumps(data, indent=2)),
+                         (os.path.splitext(path)[0] + ".prom", prometheus_text(data))):
+        tmp_path = target + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            file.write(text)
+        os.replace(tmp_path, target)
+    save_profile()
+
+def _default_path():
+    import storage  # late: storage itself is instrumented
+    return storage.get_file_path(DEFAULT_METRICS_FILE)
+
+def _snapshot_forever(interval):
+    while True:
+        time.sleep(interval)
+        try:
+            write_snapshot()
+        except OSError as e:
+            print(f"Error: Could not write the metrics snapshot: {e}")
+
+
+if ENABLED:
+    if PROFILE_PATH:
+        import cProfile
+        _profiler = cProfile.Profile()
+    threading.Thread(target=_snapshot_forever, args=(float(os.environ.get(INTERVAL_ENV, 60)),), daemon=True,
+                     name="metrics-snapshot").start()
+    atexit.register(write_snapshot)
+
+
+if __name__ == "__main__":
+    import sys
+
+    # python metrics.py [metrics.json]: print a saved snapshot as a table
+    path = sys.argv[1] if len(sys.argv) > 1 else _default_path()
+    try:
+        with open(path, encoding='utf-8') as file:
+            data = json.load(file)
+    except FileNotFoundError:
+        print(f"Error: No metrics snapshot at '{path}' (run the app with {METRICS_ENV}=1).")
+        sys.exit(1)
+    print(f"{'name':<28} {'calls':>8} {'total s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'read':>10} {'written':>10}")
+    for name, m in data["metrics"].items():
+        print(f"{name:<28} {m['count']:>8} {m['sum']:>9.3f} {1000 * m['p50']:>8.2f} {1000 * m['p95']:>8.2f} "
+              f"{1000 * m['p99']:>8.2f} {m['bytes_read']:>10} {m['bytes_written']:>10}")
@@ -0,0 +1,180 @@
+import hashlib
+import json
+import uuid
+
+import quiz_app as qa
+import storage
+
+# Stable question identities and compact history records.
+# Every question gets a "uid" that never changes, unlike its per-category "id"
+# which only orders the admin lists. A history answer is stored as
+#     [uid, user_answer, correct (0/1), content hash]
+# instead of a copy of the question text. expand_entry() turns such records back
+# into the {"question", "user_answer", "is_correct"} shape used for display.
+
+HASH_LENGTH = 12
+
+
+def new_uid():
+    return uuid.uuid4().hex[:16]
+
+def content_hash(question):
+    """Short hash of what the user actually saw: text, options and correct answer."""
+    payload = json.dumps(
+        [question.get('question'), [(opt['id'], opt['text']) for opt in question.get('options', [])],
+         question.get('correct_answer')],
+        ensure_ascii=False, separators=(",", ":")
+    )
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:HASH_LENGTH]
+
+def ensure_uids(data):
+    """Give every question of a bank without a uid a new one. Returns how many were added."""
+    added = 0
+    for category in data.get("categories", []):
+        for question in category.get("questions", []):
+            if not question.get("uid"):
+                question["uid"] = new_uid()
+                added += 1
+    return added
+
+def next_question_id(category):
+    """Per-category display id for a new question; never reuses the id of a deleted one."""
+    return max((q.get("id", 0) for q in category.get("questions", [])), default=0) + 1
+
+def answer_record(question, user_answer, is_correct):
+    """What a finished game stores for one answer."""
+    if not question.get("uid"):
+        # Bank not migrated yet: keep the old, self-contained shape
+        return {"question": question['question'], "user_answer": user_answer, "is_correct": is_correct}
+    return [question["uid"], user_answer, 1 if is_correct else 0, content_hash(question)]
+
+
+class QuestionResolver:
+    """Looks up questions of the current bank by uid or by content hash."""
+
+    def __init__(self, data):
+        self.by_uid = {}
+        self.by_hash = {}
+        for category in data.get("categories", []):
+            for question in category.get("questions", []):
+                if question.get("uid"):
+                    self.by_uid[question["uid"]] = question
+                self.by_hash.setdefault(content_hash(question), question)
+
+    def expand(self, answer):
+        """One stored answer in display shape, whatever format it was stored in."""
+        if isinstance(answer, dict):
+            return answer
+        uid, user_answer, correct, digest = answer
+        question = self.by_uid.get(uid)
+        edited = question is not None and content_hash(question) != digest
+        if question is None:
+            question = self.by_hash.get(digest)  # deleted and re-added with the same content
+        return {
+            "uid": uid,
+            "question": question['question'] if question else "(question no longer in the bank)",
+            "user_answer": user_answer,
+            "is_correct": bool(correct),
+            "edited": edited
+        }
+
+    def text(self, uid):
+        question = self.by_uid.get(uid)
+        return question['question'] if question else uid
+
+
+class MappedResolver(QuestionResolver):
+    """Same lookups over a memory-mapped bank, through its sorted uid and hash tables."""
+
+    def __init__(self, bank):
+        self.by_uid = _MappedLookup(bank, bank.find_uid)
+        self.by_hash = _MappedLookup(bank, bank.find_hash)
+
+
+class _MappedLookup:
+    def __init__(self, bank, find):
+        self.bank = bank
+        self.find = find
+
+    def get(self, key, default=None):
+        index = self.find(key)
+        return default if index is None else self.bank.question(index)
+
+
+_resolver = (None, None)
+
+def get_resolver():
+    """Resolver over the cached bank, rebuilt only when the bank is reloaded."""
+    global _resolver
+    mapped = getattr(storage.get_storage(), "mapped_bank", None)
+    mapped = mapped(storage.get_file_path('qcm.json')) if mapped else None
+    if mapped is not None:
+        if _resolver[0] is not mapped:
+            _resolver = (mapped, MappedResolver(mapped))
+        return _resolver[1]
+    data = qa.bank_cache.get('qcm.json')
+    if _resolver[0] is not data:
+        _resolver = (data, QuestionResolver(data))
+    return _resolver[1]
+
+def expand_entry(entry):
+    """A history entry with its answers in display shape."""
+    if not entry:
+        return entry
+    resolver = get_resolver()
+    return dict(entry, questions=[resolver.expand(answer) for answer in entry.get("questions", [])])
+
+
+# One-shot migration
+def compact_entry(entry, by_text):
+    """Rewrite the answers of a legacy history entry as compact records where possible."""
+    answers = []
+    for answer in entry.get("questions", []):
+        question = by_text.get(answer.get("question")) if isinstance(answer, dict) else None
+        if question is None:
+            answers.append(answer)  # unknown question: keep its text
+        else:
+            answers.append(answer_record(question, answer.get("user_answer"), answer.get("is_correct")))
+    return dict(entry, questions=answers)
+
+def migrate(bank_file='qcm.json', history_file='history.json'):
+    """Assign uids to the bank, then convert the stored history to compact records."""
+    data = qa.edit_bank(bank_file)
+    added = ensure_uids(data)
+    if added:
+        qa.save_bank(data, bank_file)
+    print(f"Assigned {added} new question ids.")
+
+    by_text = {}
+    for category in data.get("categories", []):
+        for question in category.get("questions", []):
+            by_text.setdefault(question['question'], question)
+
+    backend = storage.get_storage()
+    path = qa.get_file_path(history_file)
+    if backend.name == "sqlite":
+        games = [compact_entry(game, by_text) for game, _ in backend.history_since(path)]
+    else:
+        # Archived months are immutable and stay as they are; expand_entry reads both formats
+        games = [compact_entry(game, by_text) for game in backend.history_log(path).iter_all()]
+    if backend.name == "sqlite":
+        conn = backend._connect()
+        with conn:
+            conn.executemany(
+                "UPDATE history SET questions = ? WHERE id = ?",
+                [(json.dumps(game["questions"], ensure_ascii=False), game["id"]) for game in games]
+            )
+    else:
+        # The converted log is built next to the old one and swapped in; ids are kept
+        backend.history_log(path).rewrite(games)
+    print(f"Converted {len(games)} games to compact records.")
+
+
+if __name__ == "__main__":
+    import sys
+
+    # python question_ids.py migrate: give questions stable ids and compact the history
+    if len(sys.argv) >= 2 and sys.argv[1] == "migrate":
+        migrate()
+    else:
+        print("Usage: python question_ids.py migrate")
@@ -1,8 +1,14 @@
-import json
-import random
+import copy
+import threading
 import datetime
-import time
 import user_functions as uf
+import storage
+import result_writer
+import adaptive
+import leaderboard
+import metrics
+import question_ids
+import quiz_session
 import os
 import sys
 
@@ -17,64 +23,235 @@ def get_base_path():
 def get_file_path(filename):
     return os.path.join(get_base_path(), filename)
 
-def ensure_history_file_exists(filename):
-    file_path = get_file_path(filename)
-    if not os.path.exists(file_path):
-        with open(file_path, 'w', encoding='utf-8') as file:
-            json.dump([], file)  # Initialize with an empty list
-
-def load_json_file(filename):
-    file_path = get_file_path(filename)
-    """Load JSON data from a file."""
-    try:
-        with open(file_path, 'r', encoding='utf-8') as file:
-            return json.load(file)
-    except FileNotFoundError:
-        print(f"Error: File '{filename}' not found.")  # Debug print
-        return {}  # Return an empty structure if the file doesn't exist
-    except json.JSONDecodeError as e:
-        print(f"Error: Invalid JSON in '{filename}': {e}")  # Debug print
-        return {}  # Return an empty structure if JSON is invalid
-
-def save_json_file(filename, data):
-    file_path = get_file_path(filename)
-    """Save data to a JSON file."""
-    with open(file_path, 'w', encoding='utf-8') as file:
-        json.dump(data, file, indent=4, ensure_ascii=False)
+class BankCache:
+    """Process-wide cache of parsed question banks.
 
+    A bank is re-parsed only when its storage signature (mtime and size for
+    JSON files) changes, or when it is invalidated after a write from this
+    process. The cached object is shared between threads and must be treated
+    as read-only.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}  # filename -> (signature, data)
+        self._summaries = {}  # filename -> (signature, [category summaries])
+        self._categories = {}  # (filename, category id) -> (signature, category)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, filename):
+        backend = storage.get_storage()
+        file_path = get_file_path(filename)
+        signature = backend.bank_signature(file_path)
+        with self._lock:
+            entry = self._entries.get(filename)
+            if entry is not None and signature is not None and entry[0] == signature:
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        # Parse outside the lock so a slow reload doesn't block cache hits on other banks
+        data = backend.load_bank(file_path)
+        with self._lock:
+            self._entries[filename] = (signature, data)
+        return data
+
+    def _lookup(self, table, key, signature):
+        with self._lock:
+            entry = table.get(key)
+            if entry is not None and signature is not None and entry[0] == signature:
+                self.hits += 1
+                return True, entry[1]
+            self.misses += 1
+            return False, None
+
+    def get_categories(self, filename):
+        """Category summaries (id, name, count), without loading lazy shards."""
+        backend = storage.get_storage()
+        file_path = get_file_path(filename)
+        signature = backend.bank_signature(file_path)
+        found, summaries = self._lookup(self._summaries, filename, signature)
+        if not found:
+            if backend.has_lazy_categories(file_path):
+                summaries = backend.load_categories(file_path)
+            else:
+                # The whole bank has to be parsed anyway: keep it for get_category() too
+                summaries = [{"id": cat["id"], "name": cat["name"], "count": len(cat.get("questions", []))}
+                             for cat in self.get(filename).get("categories", [])]
+            with self._lock:
+                self._summaries[filename] = (signature, summaries)
+        return summaries
+
+    def get_category(self, filename, category_id):
+        """One category with its questions, loaded the first time it is selected."""
+        backend = storage.get_storage()
+        file_path = get_file_path(filename)
+        if not backend.has_lazy_categories(file_path):
+            return next((cat for cat in self.get(filename).get("categories", []) if cat["id"] == category_id), None)
+        signature = backend.category_signature(file_path, category_id)
+        key = (filename, category_id)
+        found, category = self._lookup(self._categories, key, signature)
+        if not found:
+            category = backend.load_category(file_path, category_id)
+            with self._lock:
+                self._categories[key] = (signature, category)
+        return category
+
+    def invalidate(self, filename=None, category_id=None):
+        """Forget one bank, or every bank when `filename` is None.
+
+        With `category_id`, only that category is dropped from the loaded
+        categories; the other ones stay cached.
+        """
+        with self._lock:
+            if filename is None and category_id is None:
+                self._entries.clear()
+                self._summaries.clear()
+                self._categories.clear()
+                return
+            names = [filename] if filename is not None else set(self._entries) | set(self._summaries)
+            for name in names:  # whole banks and counts include the edited category
+                self._entries.pop(name, None)
+                self._summaries.pop(name, None)
+            for key in [key for key in self._categories
+                        if (filename is None or key[0] == filename) and (category_id is None or key[1] == category_id)]:
+                del self._categories[key]
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "cached_banks": len(self._entries),
+                "cached_categories": len(self._categories)
+            }
+
+bank_cache = BankCache()
+
+def load_bank(filename='qcm.json'):
+    """Load the whole question bank from the shared cache (read-only, see edit_bank)."""
+    return bank_cache.get(filename)
+
+def edit_bank(filename='qcm.json'):
+    """A copy of the bank to modify and pass to save_bank().
+
+    Categories and their question lists are copied, the question dicts are
+    shared with the cache except those save_bank() will give a uid to, so the
+    copy costs one pointer per question instead of a deep copy.
+    """
+    data = bank_cache.get(filename)
+    return dict(data, categories=[
+        dict(cat, questions=[q if q.get("uid") else copy.deepcopy(q) for q in cat.get("questions", [])])
+        for cat in data.get("categories", [])
+    ])
+
+def save_bank(data, filename='qcm.json'):
+    """Save the whole question bank through the configured storage backend."""
+    question_ids.ensure_uids(data)  # every saved question gets its stable id
+    storage.get_storage().save_bank(get_file_path(filename), data)
+    bank_cache.invalidate(filename)
+
+def edit_category(category_id, filename='qcm.json'):
+    """A copy of one category to modify and pass to save_category(), or None."""
+    category = bank_cache.get_category(filename, category_id)
+    if category is None:
+        return None
+    return dict(category, questions=[q if q.get("uid") else copy.deepcopy(q) for q in category.get("questions", [])])
+
+def save_category(category, filename='qcm.json'):
+    """Add or replace one category; a sharded bank only rewrites that category's file."""
+    question_ids.ensure_uids({"categories": [category]})
+    storage.get_storage().save_category(get_file_path(filename), category)
+    bank_cache.invalidate(filename, category["id"])
+
+@metrics.timed("qa.load_quiz")
 def load_quiz():
-    """Load quiz categories from a JSON file."""
-    data = load_json_file('qcm.json')
+    """Load quiz categories from the shared bank cache (read-only)."""
+    data = bank_cache.get('qcm.json')
     return data.get("categories", [])
 
-def store_quiz_history(user_id, category, user_answers, score, filename):
-    """Store the user's quiz results in the history file."""
-    ensure_history_file_exists(filename)  # Ensure the file exists
-    file_path = get_file_path(filename)
-    history_data = load_json_file(filename) or []
-    history_id = len(history_data) + 1
+def load_categories():
+    """List the quiz categories (id, name, count) without loading their questions."""
+    return bank_cache.get_categories('qcm.json')
+
+def load_category(category_id):
+    """Load one category with its questions from the shared cache (read-only)."""
+    return bank_cache.get_category('qcm.json', category_id)
+
+def load_user_history(user_id, filename):
+    """Load the finished games of one user."""
+    result_writer.get_result_writer().flush()  # include games still waiting in the writer queue
+    games = storage.get_storage().load_history(get_file_path(filename), user_id)
+    return [question_ids.expand_entry(game) for game in games]
+
+def load_history_page(user_id, filename, page=1, page_size=10, category=None, date_from=None, date_to=None):
+    """Newest-first page of a user's game summaries (no questions) and the number of matching games."""
+    result_writer.get_result_writer().flush()
+    return storage.get_storage().history_page(
+        get_file_path(filename), user_id, page, page_size, category, date_from, date_to
+    )
+
+def load_history_game(ref, filename):
+    """The full record (with questions) of one game from a history page."""
+    return question_ids.expand_entry(storage.get_storage().load_history_game(get_file_path(filename), ref))
+
+def make_history_entry(user_id, category, user_answers, score, seed=None, num_questions=None):
     quiz_entry = {
-        "id": history_id,
         "user_id": user_id,
         "category": category,
         "questions": user_answers,
         "score": score,
         "date": str(datetime.datetime.now())
     }
-    history_data.append(quiz_entry)
-    save_json_file(filename, history_data)
+    if seed is not None:
+        # The draw is reproducible: draw_indices(len(questions), num_questions, seed) picks the same questions
+        quiz_entry["seed"] = seed
+        quiz_entry["num_questions"] = num_questions
+    return quiz_entry
+
+@metrics.timed("qa.store_quiz_history")
+def store_quiz_history(user_id, category, user_answers, score, filename, seed=None, num_questions=None):
+    """Store the user's quiz results in the history store."""
+    quiz_entry = make_history_entry(user_id, category, user_answers, score, seed, num_questions)
+    history_id = storage.get_storage().append_history(get_file_path(filename), quiz_entry)
+    leaderboard.get_leaderboards().record(dict(quiz_entry, id=history_id))
+    return history_id
+
+def submit_quiz_history(user_id, category, user_answers, score, filename, seed=None, num_questions=None):
+    """Queue the user's quiz results for the background writer.
+
+    Returns a Future that resolves to the history id once the game is durable.
+    """
+    quiz_entry = make_history_entry(user_id, category, user_answers, score, seed, num_questions)
+    future = result_writer.get_result_writer().submit(get_file_path(filename), quiz_entry)
+    # Rank the game once it is durable and has its history id
+    future.add_done_callback(
+        lambda done: done.exception() is None and leaderboard.get_leaderboards().record(dict(quiz_entry, id=done.result()))
+    )
+    return future
 
-def run_quiz(user_id, category):
+SECONDS_PER_QUESTION = 20
+
+@metrics.timed("qa.store_session")
+def store_session(session, filename='history.json', background=False):
+    """Store a quiz session that is over, exactly once (later calls return None)."""
+    if not session.finalize():
+        return None
+    if session.adaptive:
+        adaptive.get_engine().save()
+    store = submit_quiz_history if background else store_quiz_history
+    return store(session.user_id, session.category['name'], session.answers, session.score_text(), filename,
+                 seed=session.seed, num_questions=session.num_questions)
+
+def run_quiz(user_id, category, adaptive_mode=False):
     """Run the quiz for a selected category."""
     questions = category.get('questions', [])
     if not questions:
         print("No questions available in this category.")
         return
 
-    random.shuffle(questions)
-    score = 0
-    user_answers = []
-
     # Ask how many questions the user wants to attempt
     while True:
         try:
@@ -85,24 +262,19 @@ def run_quiz(user_id, category):
         except ValueError:
             print("Please enter a valid number.")
     
-    # Calculating total time for the quiz
-    total_time = num_questions * 20
-    print(f"You have {total_time} seconds to complete the quiz.")
-
-    # Start the timer
-    start_time = time.time()
+    # The session draws the questions and starts the timer
+    session = quiz_session.QuizSession.start(user_id, category, num_questions, SECONDS_PER_QUESTION, adaptive_mode)
+    print(f"You have {num_questions * SECONDS_PER_QUESTION} seconds to complete the quiz.")
 
-    selected_questions = questions[:num_questions]
-    for i, question in enumerate(selected_questions, 1):
-        elapsed_time = time.time() - start_time
-        remaining_time = total_time - elapsed_time
+    # In adaptive mode questions are picked one at a time to match the user's current rating
+    engine = adaptive.get_engine() if adaptive_mode else None
+    if engine:
+        session.pick_adaptive(engine)
 
-        if remaining_time <= 0:
-            print("\nTime is up! The quiz has ended.")
-            break
-
-        print(f"\nTime remaining: {int(remaining_time)} seconds")
-        print(f"\nQuestion {i}: {question.get('question', 'No question available.')}")
+    question = session.question()
+    while question is not None:
+        print(f"\nTime remaining: {int(session.remaining())} seconds")
+        print(f"\nQuestion {session.cursor + 1}: {question.get('question', 'No question available.')}")
 
         # Display available options
         for option in question.get('options', []):
@@ -115,30 +287,30 @@ def run_quiz(user_id, category):
                 break
             print("Invalid answer! Please choose from a, b, c, or d.")
 
-        # Check if the answer is correct
-        is_correct = (answer == question.get('correct_answer', ''))
-        user_answers.append({
-            "question": question['question'],
-            "user_answer": answer,
-            "is_correct": is_correct
-        })
+        # Check if the answer is correct (answers given after the deadline don't count)
+        is_correct = session.answer(answer)
+        if is_correct is None:
+            break
+
+        if engine:
+            engine.record_answer(user_id, category, question, is_correct)
+            session.pick_adaptive(engine)
 
         if is_correct:
             print("Correct!")
-            score += 1
         else:
             correct_answer = next((opt['text'] for opt in question['options'] if opt['id'] == question['correct_answer']), "Unknown")
             print(f"Wrong! The correct answer was: {correct_answer}")
 
-        print(f"Current score: {score}/{i}")
+        print(f"Current score: {session.score}/{session.cursor + 1}")
+        question = session.next()
 
-    elapsed_time = time.time() - start_time
-    if elapsed_time < total_time:
-        print(f"\nQuiz finished! Your final score is {score}/{num_questions}")
+    if session.check_deadline() == quiz_session.EXPIRED:
+        print(f"\nTime is up! Your final score is {session.score_text()}")
     else:
-        print(f"\nTime is up! Your final score is {score}/{num_questions}")
+        print(f"\nQuiz finished! Your final score is {session.score_text()}")
         
-    store_quiz_history(user_id, category['name'], user_answers, f"{score}/{num_questions}",'history.json')
+    store_session(session)
 
 def start_quiz(username):
     """Start the quiz for a user."""
@@ -147,7 +319,7 @@ def start_quiz(username):
         print("Invalid user.")
         return
 
-    categories = load_quiz()
+    categories = load_categories()
     if not categories:
         print("No quiz data available.")
         return
@@ -166,8 +338,16 @@ def start_quiz(username):
         except ValueError:
             print("Please select a valid category number.")
 
-    selected_category = categories[category_choice - 1]
-    run_quiz(user_id, selected_category)
+    selected_category = load_category(categories[category_choice - 1]['id'])  # only this category is loaded
+
+    # Ask for the question selection mode
+    while True:
+        mode = input("Adaptive mode (questions matched to your level)? (yes/no): ").lower().strip()
+        if mode in ["yes", "no"]:
+            break
+        print("Invalid input. Please enter 'yes' or 'no'.")
+
+    run_quiz(user_id, selected_category, adaptive_mode=(mode == "yes"))
 
     # Ask if the user wants to play again
     while True:
@@ -0,0 +1,248 @@
+import time
+
+import adaptive
+import question_ids
+import quiz_app as qa
+import sampler
+
+# UI-independent quiz attempt shared by the console and Streamlit front ends.
+# A session only stores small values (question keys, cursor, score, answer
+# records, deadline), so thousands fit in one process and a checkpoint is a
+# small dict. The questions themselves are looked up in the shared, cached
+# category. Every step is O(1):
+#   session = QuizSession.start(user_id, category, 10, seconds_per_question=20)
+#   while (question := session.question()) is not None:
+#       session.answer("b")
+#       session.next()
+# The front ends only display the current question, forward the user's
+# choice, and store the finished attempt through quiz_app.store_session().
+
+ACTIVE = "active"
+FINISHED = "finished"
+EXPIRED = "expired"
+
+_question_maps = {}  # category id -> (category object, {question key: question})
+
+
+def _questions_by_key(category):
+    questions = category.get('questions', [])
+    if hasattr(questions, 'by_key'):
+        return questions.by_key()  # memory-mapped bank: questions are decoded on lookup
+    cached = _question_maps.get(category['id'])
+    if cached is None or cached[0] is not category:  # the bank was reloaded
+        cached = (category, {adaptive.question_key(q): q for q in questions})
+        _question_maps[category['id']] = cached
+    return cached[1]
+
+
+class QuizSession:
+    """State machine of one quiz attempt: active -> finished or expired."""
+
+    __slots__ = ("user_id", "category", "question_ids", "positions", "cursor", "score", "answers",
+                 "num_questions", "length", "seed", "adaptive", "started", "deadline", "state", "stored")
+
+    def __init__(self, user_id, category, question_ids, num_questions, length, seed, adaptive_mode,
+                 started, deadline, cursor=0, score=0, answers=None, state=ACTIVE, stored=False, positions=None):
+        self.user_id = user_id
+        self.category = category          # shared cached category, read-only
+        self.question_ids = question_ids  # keys of the drawn questions, in order
+        # Index of each drawn question in the category, so a lazily decoded
+        # category only decodes that question (None: look it up by key)
+        self.positions = positions if positions is not None else []
+        self.num_questions = num_questions  # as requested, kept in the history entry
+        self.length = length              # questions actually in the quiz
+        self.seed = seed
+        self.adaptive = adaptive_mode
+        self.started = started
+        self.deadline = deadline
+        self.cursor = cursor
+        self.score = score
+        self.answers = answers if answers is not None else []  # one history record per answered question
+        self.state = state
+        self.stored = stored
+
+    @classmethod
+    def start(cls, user_id, category, num_questions, seconds_per_question, adaptive_mode=False, seed=None, now=None):
+        """Draw the questions (all at once, or one at a time in adaptive mode) and start the clock."""
+        questions = category.get('questions', [])
+        if adaptive_mode:
+            seed = None
+            positions = []  # filled by pick_adaptive() as the user answers
+        else:
+            seed = sampler.new_seed() if seed is None else seed
+            positions = sampler.draw_indices(len(questions), num_questions, seed)
+        keys = [adaptive.question_key(questions[i]) for i in positions]
+        now = time.time() if now is None else now
+        return cls(user_id, category, keys, num_questions, min(num_questions, len(questions)), seed,
+                   adaptive_mode, now, now + num_questions * seconds_per_question, positions=list(positions))
+
+    # Reading
+    def question(self):
+        """The current question, or None once the attempt is over."""
+        if self.state != ACTIVE or self.cursor >= len(self.question_ids):
+            return None
+        try:
+            return self._lookup(self.cursor)
+        except ValueError:  # the memory-mapped bank was rebuilt and the old file unmapped
+            self.category = qa.load_category(self.category['id']) or dict(self.category, questions=[])
+            return self._lookup(self.cursor)
+
+    def _lookup(self, number):
+        key = self.question_ids[number]
+        position = self.positions[number] if number < len(self.positions) else None
+        questions = self.category.get('questions', [])
+        if position is not None and position < len(questions):
+            question = questions[position]
+            if adaptive.question_key(question) == key:  # not moved by an edit of the bank
+                return question
+        return _questions_by_key(self.category).get(key)
+
+    def answered(self):
+        """True once the current question has an answer."""
+        return len(self.answers) > self.cursor
+
+    def current_answer(self):
+        """The option picked for the current question, if any."""
+        if not self.answered():
+            return None
+        record = self.answers[self.cursor]
+        return record[1] if isinstance(record, list) else record["user_answer"]
+
+    def remaining(self, now=None):
+        return max(0.0, self.deadline - (time.time() if now is None else now))
+
+    def check_deadline(self, now=None):
+        """Expire the attempt if its time is up. Returns the state."""
+        if self.state == ACTIVE and (time.time() if now is None else now) >= self.deadline:
+            self.state = EXPIRED
+        return self.state
+
+    def done(self):
+        return self.state != ACTIVE
+
+    def score_text(self):
+        return f"{self.score}/{self.length}"
+
+    # Steps
+    def answer(self, choice, now=None):
+        """Answer the current question. Returns whether it was correct, or None if the attempt is over.
+
+        Answering twice (e.g. a Streamlit rerun) keeps the first answer.
+        """
+        if self.check_deadline(now) != ACTIVE:
+            return None
+        question = self.question()
+        if question is None:
+            return None
+        if self.answered():
+            return self.current_answer() == question.get('correct_answer')
+        is_correct = choice == question.get('correct_answer')
+        self.answers.append(question_ids.answer_record(question, choice, is_correct))
+        self.score += is_correct
+        return is_correct
+
+    def pick_adaptive(self, engine):
+        """Adaptive mode: queue the unasked question that best matches the user's current rating."""
+        if not self.adaptive or len(self.question_ids) >= self.length:
+            return None
+        by_key = _questions_by_key(self.category)
+        asked = [by_key[key] for key in self.question_ids if key in by_key]
+        question = engine.next_question(self.user_id, self.category, asked)
+        if question is not None:
+            self.question_ids.append(adaptive.question_key(question))
+            self.positions.append(None)
+        return question
+
+    def next(self, now=None):
+        """Move past an answered question. Returns the next question, or None when the attempt is over."""
+        if self.check_deadline(now) != ACTIVE:
+            return None
+        if self.answered():
+            self.cursor += 1
+        if self.cursor >= len(self.question_ids):
+            self.state = FINISHED
+        return self.question()
+
+    def finalize(self):
+        """True exactly once, when an attempt that is over should be stored."""
+        if self.state == ACTIVE or self.stored:
+            return False
+        self.stored = True
+        return True
+
+    # Checkpoints
+    def to_dict(self):
+        return {
+            "user_id": self.user_id,
+            "category_id": self.category['id'],
+            "question_ids": self.question_ids,
+            "positions": self.positions,
+            "num_questions": self.num_questions,
+            "length": self.length,
+            "seed": self.seed,
+            "adaptive": self.adaptive,
+            "started": self.started,
+            "deadline": self.deadline,
+            "cursor": self.cursor,
+            "score": self.score,
+            "answers": self.answers,
+            "state": self.state,
+            "stored": self.stored
+        }
+
+    @classmethod
+    def from_dict(cls, data, category=None):
+        """Restore a checkpoint; the category is loaded from the bank cache unless given."""
+        category = category or qa.load_category(data["category_id"])
+        return cls(data["user_id"], category, list(data["question_ids"]), data["num_questions"], data["length"],
+                   data["seed"], data["adaptive"], data["started"], data["deadline"], data["cursor"],
+                   data["score"], list(data["answers"]), data["state"], data["stored"],
+                   list(data.get("positions", [])))  # older checkpoints have no positions
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+    import random
+    import tracemalloc
+
+    # python quiz_session.py --sessions 10000: time the session steps without any front end
+    parser = argparse.ArgumentParser(description="Benchmark QuizSession steps and checkpoints")
+    parser.add_argument("--sessions", type=int, default=10000)
+    parser.add_argument("--questions", type=int, default=10)
+    args = parser.parse_args()
+
+    categories = [qa.load_category(c['id']) for c in qa.load_categories() if c.get('count')]
+    rng = random.Random(1)
+
+    # Memory is measured on a separate batch, tracemalloc would distort the timings
+    tracemalloc.start()
+    batch = [QuizSession.start(i, rng.choice(categories), args.questions, 20) for i in range(args.sessions)]
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del batch
+
+    started = time.perf_counter()
+    sessions = [QuizSession.start(i, rng.choice(categories), args.questions, 20) for i in range(args.sessions)]
+    created = time.perf_counter()
+
+    steps = 0
+    for session in sessions:
+        while session.question() is not None:
+            session.answer(rng.choice("abcd"))
+            session.next()
+            steps += 1
+    answered = time.perf_counter()
+    checkpoints = [json.dumps(session.to_dict()) for session in sessions]
+    dumped = time.perf_counter()
+    restored = [QuizSession.from_dict(json.loads(raw)) for raw in checkpoints]
+    loaded = time.perf_counter()
+
+    print(f"{args.sessions} sessions of {args.questions} questions")
+    print(f"start:       {1e6 * (created - started) / args.sessions:8.2f} us/session, "
+          f"{memory / args.sessions:8.0f} bytes/session in memory")
+    print(f"answer+next: {1e6 * (answered - created) / max(steps, 1):8.2f} us/step")
+    print(f"checkpoint:  {1e6 * (dumped - answered) / args.sessions:8.2f} us/session, "
+          f"{sum(map(len, checkpoints)) / args.sessions:8.0f} bytes/session as JSON")
+    print(f"restore:     {1e6 * (loaded - dumped) / args.sessions:8.2f} us/session")
+    assert all(a.score == b.score for a, b in zip(sessions, restored))
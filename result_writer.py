@@ -0,0 +1,167 @@
+import atexit
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import storage
+
+# Background group-commit writer for finished games.
+# Submitting a game only enqueues it. A single writer thread collects games for
+# up to `max_delay` seconds or `max_batch` entries, then makes the whole batch
+# durable with one write and one fsync (one transaction on SQLite).
+
+_STOP = object()
+
+
+class _FlushMarker:
+    def __init__(self):
+        self.done = threading.Event()
+
+
+class ResultWriter:
+    """Asynchronous, batching writer for quiz history entries."""
+
+    def __init__(self, max_batch=64, max_delay=0.05):
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.batches = 0
+        self.entries_written = 0
+        self.errors = 0
+        self.last_batch_size = 0
+        self.total_commit_time = 0.0
+        self.max_commit_time = 0.0
+        self.total_wait_time = 0.0  # submit -> durable, summed over entries
+
+    def start(self):
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="result-writer", daemon=True)
+                self._thread.start()
+
+    def submit(self, path, entry):
+        """Queue a game for `path` and return a Future resolving to its history id."""
+        self.start()
+        future = Future()
+        self._queue.put((path, entry, future, time.perf_counter()))
+        return future
+
+    def flush(self, timeout=None):
+        """Block until everything submitted so far is durable."""
+        if self._thread is None or not self._thread.is_alive():
+            return True
+        marker = _FlushMarker()
+        self._queue.put(marker)
+        return marker.done.wait(timeout)
+
+    def close(self, timeout=10):
+        """Flush pending games and stop the writer thread."""
+        if self._thread is None or not self._thread.is_alive():
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                "queue_depth": self._queue.qsize(),
+                "batches": self.batches,
+                "entries_written": self.entries_written,
+                "errors": self.errors,
+                "last_batch_size": self.last_batch_size,
+                "avg_batch_size": self.entries_written / self.batches if self.batches else 0.0,
+                "avg_commit_ms": 1000 * self.total_commit_time / self.batches if self.batches else 0.0,
+                "max_commit_ms": 1000 * self.max_commit_time,
+                "avg_latency_ms": 1000 * self.total_wait_time / self.entries_written if self.entries_written else 0.0
+            }
+
+    # Writer thread
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            batch = []
+            markers = []
+            stop = False
+            deadline = time.perf_counter() + self.max_delay
+            while True:
+                if item is _STOP:
+                    stop = True
+                elif isinstance(item, _FlushMarker):
+                    markers.append(item)
+                else:
+                    batch.append(item)
+                if stop or markers or len(batch) >= self.max_batch:
+                    break
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+
+            if stop:
+                # Drain whatever was queued before the stop request
+                while True:
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if isinstance(item, _FlushMarker):
+                        markers.append(item)
+                    elif item is not _STOP:
+                        batch.append(item)
+
+            if batch:
+                self._commit(batch)
+            for marker in markers:
+                marker.done.set()
+            if stop:
+                return
+
+    def _commit(self, batch):
+        by_path = {}
+        for path, entry, future, submitted in batch:
+            by_path.setdefault(path, []).append((entry, future, submitted))
+
+        backend = storage.get_storage()
+        for path, items in by_path.items():
+            started = time.perf_counter()
+            try:
+                ids = backend.append_history_many(path, [entry for entry, _, _ in items])
+            except Exception as e:
+                print(f"Error: could not write {len(items)} quiz results to '{path}': {e}")
+                with self._stats_lock:
+                    self.errors += len(items)
+                for _, future, _ in items:
+                    future.set_exception(e)
+                continue
+            finished = time.perf_counter()
+            with self._stats_lock:
+                commit_time = finished - started
+                self.batches += 1
+                self.entries_written += len(items)
+                self.last_batch_size = len(items)
+                self.total_commit_time += commit_time
+                self.max_commit_time = max(self.max_commit_time, commit_time)
+                self.total_wait_time += sum(finished - submitted for _, _, submitted in items)
+            for (_, future, _), history_id in zip(items, ids):
+                future.set_result(history_id)
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+def get_result_writer():
+    """Return the process-wide writer, flushed automatically at interpreter exit."""
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = ResultWriter()
+                atexit.register(_writer.close)
+    return _writer
@@ -0,0 +1,30 @@
+import random
+
+# Question sampling shared by the CLI and the Streamlit app.
+# Draws never copy or reorder the bank (it is shared through the bank cache):
+# they pick k indices with a sparse Fisher-Yates shuffle, O(k) time and memory.
+# Every draw is driven by a seed that is stored in the history entry: the same
+# seed picks the same questions again as long as the category hasn't changed.
+
+_seed_source = random.SystemRandom()
+
+
+def new_seed():
+    """A fresh 63-bit seed for one quiz attempt."""
+    return _seed_source.getrandbits(63)
+
+def draw_indices(n, k, seed):
+    """k distinct indices out of range(n), in random order, without materializing range(n)."""
+    k = min(k, n)
+    rng = random.Random(seed)
+    swapped = {}  # only the positions touched by the partial shuffle
+    picked = []
+    for i in range(k):
+        j = rng.randrange(i, n)
+        picked.append(swapped.get(j, j))
+        swapped[j] = swapped.get(i, i)
+    return picked
+
+def draw(questions, k, seed):
+    """k questions from a list, in random order. The list is left untouched."""
+    return [questions[i] for i in draw_indices(len(questions), k, seed)]
@@ -0,0 +1,217 @@
+import bisect
+import math
+import marshal
+import os
+import re
+import threading
+import unicodedata
+
+import question_ids
+import quiz_app as qa
+import storage
+
+# Full-text search over the question bank for the admin pages.
+# An inverted index maps every token of a question (and, with a lower weight,
+# of its options) to the questions that contain it. Query tokens match whole
+# tokens and prefixes of longer ones, found with a binary search in the sorted
+# vocabulary; hits are ranked with a tf-idf score. The index lives in
+# qcm.search next to the bank and follows it: when the bank signature changes,
+# only the questions whose content hash changed are re-indexed.
+
+MAGIC = "QCMSRCH1"
+MARSHAL_VERSION = 4
+QUESTION_WEIGHT = 2.0
+OPTION_WEIGHT = 1.0
+PREFIX_PENALTY = 0.6  # a prefix hit counts less than the exact token
+_TOKEN = re.compile(r"\w+")
+
+
+def index_path_for(bank_path):
+    """qcm.json -> qcm.search"""
+    return os.path.splitext(bank_path)[0] + ".search"
+
+def tokenize(text):
+    """Lower-case, accent-free word tokens."""
+    text = unicodedata.normalize("NFKD", str(text).lower())
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    return _TOKEN.findall(text)
+
+def doc_key(category, question):
+    return question.get("uid") or f"{category['id']}:{question['id']}"
+
+
+class SearchIndex:
+    """Inverted index over question and option text."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self.signature = None
+        self.docs = {}      # key -> (category id, category name, question id, question text, content hash, tokens)
+        self.postings = {}  # token -> {key: weight}
+        self._vocabulary = None  # sorted tokens, rebuilt after the vocabulary changes
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, 'rb') as file:
+                stored = marshal.loads(file.read())  # much faster than marshal.load(file)
+        except (FileNotFoundError, ValueError, EOFError, TypeError):
+            return
+        if isinstance(stored, dict) and stored.get("magic") == MAGIC:
+            self.signature = stored["signature"]
+            self.docs = stored["docs"]
+            self.postings = stored["postings"]
+
+    def save(self):
+        with self._lock:
+            payload = marshal.dumps(
+                {"magic": MAGIC, "signature": self.signature, "docs": self.docs, "postings": self.postings},
+                MARSHAL_VERSION
+            )
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'wb') as file:
+            file.write(payload)
+        os.replace(tmp_path, self.path)
+
+    # Maintenance (callers hold self._lock)
+    def _add(self, key, category, question, digest):
+        weights = {}
+        for token in tokenize(question.get("question", "")):
+            weights[token] = weights.get(token, 0.0) + QUESTION_WEIGHT
+        for option in question.get("options", []):
+            for token in tokenize(option.get("text", "")):
+                weights[token] = weights.get(token, 0.0) + OPTION_WEIGHT
+        for token, weight in weights.items():
+            posting = self.postings.get(token)
+            if posting is None:
+                posting = self.postings[token] = {}
+                self._vocabulary = None
+            posting[key] = weight
+        self.docs[key] = (category["id"], category["name"], question["id"], question.get("question", ""),
+                          digest, list(weights))
+
+    def _remove(self, key):
+        for token in self.docs.pop(key)[5]:
+            posting = self.postings[token]
+            del posting[key]
+            if not posting:
+                del self.postings[token]
+                self._vocabulary = None
+
+    def sync(self, data, signature):
+        """Bring the index in line with `data`, re-indexing only changed questions.
+
+        Returns (added or updated, removed).
+        """
+        with self._lock:
+            seen = set()
+            changed = 0
+            for category in data.get("categories", []):
+                for question in category.get("questions", []):
+                    key = doc_key(category, question)
+                    seen.add(key)
+                    digest = question_ids.content_hash(question)
+                    doc = self.docs.get(key)
+                    if doc is not None and doc[4] == digest and doc[:3] == (category["id"], category["name"], question["id"]):
+                        continue
+                    if doc is not None:
+                        self._remove(key)
+                    self._add(key, category, question, digest)
+                    changed += 1
+            removed = [key for key in self.docs if key not in seen]
+            for key in removed:
+                self._remove(key)
+            self.signature = signature
+            return changed, len(removed)
+
+    # Querying
+    def _expand(self, token):
+        """Index tokens matching a query token: itself, then the longer ones it prefixes."""
+        if self._vocabulary is None:
+            self._vocabulary = sorted(self.postings)
+        vocabulary = self._vocabulary
+        position = bisect.bisect_left(vocabulary, token)
+        while position < len(vocabulary) and vocabulary[position].startswith(token):
+            yield vocabulary[position]
+            position += 1
+
+    def search(self, query, limit=20, category_id=None):
+        """Questions containing every query word (as a word or a word prefix), best first."""
+        terms = tokenize(query)
+        if not terms:
+            return []
+        with self._lock:
+            total = max(len(self.docs), 1)
+            scores = None
+            for term in terms:
+                term_scores = {}
+                for token in self._expand(term):
+                    posting = self.postings[token]
+                    idf = math.log(1 + total / len(posting))
+                    factor = idf if token == term else idf * PREFIX_PENALTY
+                    for key, weight in posting.items():
+                        score = weight * factor
+                        if score > term_scores.get(key, 0.0):
+                            term_scores[key] = score
+                if scores is None:
+                    scores = term_scores
+                else:
+                    scores = {key: scores[key] + score for key, score in term_scores.items() if key in scores}
+                if not scores:
+                    return []
+            hits = []
+            for key, score in scores.items():
+                doc = self.docs[key]
+                if category_id is not None and doc[0] != category_id:
+                    continue
+                hits.append((score, key, doc))
+        hits.sort(key=lambda hit: (-hit[0], hit[2][0], hit[2][2]))
+        return [
+            {"key": key, "category_id": doc[0], "category": doc[1], "id": doc[2], "question": doc[3], "score": score}
+            for score, key, doc in hits[:limit]
+        ]
+
+    def __len__(self):
+        return len(self.docs)
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+def get_search_index(filename='qcm.json'):
+    """The search index of a bank, synced with the bank's current content."""
+    bank_path = qa.get_file_path(filename)
+    with _indexes_lock:
+        index = _indexes.get(filename)
+        if index is None:
+            index = _indexes[filename] = SearchIndex(index_path_for(bank_path))
+    signature = repr(storage.get_storage().bank_signature(bank_path))
+    if index.signature != signature:
+        # The bank was edited (here or in another process) since the index was saved
+        changed, removed = index.sync(qa.bank_cache.get(filename), signature)
+        if changed or removed or not os.path.exists(index.path):
+            index.save()
+    return index
+
+def search(query, filename='qcm.json', limit=20, category_id=None):
+    return get_search_index(filename).search(query, limit, category_id)
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+
+    # python search_index.py <words>: search the bank from the command line
+    if len(sys.argv) < 2:
+        print("Usage: python search_index.py <words>")
+        sys.exit(1)
+    started = time.perf_counter()
+    index = get_search_index()
+    loaded = time.perf_counter()
+    hits = index.search(" ".join(sys.argv[1:]))
+    finished = time.perf_counter()
+    for hit in hits:
+        print(f"{hit['score']:6.2f}  [{hit['category']}] Q{hit['id']}: {hit['question']}")
+    print(f"{len(hits)} hits among {len(index)} questions (index {1000 * (loaded - started):.1f} ms, "
+          f"query {1000 * (finished - loaded):.2f} ms)")
@@ -0,0 +1,215 @@
+import json
+import os
+import secrets
+import sqlite3
+import threading
+import time
+
+import quiz_app as qa
+import quiz_session
+import storage
+
+# Quiz attempts in progress, keyed by an opaque session token, outside of any
+# one front-end process. Two backends share the SessionStore interface:
+#   - "memory" : a dict in this process (one Streamlit or API worker)
+#   - "sqlite" : sessions.db in WAL mode, shared by every worker on the machine,
+#                so a student can be served by any of them and attempts
+#                survive restarts
+# The backend is picked with the QCM_SESSIONS environment variable. Each step
+# of an attempt is one single-row upsert of its checkpoint (a few hundred
+# bytes), and sessions past their deadline are deleted by a background thread.
+
+SESSIONS_ENV = "QCM_SESSIONS"
+SESSION_DB_ENV = "QCM_SESSION_DB"
+DEFAULT_SESSION_DB = "sessions.db"
+KEEP_AFTER_DEADLINE = 3600  # seconds an attempt stays readable after its deadline (result page)
+GC_INTERVAL = 60
+
+
+def new_token():
+    return secrets.token_urlsafe(16)
+
+
+class SessionStore:
+    """Interface of the session stores."""
+
+    name = None
+
+    def get(self, token):
+        """The attempt stored under `token`, or None if unknown or expired."""
+        raise NotImplementedError
+
+    def put(self, token, session):
+        """Save the attempt after a step."""
+        raise NotImplementedError
+
+    def claim(self, token):
+        """True for exactly one caller, across workers, once the attempt is to be stored in the history."""
+        raise NotImplementedError
+
+    def delete(self, token):
+        raise NotImplementedError
+
+    def collect_garbage(self, now=None):
+        """Delete the expired sessions. Returns how many were deleted."""
+        raise NotImplementedError
+
+    def __len__(self):
+        raise NotImplementedError
+
+
+class MemorySessionStore(SessionStore):
+    """Sessions of this process only, kept as live objects."""
+
+    name = "memory"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sessions = {}  # token -> QuizSession
+        self._claimed = set()
+
+    def get(self, token):
+        session = self._sessions.get(token)
+        if session is None or time.time() > session.deadline + KEEP_AFTER_DEADLINE:
+            return None
+        return session
+
+    def put(self, token, session):
+        self._sessions[token] = session
+
+    def claim(self, token):
+        with self._lock:
+            session = self._sessions.get(token)
+            if session is None or session.stored or token in self._claimed:
+                return False
+            self._claimed.add(token)
+            return True
+
+    def delete(self, token):
+        with self._lock:
+            self._sessions.pop(token, None)
+            self._claimed.discard(token)
+
+    def collect_garbage(self, now=None):
+        limit = (time.time() if now is None else now) - KEEP_AFTER_DEADLINE
+        with self._lock:
+            expired = [token for token, session in list(self._sessions.items()) if session.deadline < limit]
+            for token in expired:
+                del self._sessions[token]
+                self._claimed.discard(token)
+        return len(expired)
+
+    def __len__(self):
+        return len(self._sessions)
+
+
+SESSION_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    token   TEXT PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    expires REAL NOT NULL,
+    stored  INTEGER NOT NULL DEFAULT 0,
+    data    TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions(expires);
+"""
+
+class SqliteSessionStore(SessionStore):
+    """Sessions in a SQLite database shared by all the workers on the machine."""
+
+    name = "sqlite"
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._local = threading.local()  # sqlite3 connections must stay on their thread
+        with self._connect() as conn:
+            conn.executescript(SESSION_SCHEMA)
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)  # autocommit
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")  # a crash may lose the last step, never corrupt
+            self._local.conn = conn
+        return conn
+
+    def get(self, token):
+        row = self._connect().execute(
+            "SELECT stored, data FROM sessions WHERE token = ? AND expires >= ?", (token, time.time())
+        ).fetchone()
+        if row is None:
+            return None
+        session = quiz_session.QuizSession.from_dict(json.loads(row[1]))
+        session.stored = bool(row[0])
+        return session
+
+    def put(self, token, session):
+        data = session.to_dict()
+        self._connect().execute(
+            "INSERT INTO sessions (token, user_id, expires, stored, data) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT(token) DO UPDATE SET expires = excluded.expires, data = excluded.data, "
+            "stored = MAX(stored, excluded.stored)",  # a stale copy never un-stores an attempt
+            (token, session.user_id, session.deadline + KEEP_AFTER_DEADLINE, int(session.stored),
+             json.dumps(data, separators=(",", ":")))
+        )
+
+    def claim(self, token):
+        cursor = self._connect().execute("UPDATE sessions SET stored = 1 WHERE token = ? AND stored = 0", (token,))
+        return cursor.rowcount == 1
+
+    def delete(self, token):
+        self._connect().execute("DELETE FROM sessions WHERE token = ?", (token,))
+
+    def collect_garbage(self, now=None):
+        cursor = self._connect().execute("DELETE FROM sessions WHERE expires < ?",
+                                         (time.time() if now is None else now,))
+        return cursor.rowcount
+
+    def __len__(self):
+        return self._connect().execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+
+def make_session_store(kind, db_path=None):
+    kind = kind.strip().lower()
+    if kind == "memory":
+        return MemorySessionStore()
+    if kind == "sqlite":
+        return SqliteSessionStore(db_path or os.environ.get(SESSION_DB_ENV) or storage.get_file_path(DEFAULT_SESSION_DB))
+    raise ValueError(f"Unknown session store '{kind}' (expected 'memory' or 'sqlite').")
+
+def _collect_forever(store, interval):
+    while True:
+        time.sleep(interval)
+        try:
+            store.collect_garbage()
+        except sqlite3.Error as e:
+            print(f"Error: Could not delete expired sessions: {e}")
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_session_store():
+    """The process-wide session store selected by QCM_SESSIONS (default: memory), with its collector running."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                store = make_session_store(os.environ.get(SESSIONS_ENV, "memory"))
+                threading.Thread(target=_collect_forever, args=(store, GC_INTERVAL), daemon=True,
+                                 name="session-gc").start()
+                _store = store
+    return _store
+
+
+def finish(token, session, filename='history.json', background=True):
+    """Store an attempt that is over in the history, once across all workers, and save its final state."""
+    if session.check_deadline() == quiz_session.ACTIVE:
+        return None
+    store = get_session_store()
+    result = None
+    if not session.stored and store.claim(token):
+        result = qa.store_session(session, filename, background)
+    session.stored = True
+    store.put(token, session)
+    return result
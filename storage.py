@@ -0,0 +1,639 @@
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+from contextlib import contextmanager
+import history_archive
+import history_log
+import metrics
+import bank_mmap
+import bank_shards
+import bank_snapshot
+
+try:
+    import fcntl  # POSIX only; elsewhere the in-process lock is all we get
+except ImportError:
+    fcntl = None
+
+# Storage layer shared by the CLI, the admin tools and the Streamlit app.
+# Two backends are available:
+#   - "json"   : the original users.json / qcm.json files (or the sharded qcm/
+#                layout once converted), and an append-only history.jsonl log
+#                (seeded once from history.json) with old months archived
+#                by history_archive.py
+#   - "sqlite" : one indexed database in WAL mode (qcm.db by default)
+# The backend is picked with the QCM_STORAGE environment variable.
+
+STORAGE_ENV = "QCM_STORAGE"
+DB_PATH_ENV = "QCM_DB_PATH"
+DEFAULT_DB_NAME = "qcm.db"
+
+# Dynamically resolves the base path for file operations
+def get_base_path():
+    if getattr(sys, 'frozen', False):  # Check if the script is running as an executable
+        return os.path.dirname(sys.executable)  # Use the executable directory for persistent storage
+    else:
+        return os.path.dirname(os.path.abspath(__file__))  # Use script directory for development
+
+# Resolves the full path for a file based on the base path
+def get_file_path(filename):
+    return os.path.join(get_base_path(), filename)
+
+
+@metrics.timed("storage.read_json")
+def read_json(file_path, default):
+    """Read a JSON document, returning `default` if it is missing or invalid."""
+    try:
+        with open(file_path, 'r', encoding='utf-8') as file:
+            data = json.load(file)
+            if metrics.ENABLED:
+                metrics.count_bytes("storage.read_json", read=file.tell())
+            return data if data else default
+    except FileNotFoundError:
+        return default
+    except json.JSONDecodeError:
+        return default
+
+@contextmanager
+def file_lock(file_path):
+    """Exclusive lock shared by every process writing `file_path`."""
+    if fcntl is None:
+        yield
+        return
+    with open(file_path + ".lock", 'a') as lock_file:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+def file_signature(file_path):
+    """(mtime, size) of a file, or None if it doesn't exist."""
+    try:
+        stat = os.stat(file_path)
+    except FileNotFoundError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+@metrics.timed("storage.write_json")
+def write_json_atomic(file_path, data, indent=2):
+    """Write a JSON document through a temp file so readers never see a half-written file."""
+    directory = os.path.dirname(os.path.abspath(file_path))
+    fd, tmp_path = tempfile.mkstemp(prefix=".tmp-", suffix=".json", dir=directory)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as file:
+            json.dump(data, file, indent=indent, ensure_ascii=False)
+            file.flush()
+            os.fsync(file.fileno())
+            if metrics.ENABLED:
+                metrics.count_bytes("storage.write_json", written=file.tell())
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class JsonStorage:
+    """Backend over the original JSON files. Paths are the JSON files themselves."""
+
+    name = "json"
+
+    def __init__(self):
+        # One lock per process is enough: writes are read-modify-write of a whole file
+        self._lock = threading.RLock()
+        self._logs = {}
+        self._archives = {}
+
+
+    # Users
+    def users_signature(self, path):
+        return file_signature(path)
+
+    def load_users(self, path):
+        return read_json(path, {"users": []}).get("users", [])
+
+    def find_user(self, path, username):
+        key = username.casefold()
+        return next((user for user in self.load_users(path) if user["username"].casefold() == key), None)
+
+    def get_user_by_id(self, path, user_id):
+        return next((user for user in self.load_users(path) if user["id"] == user_id), None)
+
+    def add_user(self, path, username, password):
+        """Add a user and return the new record, or None if the username is taken."""
+        with self._lock, file_lock(path):
+            # Re-read under the lock so concurrent signups can't reuse an id or a name
+            data = read_json(path, {"users": []})
+            users = data.setdefault("users", [])
+            key = username.casefold()
+            if any(user["username"].casefold() == key for user in users):
+                return None
+            new_user = {
+                "id": max((user["id"] for user in users), default=0) + 1,
+                "username": username,
+                "password": password
+            }
+            users.append(new_user)
+            write_json_atomic(path, data, indent=2)
+            return new_user
+
+    # Question bank
+    def _shards(self, path):
+        """The sharded layout next to `path` (qcm.json -> qcm/), if it has been created."""
+        if not bank_shards.is_sharded(path):
+            return None
+        return bank_shards.ShardedBank(bank_shards.shard_dir_for(path))
+
+    def bank_signature(self, path):
+        """Cheap token that changes whenever the bank at `path` is rewritten."""
+        shards = self._shards(path)
+        return shards.signature() if shards else file_signature(path)
+
+    def mapped_bank(self, path):
+        """The compiled, memory-mapped bank (qcm.qbm) while it matches `path`, else None."""
+        return None if bank_shards.is_sharded(path) else bank_mmap.open_fresh(path)
+
+    def has_lazy_categories(self, path):
+        """True when one category can be read without parsing the whole bank."""
+        return self._shards(path) is not None or self.mapped_bank(path) is not None
+
+    def load_bank(self, path):
+        shards = self._shards(path)
+        if shards:
+            return shards.load_all()
+        # A prebuilt binary snapshot is used while it still matches the JSON file
+        data = bank_snapshot.load_fresh(path)
+        if data:
+            return data
+        return read_json(path, {"categories": []})
+
+    def load_categories(self, path):
+        """Category summaries: id, name and question count."""
+        shards = self._shards(path)
+        if shards:
+            return shards.categories()
+        mapped = self.mapped_bank(path)
+        if mapped is not None:
+            return mapped.categories()
+        return [{"id": cat["id"], "name": cat["name"], "count": len(cat.get("questions", []))}
+                for cat in self.load_bank(path)["categories"]]
+
+    def category_signature(self, path, category_id):
+        shards = self._shards(path)
+        return shards.category_signature(category_id) if shards else file_signature(path)
+
+    def load_category(self, path, category_id):
+        shards = self._shards(path)
+        if shards:
+            return shards.load_category(category_id)
+        mapped = self.mapped_bank(path)
+        if mapped is not None:
+            return mapped.category(category_id)  # questions are decoded when indexed
+        return next((cat for cat in self.load_bank(path)["categories"] if cat["id"] == category_id), None)
+
+    def save_bank(self, path, data):
+        shards = self._shards(path)
+        if shards:
+            shards.save_all(data)  # only the shards that changed are rewritten
+            return
+        with self._lock, file_lock(path):
+            self._write_bank(path, data)
+
+    def save_category(self, path, category):
+        """Add or replace one category. With shards, only its file and the manifest are rewritten."""
+        shards = self._shards(path)
+        if shards:
+            shards.save_category(category)
+            return
+        with self._lock, file_lock(path):
+            data = self.load_bank(path)  # re-read under the lock so concurrent edits of other categories are kept
+            categories = data.setdefault("categories", [])
+            for position, cat in enumerate(categories):
+                if cat["id"] == category["id"]:
+                    categories[position] = category
+                    break
+            else:
+                categories.append(category)
+            self._write_bank(path, data)
+
+    def _write_bank(self, path, data):
+        write_json_atomic(path, data, indent=2)
+        if os.path.exists(bank_mmap.mapped_path_for(path)):
+            bank_mmap.build(path)  # keep the compiled bank in use rather than falling back to the JSON
+
+    # History
+    def history_log(self, path):
+        """Return the append-only log that replaces the JSON history file at `path`."""
+        log_path = history_log.log_path_for(path)
+        with self._lock:
+            log = self._logs.get(log_path)
+            if log is None:
+                is_new = not os.path.exists(log_path)
+                log = history_log.HistoryLog(log_path)
+                if is_new and log_path != path:
+                    history_log.import_json_history(path, log)
+                self._logs[log_path] = log
+            return log
+
+    def history_archive(self, path):
+        """Return the monthly archive of the log at `path` (empty until a compaction)."""
+        log_path = history_log.log_path_for(path)
+        with self._lock:
+            archive = self._archives.get(log_path)
+            if archive is None:
+                archive = self._archives[log_path] = history_archive.HistoryArchive(log_path)
+        archive.refresh()
+        return archive
+
+    def load_history(self, path, user_id=None):
+        """Every game (of one user), oldest first; archived months are decompressed when present."""
+        log = self.history_log(path)
+        archive = self.history_archive(path)
+        if not archive.segments:
+            return list(log.iter_all()) if user_id is None else log.read_user(user_id)
+        archived = [game for game in archive.iter_games() if user_id is None or game.get("user_id") == user_id]
+        recent = log.iter_all() if user_id is None else log.read_user(user_id)
+        return archived + [game for game in recent if game["id"] > archive.last_id]
+
+    def append_history(self, path, entry):
+        """Append a finished game and return its history id."""
+        return self.history_log(path).append(entry)
+
+    def append_history_many(self, path, entries):
+        """Append several games with one write and one fsync, returning their ids."""
+        return self.history_log(path).append_many(entries)
+
+    def history_since(self, path, cursor=None):
+        """Stream (game, cursor) pairs for games stored after `cursor` (None: from the start).
+
+        Archived games come first. The cursor is (last game id, log offset, log id base);
+        the offset is only reused while the log has not been compacted since.
+        """
+        log = self.history_log(path)
+        archive = self.history_archive(path)
+        last_id, offset, base = cursor or (0, 0, None)
+        if last_id < archive.last_id:
+            for game in archive.iter_games(last_id):
+                last_id = game["id"]
+                yield game, (last_id, 0, None)
+        if base != log.id_base:
+            offset = 0  # compacted since: find our place again by id
+        for game, end in log.iter_from(offset):
+            if game.get("id", 0) <= last_id:
+                continue
+            last_id = game["id"]
+            yield game, (last_id, end, log.id_base)
+
+    def history_page(self, path, user_id, page=1, page_size=10, category=None, date_from=None, date_to=None):
+        """Newest-first page of one user's game summaries and the number of matching games.
+
+        Summaries come from the summary sidecar; each has a "ref" for load_history_game().
+        """
+        summaries = self.history_log(path).user_summaries(user_id)
+        archive = self.history_archive(path)
+        if not archive.segments:
+            return history_log.filter_page(summaries, page, page_size, category, date_from, date_to)
+
+        # Recent games from the log, then older ones from the archive when the page reaches them
+        if summaries and summaries[0]["id"] <= archive.last_id:  # an interrupted compaction left copies
+            summaries = [summary for summary in summaries if summary["id"] > archive.last_id]
+        recent = history_log.filter_summaries(summaries, category, date_from, date_to)
+        first = (page - 1) * page_size
+        games = recent[first:first + page_size]
+        if len(games) < page_size:
+            games += archive.summaries(user_id, category, date_from, date_to, max(first - len(recent), 0),
+                                       page_size - len(games))
+        return games, len(recent) + archive.count(user_id, category, date_from, date_to)
+
+    def load_history_game(self, path, ref):
+        if isinstance(ref, str):  # "<month>:<id>" for archived games
+            return self.history_archive(path).read_game(ref)
+        return self.history_log(path).read_game(ref)
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY,
+    username TEXT NOT NULL,
+    username_key TEXT NOT NULL UNIQUE,
+    password TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS categories (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    position INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS questions (
+    category_id INTEGER NOT NULL REFERENCES categories(id) ON DELETE CASCADE,
+    id INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    body TEXT NOT NULL,
+    PRIMARY KEY (category_id, position)
+);
+CREATE TABLE IF NOT EXISTS history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER,
+    category TEXT,
+    score TEXT,
+    date TEXT,
+    questions TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS history_user_idx ON history(user_id, id);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+
+class SqliteStorage:
+    """Backend over a single SQLite database in WAL mode.
+
+    The `path` arguments of the repository methods name JSON files and are
+    ignored here: every kind of record lives in the one database.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._local = threading.local()  # sqlite3 connections must stay on their thread
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            # FULL: in WAL mode NORMAL skips the fsync on commit, and a stored game must survive a power loss
+            conn.execute("PRAGMA synchronous=FULL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+        return conn
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    # Users
+    def users_signature(self, path=None):
+        row = self._connect().execute("SELECT value FROM meta WHERE key = 'users_version'").fetchone()
+        return row["value"] if row else 0
+
+    def load_users(self, path=None):
+        rows = self._connect().execute("SELECT id, username, password FROM users ORDER BY id")
+        return [dict(row) for row in rows]
+
+    def find_user(self, path, username):
+        row = self._connect().execute(
+            "SELECT id, username, password FROM users WHERE username_key = ?",
+            (username.casefold(),)
+        ).fetchone()
+        return dict(row) if row else None
+
+    def get_user_by_id(self, path, user_id):
+        row = self._connect().execute(
+            "SELECT id, username, password FROM users WHERE id = ?", (user_id,)
+        ).fetchone()
+        return dict(row) if row else None
+
+    def add_user(self, path, username, password, user_id=None):
+        conn = self._connect()
+        try:
+            with conn:
+                cursor = conn.execute(
+                    "INSERT INTO users (id, username, username_key, password) VALUES (?, ?, ?, ?)",
+                    (user_id, username, username.casefold(), password)
+                )
+                conn.execute(
+                    "INSERT INTO meta (key, value) VALUES ('users_version', 1) "
+                    "ON CONFLICT(key) DO UPDATE SET value = value + 1"
+                )
+        except sqlite3.IntegrityError:
+            return None
+        return {"id": cursor.lastrowid, "username": username, "password": password}
+
+    # Question bank
+    def bank_signature(self, path=None):
+        row = self._connect().execute("SELECT value FROM meta WHERE key = 'bank_version'").fetchone()
+        return row["value"] if row else 0
+
+    def has_lazy_categories(self, path=None):
+        return True
+
+    def load_categories(self, path=None):
+        rows = self._connect().execute(
+            "SELECT c.id, c.name, COUNT(q.position) AS count FROM categories c "
+            "LEFT JOIN questions q ON q.category_id = c.id GROUP BY c.id ORDER BY c.position"
+        )
+        return [dict(row) for row in rows]
+
+    def category_signature(self, path, category_id):
+        return self.bank_signature(path)
+
+    def load_category(self, path, category_id):
+        conn = self._connect()
+        row = conn.execute("SELECT id, name FROM categories WHERE id = ?", (category_id,)).fetchone()
+        if row is None:
+            return None
+        rows = conn.execute(
+            "SELECT body FROM questions WHERE category_id = ? ORDER BY position", (category_id,)
+        )
+        return {"id": row["id"], "name": row["name"], "questions": [json.loads(r["body"]) for r in rows]}
+
+    def load_bank(self, path=None):
+        conn = self._connect()
+        categories = []
+        by_id = {}
+        for row in conn.execute("SELECT id, name FROM categories ORDER BY position"):
+            category = {"id": row["id"], "name": row["name"], "questions": []}
+            by_id[row["id"]] = category
+            categories.append(category)
+        for row in conn.execute("SELECT category_id, body FROM questions ORDER BY category_id, position"):
+            by_id[row["category_id"]]["questions"].append(json.loads(row["body"]))
+        return {"categories": categories}
+
+    def save_bank(self, path, data):
+        conn = self._connect()
+        with conn:  # one transaction: readers see the old bank or the new one, never a mix
+            conn.execute("DELETE FROM questions")
+            conn.execute("DELETE FROM categories")
+            for position, category in enumerate(data.get("categories", [])):
+                conn.execute(
+                    "INSERT INTO categories (id, name, position) VALUES (?, ?, ?)",
+                    (category["id"], category["name"], position)
+                )
+                conn.executemany(
+                    "INSERT INTO questions (category_id, id, position, body) VALUES (?, ?, ?, ?)",
+                    [(category["id"], question.get("id"), q_position, json.dumps(question, ensure_ascii=False))
+                     for q_position, question in enumerate(category.get("questions", []))]
+                )
+            conn.execute(
+                "INSERT INTO meta (key, value) VALUES ('bank_version', 1) "
+                "ON CONFLICT(key) DO UPDATE SET value = value + 1"
+            )
+
+    def save_category(self, path, category):
+        """Add or replace one category and its questions in one transaction."""
+        conn = self._connect()
+        with conn:
+            updated = conn.execute("UPDATE categories SET name = ? WHERE id = ?", (category["name"], category["id"]))
+            if not updated.rowcount:
+                conn.execute(
+                    "INSERT INTO categories (id, name, position) "
+                    "VALUES (?, ?, (SELECT COALESCE(MAX(position) + 1, 0) FROM categories))",
+                    (category["id"], category["name"])
+                )
+            conn.execute("DELETE FROM questions WHERE category_id = ?", (category["id"],))
+            conn.executemany(
+                "INSERT INTO questions (category_id, id, position, body) VALUES (?, ?, ?, ?)",
+                [(category["id"], question.get("id"), q_position, json.dumps(question, ensure_ascii=False))
+                 for q_position, question in enumerate(category.get("questions", []))]
+            )
+            conn.execute(
+                "INSERT INTO meta (key, value) VALUES ('bank_version', 1) "
+                "ON CONFLICT(key) DO UPDATE SET value = value + 1"
+            )
+
+    # History
+    def _history_row(self, row):
+        return {
+            "id": row["id"],
+            "user_id": row["user_id"],
+            "category": row["category"],
+            "questions": json.loads(row["questions"]),
+            "score": row["score"],
+            "date": row["date"]
+        }
+
+    def load_history(self, path=None, user_id=None):
+        conn = self._connect()
+        if user_id is None:
+            rows = conn.execute("SELECT * FROM history ORDER BY id")
+        else:
+            rows = conn.execute("SELECT * FROM history WHERE user_id = ? ORDER BY id", (user_id,))
+        return [self._history_row(row) for row in rows]
+
+    def history_page(self, path, user_id, page=1, page_size=10, category=None, date_from=None, date_to=None):
+        where = ["user_id = ?"]
+        params = [user_id]
+        if category is not None:
+            where.append("category = ?")
+            params.append(category)
+        if date_from is not None:
+            where.append("substr(date, 1, 10) >= ?")
+            params.append(date_from.isoformat())
+        if date_to is not None:
+            where.append("substr(date, 1, 10) <= ?")
+            params.append(date_to.isoformat())
+        conn = self._connect()
+        clause = " AND ".join(where)
+        total = conn.execute(f"SELECT COUNT(*) FROM history WHERE {clause}", params).fetchone()[0]
+        rows = conn.execute(
+            f"SELECT id, category, score, date, json_array_length(questions) AS questions FROM history "
+            f"WHERE {clause} ORDER BY id DESC LIMIT ? OFFSET ?",
+            params + [page_size, (page - 1) * page_size]
+        )
+        return [dict(row, ref=row["id"]) for row in rows], total
+
+    def load_history_game(self, path, ref):
+        row = self._connect().execute("SELECT * FROM history WHERE id = ?", (ref,)).fetchone()
+        return self._history_row(row) if row else None
+
+    def history_since(self, path=None, cursor=None):
+        rows = self._connect().execute("SELECT * FROM history WHERE id > ? ORDER BY id", (cursor or 0,))
+        for row in rows:
+            yield self._history_row(row), row["id"]
+
+    def append_history(self, path, entry):
+        return self.append_history_many(path, [entry])[0]
+
+    def append_history_many(self, path, entries):
+        """Insert several games in one transaction, returning their ids."""
+        conn = self._connect()
+        ids = []
+        with conn:
+            for entry in entries:
+                cursor = conn.execute(
+                    "INSERT INTO history (id, user_id, category, score, date, questions) VALUES (?, ?, ?, ?, ?, ?)",
+                    (entry.get("id"), entry["user_id"], entry["category"], entry["score"], entry["date"],
+                     json.dumps(entry["questions"], ensure_ascii=False))
+                )
+                ids.append(cursor.lastrowid)
+        return ids
+
+
+_storage = None
+_storage_lock = threading.Lock()
+
+def get_storage():
+    """Return the process-wide storage backend selected by QCM_STORAGE (default: json)."""
+    global _storage
+    if _storage is None:
+        with _storage_lock:
+            if _storage is None:
+                _storage = make_storage(os.environ.get(STORAGE_ENV, "json"))
+    return _storage
+
+def set_storage(storage):
+    """Replace the process-wide backend (used by tools and the migration)."""
+    global _storage
+    with _storage_lock:
+        _storage = storage
+
+def make_storage(kind, db_path=None):
+    kind = kind.strip().lower()
+    if kind == "json":
+        return JsonStorage()
+    if kind == "sqlite":
+        return SqliteStorage(db_path or os.environ.get(DB_PATH_ENV) or get_file_path(DEFAULT_DB_NAME))
+    raise ValueError(f"Unknown storage backend '{kind}' (expected 'json' or 'sqlite').")
+
+
+def migrate_json_to_sqlite(users_file='users.json', bank_file='qcm.json', history_file='history.json', db_path=None):
+    """One-shot import of the JSON files into an empty SQLite database."""
+    source = JsonStorage()
+    target = SqliteStorage(db_path or get_file_path(DEFAULT_DB_NAME))
+    conn = target._connect()
+    if conn.execute("SELECT EXISTS(SELECT 1 FROM users) OR EXISTS(SELECT 1 FROM history)").fetchone()[0]:
+        raise RuntimeError(f"Database '{target.db_path}' already contains data, refusing to migrate twice.")
+
+    users = source.load_users(get_file_path(users_file))
+    for user in users:
+        if target.add_user(None, user["username"], user["password"], user_id=user["id"]) is None:
+            print(f"Skipping duplicate username '{user['username']}'.")
+
+    target.save_bank(None, source.load_bank(get_file_path(bank_file)))
+
+    history = source.load_history(get_file_path(history_file))
+    with conn:
+        conn.executemany(
+            "INSERT INTO history (id, user_id, category, score, date, questions) VALUES (?, ?, ?, ?, ?, ?)",
+            [(game.get("id"), game["user_id"], game["category"], game["score"], game["date"],
+              json.dumps(game["questions"], ensure_ascii=False)) for game in history]
+        )
+    print(f"Migrated {len(users)} users and {len(history)} games into '{target.db_path}'.")
+    return target
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="QCM storage tools")
+    sub = parser.add_subparsers(dest="command", required=True)
+    migrate = sub.add_parser("migrate", help="import users.json, qcm.json and history.json into SQLite")
+    migrate.add_argument("--db", default=None, help=f"database path (default: {DEFAULT_DB_NAME})")
+    migrate.add_argument("--users", default="users.json")
+    migrate.add_argument("--bank", default="qcm.json")
+    migrate.add_argument("--history", default="history.json")
+    args = parser.parse_args()
+
+    if args.command == "migrate":
+        migrate_json_to_sqlite(args.users, args.bank, args.history, args.db)
@@ -1,6 +1,13 @@
 import streamlit as st
-import datetime
+import adaptive
+import admin_functions as af
+import leaderboard
+import metrics
+import question_ids
 import quiz_app as qa
+import quiz_session
+import search_index
+import session_store
 import user_functions as uf
 
 def init_session_state():
@@ -10,17 +17,38 @@ def init_session_state():
         st.session_state.username = None     # Stores current username tae user
     if 'is_admin' not in st.session_state:
         st.session_state.is_admin = False    # Tracks if admin login
-    if 'current_question' not in st.session_state:
-        st.session_state.current_question = 0   # Tracks current question index, there are many usage of it obv
-    if 'score' not in st.session_state:
-        st.session_state.score = 0      # Stores current qcm score of player
-    if 'user_answers' not in st.session_state:
-        st.session_state.user_answers = []      # Stores user answers for history
+    if 'quiz_token' not in st.session_state:
+        st.session_state.quiz_token = None    # Token of the current quiz attempt in the session store
     if 'quiz_started' not in st.session_state:
         st.session_state.quiz_started = False       # Tracks if quiz is in progress
     if 'selected_category' not in st.session_state:
         st.session_state.selected_category = None       # Stores selected qcm category
 
+SECONDS_PER_QUESTION = 10  # change here if you want to test the time
+
+def _timer(token, session):
+    st.subheader(f"Time: {int(session.remaining())}s")
+    if session.check_deadline() == quiz_session.EXPIRED:
+        # Same path as a finished quiz, then redraw the whole page to show the result
+        session_store.finish(token, session)
+        st.rerun()
+
+def _client_timer(token, session):
+    """Older Streamlit without fragments: the countdown ticks in the browser, the deadline is checked on answers."""
+    import streamlit.components.v1 as components
+    components.html(f"""
+        <div id="timer" style="font: 600 1.5rem sans-serif;">Time: {int(session.remaining())}s</div>
+        <script>
+        const end = Date.now() + {1000 * session.remaining():.0f};
+        const timer = document.getElementById("timer");
+        setInterval(() => timer.textContent = "Time: " + Math.max(0, Math.floor((end - Date.now()) / 1000)) + "s", 1000);
+        </script>
+    """, height=45)
+
+# The timer is a fragment: it reruns on its own every second, without the rest of the page
+_fragment = getattr(st, "fragment", None) or getattr(st, "experimental_fragment", None)
+live_timer = _fragment(run_every=1)(_timer) if _fragment else _client_timer
+
 def display_quiz(category, user_id):
 
      # check and valid if category has questions
@@ -69,6 +97,16 @@ def display_quiz(category, user_id):
         </style>
     """, unsafe_allow_html=True)
 
+    sessions = session_store.get_session_store()
+
+    # An attempt in progress is found again from its URL, on any worker and after a restart
+    if not st.session_state.quiz_started and "attempt" in st.query_params:
+        token = st.query_params["attempt"]
+        resumed = sessions.get(token)
+        if resumed is not None and resumed.user_id == user_id and not resumed.stored:
+            st.session_state.quiz_token = token
+            st.session_state.quiz_started = True
+
     # qcm initialization interface
     if not st.session_state.quiz_started:
         st.subheader("Quiz Settings")
@@ -76,111 +114,79 @@ def display_quiz(category, user_id):
             "How many questions would you like to attempt?",
             options=[10, 20, 30]
         )
+        adaptive_mode = st.checkbox("Adaptive mode (questions matched to your level)")
         
         if st.button("Start Quiz"):
-            # Initialize qcm with random questions from category
-            questions = category.get('questions', [])
-            import random
-            selected_questions = random.sample(
-                questions, 
-                min(num_questions, len(questions))
-            )
-            # Setting states for qcm
-            st.session_state.questions = selected_questions
-            st.session_state.current_question = 0
-            st.session_state.score = 0
-            st.session_state.user_answers = []
+            # The session draws the questions (seeded so the draw can be replayed) and starts the timer
+            session = quiz_session.QuizSession.start(user_id, category, num_questions, SECONDS_PER_QUESTION, adaptive_mode)
+            if adaptive_mode:
+                # Only the first question is picked now, the next ones follow the user's rating
+                session.pick_adaptive(adaptive.get_engine())
+            token = session_store.new_token()
+            sessions.put(token, session)
+            st.session_state.quiz_token = token
             st.session_state.quiz_started = True
-            st.session_state.start_time = datetime.datetime.now()
-            st.session_state.total_time = num_questions * 10# 10 seconds per question, change here if you want to test the time
-            st.session_state.answer_submitted = False
-            st.session_state.quiz_completed = False  # status added to prevent multiple history entries, we'll try and see hopefully it works (it worked yay)
+            st.query_params["attempt"] = token
             st.rerun()
     
     # qcm running interface
     elif st.session_state.quiz_started:
         st.empty()
         
-        questions = st.session_state.questions
-        current_q = st.session_state.current_question
-        
-        # Calculate remaining time by seconds
-        elapsed_time = (datetime.datetime.now() - st.session_state.start_time).total_seconds()
-        remaining_time = max(0, st.session_state.total_time - elapsed_time)
+        token = st.session_state.quiz_token
+        session = sessions.get(token)
+        if session is None:  # expired and collected in the meantime
+            st.session_state.quiz_started = False
+            st.rerun()
+        session.check_deadline()
+        current_q = session.cursor
+        quiz_length = session.length
         
         # Display qcm header with question number, score, and time
         col1, col2, col3 = st.columns([2, 1, 1])
         with col1:
-            if current_q < len(questions):
-                st.subheader(f"Question {current_q + 1}")
-            else:
-                st.subheader(f"Question {len(questions)}")  # Ensure it remains at the total number of questions after displaying the last question
+            st.subheader(f"Question {min(current_q + 1, quiz_length)}")  # stays at the last number once done
         with col2:
-            st.subheader(f"Score: {st.session_state.score}")
+            st.subheader(f"Score: {session.score}")
         with col3:
-            st.subheader(f"Time: {int(remaining_time)}s")
+            if session.done():
+                st.subheader(f"Time: {int(session.remaining())}s")
+            else:
+                live_timer(token, session)
         
         # Display progress bar (pretty innit)
-        progress = st.progress((current_q) / len(questions))
-        
-        # Handle qcm timeout
-        if remaining_time <= 0:
-            st.error("Time's up! Quiz ended.")
-            
-            # Store qcm history in cas user didn't make it in time 
-            if not st.session_state.get('quiz_completed', False):
-                final_score = st.session_state.score
-                total_questions = len(questions)
-                
-                qa.store_quiz_history(
-                    user_id,
-                    category['name'],
-                    st.session_state.user_answers,
-                    f"{final_score}/{total_questions}",
-                    'history.json'
-                )
-                st.session_state.quiz_completed = True
-            
-            # Show final score and a cta to ask if user wants to take another try
-            st.success(f"Quiz completed! Your score: {st.session_state.score}/{len(questions)}")
-            
-            if st.button("Take Another Quiz"):
-                # Reset qcm states
-                st.session_state.quiz_started = False
-                st.session_state.current_question = 0
-                st.session_state.score = 0
-                st.session_state.user_answers = []
-                st.session_state.selected_category = None
-                st.session_state.quiz_completed = False
-                st.rerun()
-            return
+        progress = st.progress(min(current_q / quiz_length, 1.0))
         
+        question = session.question()
+
         # Display current question and options
-        if current_q < len(questions):
-            question = questions[current_q]
-            
+        if question is not None:
             st.write("---")
             st.write(question['question'])
             
             col1, col2 = st.columns(2)
             
             # Show options if answer not submitted
-            if not st.session_state.get('answer_submitted', False):
+            if not session.answered():
                 for idx, opt in enumerate(question['options']):
                     with col1 if idx < 2 else col2:
                         if st.button(f"{opt['id']}) {opt['text']}", key=f"opt_{opt['id']}"):
-                            st.session_state.selected_answer = opt['id']
-                            st.session_state.answer_submitted = True
+                            is_correct = session.answer(opt['id'])
+                            if is_correct is not None:
+                                if session.adaptive:
+                                    adaptive.get_engine().record_answer(user_id, session.category, question, is_correct)
+                                sessions.put(token, session)
                             st.rerun()
             
             # Show the correct and wrong answers by colors
             else:
+                selected_answer = session.current_answer()
                 for idx, opt in enumerate(question['options']):
                     with col1 if idx < 2 else col2:
                         if opt['id'] == question['correct_answer']:
                             css_class = "correct-answer"
-                        elif opt['id'] == st.session_state.selected_answer:
-                            css_class = "wrong-answer" if opt['id'] != question['correct_answer'] else "correct-answer"
+                        elif opt['id'] == selected_answer:
+                            css_class = "wrong-answer"
                         else:
                             css_class = "normal-answer"
 
@@ -192,84 +198,119 @@ def display_quiz(category, user_id):
                 
                 # Handle next question 
                 if st.button("Next Question"):
-                    is_correct = (st.session_state.selected_answer == question['correct_answer'])
-                    if is_correct:
-                        st.session_state.score += 1
-                    
-                    # Store answer for history
-                    st.session_state.user_answers.append({
-                        "question": question['question'],
-                        "user_answer": st.session_state.selected_answer,
-                        "is_correct": is_correct
-                    })
-                    
-                    st.session_state.current_question += 1
-                    st.session_state.answer_submitted = False
+                    if session.adaptive:
+                        # Pick the next question for the updated rating
+                        session.pick_adaptive(adaptive.get_engine())
+                    session.next()
+                    sessions.put(token, session)
                     st.rerun()
         
-        # Qcm completed
+        # Qcm over, by time or by answering everything
         else:
-            # Only store qcm history if it hasn't been stored yet
-            if not st.session_state.get('quiz_completed', False):
-                final_score = st.session_state.score
-                total_questions = len(questions)
-                
-                qa.store_quiz_history(
-                    user_id,
-                    category['name'],
-                    st.session_state.user_answers,
-                    f"{final_score}/{total_questions}",
-                    'history.json'
-                )
-                st.session_state.quiz_completed = True  # Mark quiz as completed
+            if session.state == quiz_session.EXPIRED:
+                st.error("Time's up! Quiz ended.")
+
+            # The session is stored only once, whatever the number of reruns and workers
+            session_store.finish(token, session)
             
-            st.success(f"Quiz completed! Your score: {st.session_state.score}/{len(questions)}")
+            st.success(f"Quiz completed! Your score: {session.score_text()}")
             
             # Option to start new qcm
             if st.button("Take Another Quiz"):
                 st.session_state.quiz_started = False
-                st.session_state.current_question = 0
-                st.session_state.score = 0
-                st.session_state.user_answers = []
+                st.session_state.quiz_token = None
                 st.session_state.selected_category = None
-                st.session_state.quiz_completed = False  # Reset completion status
+                st.query_params.pop("attempt", None)
                 st.rerun()
 
+HISTORY_PAGE_SIZE = 10
+
+def reset_history_page():
+    st.session_state.history_page = 1
+
 def view_history(user_id):
     try:
-        history_data = qa.load_json_file('history.json')
-        if not history_data:
-            st.warning("No history available.")
-            return
+        st.subheader("Your Quiz History")
 
-        # Filter history for current user    
-        user_history = [game for game in history_data if game['user_id'] == user_id]
-
-        if user_history:
-            st.subheader("Your Quiz History")
-            # Display each qcm attempt with questions and answers
-            for index, game in enumerate(user_history, start=1):
-                with st.expander(f"Game {index}: {game['category']} - Score: {game['score']} - Date: {game['date']}"):
-                    st.write("Questions and Answers:")
-                    for q in game['questions']:
-                        st.write(f"Question: {q['question']}")
-                        st.write(f"Your answer: {q['user_answer']}")
-                        if q['is_correct']:
-                            st.success("Correct ✅")
-                        else:
-                            st.error("Incorrect ❌")
-                        st.write("---")
+        # Filters, applied on the server before a page is read
+        col1, col2 = st.columns(2)
+        with col1:
+            category_names = ["All categories"] + [cat['name'] for cat in qa.load_categories()]
+            category = st.selectbox("Category:", category_names, key="history_category", on_change=reset_history_page)
+        with col2:
+            dates = st.date_input("Date range:", value=[], key="history_dates", on_change=reset_history_page)
+        date_from = dates[0] if len(dates) > 0 else None
+        date_to = dates[1] if len(dates) > 1 else None
+
+        # Only the summaries of the current page are read, newest first
+        page = st.session_state.get('history_page', 1)
+        games, total = qa.load_history_page(
+            user_id, 'history.json', page, HISTORY_PAGE_SIZE,
+            None if category == "All categories" else category, date_from, date_to
+        )
+
+        if total:
+            pages = (total + HISTORY_PAGE_SIZE - 1) // HISTORY_PAGE_SIZE
+            st.caption(f"{total} games - page {page} of {pages}")
+            # Display each qcm attempt, its questions are fetched only when asked for
+            for index, game in enumerate(games):
+                number = total - (page - 1) * HISTORY_PAGE_SIZE - index
+                with st.expander(f"Game {number}: {game['category']} - Score: {game['score']} - Date: {game['date']}"):
+                    if st.checkbox("Show questions and answers", key=f"history_details_{game['ref']}"):
+                        record = qa.load_history_game(game['ref'], 'history.json')
+                        for q in record['questions']:
+                            st.write(f"Question: {q['question']}")
+                            if q.get('edited'):
+                                st.caption("This question has been edited since the game was played.")
+                            st.write(f"Your answer: {q['user_answer']}")
+                            if q['is_correct']:
+                                st.success("Correct ✅")
+                            else:
+                                st.error("Incorrect ❌")
+                            st.write("---")
+
+            col1, col2 = st.columns(2)
+            with col1:
+                if page > 1 and st.button("Newer games"):
+                    st.session_state.history_page = page - 1
+                    st.rerun()
+            with col2:
+                if page < pages and st.button("Older games"):
+                    st.session_state.history_page = page + 1
+                    st.rerun()
         else:
             st.info("No quiz history found.")
     except Exception as e:
         st.error(f"Error loading history: {str(e)}")
 
+def view_leaderboard():
+    st.subheader("Leaderboard")
+    categories = qa.load_categories()
+    col1, col2 = st.columns(2)
+    with col1:
+        category = st.selectbox("Category:", ["All categories"] + [cat['name'] for cat in categories])
+    with col2:
+        window_labels = {"day": "Today", "week": "This week", "all": "All time"}
+        window = st.selectbox("Period:", leaderboard.WINDOWS, index=2, format_func=lambda w: window_labels[w])
+
+    # Read straight from the in-memory top-K board, the history file is not touched
+    entries = leaderboard.get_leaderboards().top(None if category == "All categories" else category, window)
+    if not entries:
+        st.info("No results yet for this leaderboard.")
+        return
+
+    users = uf.get_user_store('users.json')
+    for rank, entry in enumerate(entries, start=1):
+        user = users.get_by_id(entry['user_id'])
+        name = user['username'] if user else f"User {entry['user_id']}"
+        st.write(f"**{rank}. {name}** - {entry['correct']}/{entry['total']} in {entry['category']} ({entry['date'][:16]})")
+
 def admin_menu():
     st.title("Admin Menu")
     
     menu_choice = st.sidebar.radio(
         "Admin Options",
-        ["Add Category", "Add Question", "Delete Category", "Delete Question", "Logout"]
+        ["Add Category", "Add Question", "Delete Category", "Delete Question", "Analytics", "Logout"]
     )
     
     # Adding new category
@@ -277,20 +318,19 @@ def admin_menu():
         st.subheader("Add New Category")
         category_name = st.text_input("Enter category name:")
         if st.button("Add Category") and category_name:
-            data = qa.load_json_file('qcm.json') or {"categories": []}
+            categories = qa.load_categories()
             
             # Check if category exists
-            if any(cat["name"].lower() == category_name.lower() for cat in data["categories"]):
+            if any(cat["name"].lower() == category_name.lower() for cat in categories):
                 st.error("Category already exists!")
             else:
-                new_category_id = 1 if not data["categories"] else data["categories"][-1]["id"] + 1
+                new_category_id = 1 if not categories else categories[-1]["id"] + 1
                 new_category = {
                     "id": new_category_id,
                     "name": category_name,
                     "questions": []
                 }
-                data["categories"].append(new_category)
-                qa.save_json_file('qcm.json', data)
+                qa.save_category(new_category)
                 st.success(f"Category '{category_name}' added successfully!")
 
     # Adding new question
@@ -298,8 +338,7 @@ def admin_menu():
         st.subheader("Add Question")
         
         # Load categories for selection
-        data = qa.load_json_file('qcm.json') or {"categories": []}
-        categories = data.get("categories", [])
+        categories = qa.load_categories()
         
         if not categories:
             st.warning("No categories available. Please create a category first.")
@@ -317,6 +356,7 @@ def admin_menu():
             option_c = st.text_input("Option C:")
             option_d = st.text_input("Option D:")
             correct_answer = st.selectbox("Correct Answer:", ["a", "b", "c", "d"])
+            allow_duplicate = st.checkbox("Add even if similar questions already exist")
             
             submit_button = st.form_submit_button("Add Question")
             
@@ -324,13 +364,15 @@ def admin_menu():
                 if not all([question_text, option_a, option_b, option_c, option_d]):
                     st.error("Please fill in all fields!")
                 else:
-                    # Find selected category and add question
-                    category = next(cat for cat in categories if cat["name"] == selected_category)
+                    # Load only the selected category and add the question to it
+                    category_id = next(cat["id"] for cat in categories if cat["name"] == selected_category)
+                    category = qa.edit_category(category_id)
                     
                     # Create new question
-                    question_id = len(category["questions"]) + 1
+                    question_id = question_ids.next_question_id(category)
                     new_question = {
                         "id": question_id,
+                        "uid": question_ids.new_uid(),
                         "question": question_text,
                         "options": [
                             {"id": "a", "text": option_a},
@@ -341,39 +383,46 @@ def admin_menu():
                         "correct_answer": correct_answer
                     }
                     
-                    # Add question to category
-                    category["questions"].append(new_question)
-                    qa.save_json_file('qcm.json', data)
-                    st.success("Question added successfully!")
+                    duplicates = [] if allow_duplicate else af.similar_questions('qcm.json', new_question)
+                    if duplicates:
+                        st.warning("This question looks like questions already in the bank:")
+                        for hit in duplicates[:5]:
+                            st.write(f"[{hit['category']}] Q{hit['id']}: {hit['question']} "
+                                     f"({hit['similarity']:.0%} similar)")
+                        st.info("Tick \"Add even if similar questions already exist\" to add it anyway.")
+                    else:
+                        # Add question to category
+                        category["questions"].append(new_question)
+                        qa.save_category(category)
+                        st.success("Question added successfully!")
 
     # Deleting category
     elif menu_choice == "Delete Category":
         st.subheader("Delete Category")
         
         # Load categories
-        data = qa.load_json_file('qcm.json') or {"categories": []}
-        categories = data.get("categories", [])
+        categories = qa.load_categories()
         
         if not categories:
             st.warning("No categories available.")
             return
         
         # Display categories with their questions count
-        category_options = [f"{cat['name']} ({len(cat['questions'])} questions)" for cat in categories]
+        category_options = [f"{cat['name']} ({cat['count']} questions)" for cat in categories]
         selected_category = st.selectbox("Select category to delete:", category_options)
         
         if st.button("Delete Category"):
             category_name = selected_category.split(" (")[0]
-            data["categories"] = [cat for cat in categories if cat["name"] != category_name]
-            qa.save_json_file('qcm.json', data)
+            data = qa.edit_bank()
+            data["categories"] = [cat for cat in data["categories"] if cat["name"] != category_name]
+            qa.save_bank(data)
             st.success(f"Category '{category_name}' deleted successfully!")
 
     elif menu_choice == "Delete Question":
         st.subheader("Delete Question")
         
         # Load categories
-        data = qa.load_json_file('qcm.json') or {"categories": []}
-        categories = data.get("categories", [])
+        categories = qa.load_categories()
         
         if not categories:
             st.warning("No categories available.")
@@ -383,29 +432,63 @@ def admin_menu():
         category_names = [cat["name"] for cat in categories]
         selected_category_name = st.selectbox("Select Category:", category_names)
         
-        # Get selected category and its questions
-        category = next(cat for cat in categories if cat["name"] == selected_category_name)
-        questions = category.get("questions", [])
+        # Get selected category and its questions (only this category is loaded)
+        category = qa.load_category(next(cat["id"] for cat in categories if cat["name"] == selected_category_name))
+        questions = category.get("questions", []) if category else []
         
         if not questions:
             st.warning("No questions available in this category.")
             return
         
-        # Question selection
-        question_options = [f"Q{q['id']}: {q['question']}" for q in questions]
+        # Question selection, narrowed down by the search box on large categories
+        query = st.text_input("Search questions:", placeholder="Words or word beginnings")
+        if query:
+            hits = search_index.search(query, category_id=category["id"], limit=50)
+            if not hits:
+                st.info("No matching questions.")
+                return
+            question_options = [f"Q{hit['id']}: {hit['question']}" for hit in hits]
+        else:
+            question_options = [f"Q{q['id']}: {q['question']}" for q in questions]
         selected_question = st.selectbox("Select question to delete:", question_options)
         
         if st.button("Delete Question"):
             question_id = int(selected_question.split(":")[0][1:])
-            category["questions"] = [q for q in questions if q["id"] != question_id]
-            qa.save_json_file('qcm.json', data)
+            category = qa.edit_category(category["id"])
+            category["questions"] = [q for q in category["questions"] if q["id"] != question_id]
+            qa.save_category(category)
             st.success("Question deleted successfully!")
     
+    elif menu_choice == "Analytics":
+        st.subheader("Question and User Analytics")
+        try:
+            import analytics  # needs numpy, only loaded when the page is opened
+        except ImportError:
+            st.error("Analytics need the numpy library: pip install numpy")
+            return
+
+        report = analytics.get_analytics('history.json')  # only new games are parsed on each rerun
+        summary = report.summary()
+        st.write(f"{summary['games']} games, {summary['answers']} answers, {summary['questions']} questions")
+
+        category_filter = st.selectbox("Category:", ["All"] + report.categories.labels)
+        questions = report.question_stats()
+        users = report.user_category_stats()
+        if category_filter != "All":
+            questions = [q for q in questions if q["category"] == category_filter]
+            users = [u for u in users if u["category"] == category_filter]
+
+        st.write("Questions (p-value = share of correct answers, D = discrimination index):")
+        st.dataframe(sorted(questions, key=lambda q: q["p_value"]))
+        st.write("User accuracy per category:")
+        st.dataframe(sorted(users, key=lambda u: u["accuracy"], reverse=True))
+
     elif menu_choice == "Logout":
         if st.button("Confirm Logout"):
             st.session_state.is_admin = False
             st.rerun()
 
+@metrics.timed("streamlit.rerun")
 def main():
     init_session_state()
     
@@ -453,11 +536,11 @@ def main():
         
         menu_choice = st.sidebar.radio(
             "Menu",
-            ["Take Quiz", "View History", "Logout"]
+            ["Take Quiz", "View History", "Leaderboard", "Logout"]
         )
         
         if menu_choice == "Take Quiz":
-            categories = qa.load_quiz()
+            categories = qa.load_categories()
             if categories:
                 if not st.session_state.quiz_started:
                     selected_category = st.selectbox(
@@ -466,7 +549,8 @@ def main():
                         format_func=lambda x: x['name']
                     )
                     if selected_category:
-                        st.session_state.selected_category = selected_category
+                        # Questions are only loaded for the category actually picked
+                        st.session_state.selected_category = qa.load_category(selected_category['id'])
                 
                 if st.session_state.selected_category:
                     display_quiz(
@@ -481,6 +565,11 @@ def main():
             st.session_state.quiz_started = False
             st.session_state.selected_category = None
         
+        elif menu_choice == "Leaderboard":
+            view_leaderboard()
+            st.session_state.quiz_started = False
+            st.session_state.selected_category = None
+        
         elif menu_choice == "Logout":
             if st.button("Confirm Logout"):
                 st.session_state.logged_in = False
@@ -0,0 +1,91 @@
+import asyncio
+
+import pytest
+
+import api_server
+
+
+def read(data, limit=2 ** 16):
+    """Feed `data` to a stream and read one request from it."""
+    async def run():
+        reader = asyncio.StreamReader(limit=limit)
+        reader.feed_data(data)
+        reader.feed_eof()
+        return await api_server.read_request(reader)
+    return asyncio.run(run())
+
+
+def read_error(data, **kwargs):
+    with pytest.raises(api_server.ApiError) as error:
+        read(data, **kwargs)
+    return error.value.status, str(error.value)
+
+
+def test_request_with_body():
+    method, target, headers, body, keep_alive = read(
+        b"post /login HTTP/1.1\r\nHost: x\r\nContent-Length: 7\r\n\r\n{\"a\":1}")
+    assert (method, target, body, keep_alive) == ("POST", "/login", b'{"a":1}', True)
+    assert headers == {"host": "x", "content-length": "7"}
+
+
+@pytest.mark.parametrize("head, keep_alive", [
+    (b"GET / HTTP/1.1\r\n\r\n", True),
+    (b"GET / HTTP/1.1\r\nConnection: close\r\n\r\n", False),
+    (b"GET / HTTP/1.0\r\n\r\n", False),
+    (b"GET / HTTP/1.0\r\nConnection: Keep-Alive\r\n\r\n", True),
+])
+def test_keep_alive(head, keep_alive):
+    assert read(head)[4] is keep_alive
+
+
+def test_eof_and_truncated_head():
+    assert read(b"") is None
+    assert read(b"GET / HTTP/1.1\r\nHost: x\r\n") is None  # the client went away mid-request
+
+
+def test_pipelined_requests():
+    async def run():
+        reader = asyncio.StreamReader()
+        reader.feed_data(b"POST /a HTTP/1.1\r\nContent-Length: 2\r\n\r\nhiGET /b HTTP/1.1\r\n\r\n")
+        reader.feed_eof()
+        return [await api_server.read_request(reader) for _ in range(3)]
+    first, second, third = asyncio.run(run())
+    assert (first[1], first[3]) == ("/a", b"hi")
+    assert (second[1], second[3]) == ("/b", b"")
+    assert third is None
+
+
+@pytest.mark.parametrize("data", [
+    b"GET\r\n\r\n",
+    b"GET /\r\n\r\n",
+    b"\r\n\r\n",
+])
+def test_malformed_request_line(data):
+    assert read_error(data) == (400, "Malformed request line")
+
+
+@pytest.mark.parametrize("length", [b"-1", b"abc", b"1e3", b"+5", b" 5 5", "٥".encode("utf-8")])
+def test_invalid_content_length(length):
+    assert read_error(b"POST / HTTP/1.1\r\nContent-Length: " + length + b"\r\n\r\n") == \
+        (400, "Invalid Content-Length")
+
+
+def test_chunked_body_is_rejected():
+    status, _ = read_error(b"POST / HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n5\r\nhello\r\n0\r\n\r\n")
+    assert status == 400
+
+
+def test_body_too_large():
+    length = str(api_server.MAX_BODY_BYTES + 1).encode()
+    assert read_error(b"POST / HTTP/1.1\r\nContent-Length: " + length + b"\r\n\r\n") == (413, "Body too large")
+
+
+def test_headers_too_large():
+    data = b"GET / HTTP/1.1\r\nX: " + b"a" * api_server.MAX_HEADER_BYTES + b"\r\n\r\n"
+    assert read_error(data, limit=api_server.MAX_HEADER_BYTES) == (413, "Headers too large")
+
+
+def test_short_body():
+    # serve_connection() closes the connection on this one
+    with pytest.raises(asyncio.IncompleteReadError):
+        read(b"POST / HTTP/1.1\r\nContent-Length: 10\r\n\r\nabc")
@@ -0,0 +1,57 @@
+import os
+
+import pytest
+
+import bank_shards
+import quiz_app as qa
+import storage
+
+
+@pytest.fixture
+def bank_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "_storage", storage.JsonStorage())
+    path = str(tmp_path / "qcm.json")
+    storage.write_json_atomic(path, {"categories": [
+        {"id": 1, "name": "Python", "questions": [{"id": 1, "uid": "q1", "question": "2 + 2?"}]},
+        {"id": 2, "name": "SQL", "questions": [{"id": 1, "uid": "q2", "question": "SELECT 1?"}]}
+    ]})
+    bank_shards.convert(path)
+    return path
+
+
+def shard_stats(path):
+    directory = bank_shards.shard_dir_for(path)
+    return {name: os.stat(os.path.join(directory, name)).st_mtime_ns for name in os.listdir(directory)
+            if name.startswith("category-")}
+
+
+def test_category_edit_rewrites_only_its_shard(bank_file):
+    for name in shard_stats(bank_file):
+        os.utime(os.path.join(bank_shards.shard_dir_for(bank_file), name), ns=(1, 1))
+    sql = qa.bank_cache.get_category(bank_file, 2)
+
+    category = qa.edit_category(1, bank_file)
+    category["questions"].append({"id": 2, "question": "3 * 3?"})
+    qa.save_category(category, bank_file)
+
+    after = shard_stats(bank_file)
+    assert after["category-2.json"] == 1
+    assert after["category-1.json"] != 1
+    python = qa.bank_cache.get_category(bank_file, 1)
+    assert [q["question"] for q in python["questions"]] == ["2 + 2?", "3 * 3?"]
+    assert python["questions"][1]["uid"]  # new questions get their stable id
+    assert [c["count"] for c in qa.bank_cache.get_categories(bank_file)] == [2, 1]
+    assert qa.bank_cache.get_category(bank_file, 2) is sql  # still cached
+
+
+def test_edit_copy_leaves_the_cache_untouched(bank_file):
+    cached = qa.bank_cache.get_category(bank_file, 1)
+    category = qa.edit_category(1, bank_file)
+    category["questions"].append({"id": 2, "question": "3 * 3?"})
+    assert len(cached["questions"]) == 1
+
+
+def test_new_category(bank_file):
+    qa.save_category({"id": 3, "name": "Go", "questions": []}, bank_file)
+    assert [c["name"] for c in bank_shards.ShardedBank(bank_shards.shard_dir_for(bank_file)).categories()] == \
+        ["Python", "SQL", "Go"]
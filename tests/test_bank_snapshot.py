@@ -0,0 +1,62 @@
+import json
+import os
+import sys
+
+import pytest
+
+import bank_snapshot
+import storage
+
+BANK = {"categories": [{"id": 1, "name": "Python", "questions": [{"id": 1, "question": "2 + 2?"}]}]}
+
+
+@pytest.fixture
+def json_path(tmp_path):
+    path = tmp_path / "qcm.json"
+    path.write_text(json.dumps(BANK), encoding="utf-8")
+    return str(path)
+
+
+@pytest.fixture
+def frozen(tmp_path, json_path, monkeypatch):
+    """A onefile build: qcm.json next to the executable, qcm.bank extracted elsewhere with a newer mtime."""
+    bundle = tmp_path / "_MEI1234"
+    bundle.mkdir()
+    bank_snapshot.build(json_path, str(bundle / "qcm.bank"))
+    os.utime(json_path, ns=(1, 1))
+    monkeypatch.setattr(sys, "frozen", True, raising=False)
+    monkeypatch.setattr(sys, "_MEIPASS", str(bundle), raising=False)
+    return bundle
+
+
+def test_snapshot_next_to_the_bank(json_path):
+    assert bank_snapshot.load_fresh(json_path) is None
+    bank_snapshot.build(json_path)
+    assert bank_snapshot.load_fresh(json_path) == BANK
+    with open(json_path, 'a', encoding='utf-8') as file:
+        file.write(" ")  # an edit: the JSON is used again
+    assert bank_snapshot.load_fresh(json_path) is None
+
+
+def test_bundled_snapshot_is_used_when_frozen(json_path, frozen):
+    assert bank_snapshot.bundled_path_for(json_path) == str(frozen / "qcm.bank")
+    assert bank_snapshot.load_fresh(json_path) == BANK
+    os.remove(json_path)
+    assert bank_snapshot.load_fresh(json_path) == BANK  # the snapshot can be shipped alone
+
+
+def test_bundled_snapshot_of_another_bank_is_ignored(json_path, frozen):
+    with open(json_path, 'w', encoding='utf-8') as file:
+        json.dump({"categories": []}, file)  # edited by an admin since the build
+    assert bank_snapshot.load_fresh(json_path) is None
+    assert storage.JsonStorage().load_bank(json_path) == {"categories": []}
+
+
+def test_not_frozen(json_path, tmp_path, monkeypatch):
+    bundle = tmp_path / "_MEI1234"
+    bundle.mkdir()
+    bank_snapshot.build(json_path, str(bundle / "qcm.bank"))
+    monkeypatch.delattr(sys, "frozen", raising=False)
+    monkeypatch.setattr(sys, "_MEIPASS", str(bundle), raising=False)
+    assert bank_snapshot.bundled_path_for(json_path) is None
+    assert bank_snapshot.load_fresh(json_path) is None
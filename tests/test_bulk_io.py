@@ -0,0 +1,115 @@
+import io
+
+import pytest
+
+import bulk_io
+import storage
+
+CSV_ROW = {"category": " Python ", "question": " 2 + 2? ", "option_a": "3", "option_b": "4",
+           "option_c": "5", "option_d": "22", "correct_answer": "B", "uid": ""}
+
+
+def test_valid_csv_row():
+    category, question = bulk_io.validate_row(CSV_ROW)
+    assert category == "Python"
+    assert question == {
+        "question": "2 + 2?",
+        "options": [{"id": "a", "text": "3"}, {"id": "b", "text": "4"},
+                    {"id": "c", "text": "5"}, {"id": "d", "text": "22"}],
+        "correct_answer": "b"
+    }
+
+
+def test_valid_jsonl_row_keeps_its_uid():
+    row = {"category": "Python", "question": "2 + 2?", "correct_answer": "d", "uid": "abc",
+           "options": [{"id": o, "text": o.upper()} for o in "dcba"]}
+    _, question = bulk_io.validate_row(row)
+    assert question["uid"] == "abc"
+    assert [opt["id"] for opt in question["options"]] == ["a", "b", "c", "d"]  # always in a-d order
+    assert question["correct_answer"] == "d"
+
+
+@pytest.mark.parametrize("change, reason", [
+    ({"category": "  "}, "missing category"),
+    ({"question": None}, "missing question text"),
+    ({"option_c": ""}, "empty option c"),
+    ({"option_a": " ", "option_d": None}, "empty option a, d"),
+    ({"correct_answer": "e"}, "correct answer must be one of a, b, c, d (got 'e')"),
+    ({"correct_answer": None}, "correct answer must be one of a, b, c, d (got 'None')"),
+])
+def test_invalid_csv_rows(change, reason):
+    with pytest.raises(ValueError) as error:
+        bulk_io.validate_row(dict(CSV_ROW, **change))
+    assert str(error.value) == reason
+
+
+def test_jsonl_row_needs_four_options():
+    row = {"category": "Python", "question": "2 + 2?", "correct_answer": "a",
+           "options": [{"id": "a", "text": "4"}, {"id": "b", "text": "5"}]}
+    with pytest.raises(ValueError, match="expected 4 options, got 2"):
+        bulk_io.validate_row(row)
+
+
+def test_read_errors_are_passed_through():
+    rows = list(bulk_io.read_rows(io.StringIO('{"category": "x"\n\n[1]\n'), "jsonl"))
+    assert [line for line, _ in rows] == [1, 3]
+    with pytest.raises(ValueError, match="invalid JSON"):
+        bulk_io.validate_row(rows[0][1])
+    with pytest.raises(ValueError, match="expected a JSON object"):
+        bulk_io.validate_row(rows[1][1])
+
+
+def test_validated_collects_errors_with_line_numbers():
+    errors = []
+    rows = [(2, CSV_ROW), (3, dict(CSV_ROW, question="")), (4, "invalid JSON (Expecting value)")]
+    assert [line for line, _, _ in bulk_io.validated(rows, errors)] == [2]
+    assert errors == [(3, "missing question text"), (4, "invalid JSON (Expecting value)")]
+
+
+CSV_FILE = ("category,question,option_a,option_b,option_c,option_d,correct_answer\n"
+            "Python,2 + 2?,3,4,5,22,b\n"
+            "Python,,1,2,3,4,a\n"
+            "SQL,SELECT 1?,1,0,NULL,error,a\n")
+
+
+@pytest.fixture
+def bank_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "_storage", storage.JsonStorage())
+    path = str(tmp_path / "qcm.json")
+    storage.write_json_atomic(path, {"categories": [{"id": 1, "name": "Python", "questions": []}]})
+    return path
+
+
+def bank_questions(bank_file):
+    return {cat["name"]: [q["question"] for q in cat["questions"]]
+            for cat in storage.read_json(bank_file, {})["categories"]}
+
+
+def test_dry_run_then_save(bank_file):
+    report = bulk_io.import_questions(io.StringIO(CSV_FILE), bank_file=bank_file, dry_run=True)
+    assert (report.added, report.error_count, report.saved) == (2, 1, False)
+    assert report.summary() == "2 questions to add (dry run), 0 duplicates skipped, 1 invalid rows."
+    assert bank_questions(bank_file) == {"Python": []}
+
+    assert report.save() is True
+    assert report.summary() == "2 questions added, 0 duplicates skipped, 1 invalid rows."
+    assert bank_questions(bank_file) == {"Python": ["2 + 2?"], "SQL": ["SELECT 1?"]}
+
+
+def test_save_refuses_a_bank_changed_since_the_dry_run(bank_file):
+    report = bulk_io.import_questions(io.StringIO(CSV_FILE), bank_file=bank_file, dry_run=True)
+    storage.write_json_atomic(bank_file, {"categories": [{"id": 1, "name": "Python", "questions": []},
+                                                         {"id": 2, "name": "Go", "questions": []}]})
+    assert report.save() is False
+    assert bank_questions(bank_file) == {"Python": [], "Go": []}
+
+    report = bulk_io.import_questions(io.StringIO(CSV_FILE), bank_file=bank_file, allow_errors=True)
+    assert report.saved
+    assert bank_questions(bank_file) == {"Python": ["2 + 2?"], "Go": [], "SQL": ["SELECT 1?"]}
+
+
+def test_invalid_rows_block_the_import(bank_file):
+    report = bulk_io.import_questions(io.StringIO(CSV_FILE), bank_file=bank_file)
+    assert not report.saved
+    assert report.summary() == "2 valid questions not imported, 0 duplicates skipped, 1 invalid rows."
+    assert bank_questions(bank_file) == {"Python": []}
@@ -0,0 +1,139 @@
+import datetime
+import os
+
+import pytest
+
+import history_archive
+import storage
+
+USERS = [1, 2, 3]
+CATEGORIES = ["Python", "SQL"]
+
+
+def make_games():
+    """Games of three users from January to June 2024, oldest first."""
+    games = []
+    day = datetime.datetime(2024, 1, 1, 9, 0)
+    for i in range(150):
+        games.append({"user_id": USERS[i % 3], "category": CATEGORIES[i % 2 if i % 5 else 0],
+                      "questions": [["q1", "a", 1, "x"]] * (1 + i % 4), "score": f"{i % 4}/{1 + i % 4}",
+                      "date": str(day + datetime.timedelta(days=i * 1.2))})
+    return games
+
+
+@pytest.fixture
+def history(tmp_path):
+    backend = storage.JsonStorage()
+    path = str(tmp_path / "history.json")
+    backend.append_history_many(path, make_games())
+    return backend, path
+
+
+def compact(backend, path, now, compression="gzip"):
+    return backend.history_archive(path).compact(backend.history_log(path), keep_days=90,
+                                                 compression=compression, now=now)
+
+
+def all_pages(backend, path, **filters):
+    """Every history page of every user, without the refs (log offsets or archive keys)."""
+    pages = {}
+    for user_id in USERS:
+        page = 1
+        while True:
+            games, total = backend.history_page(path, user_id, page, 7, **filters)
+            pages[user_id, page] = ([{k: v for k, v in g.items() if k != "ref"} for g in games], total)
+            if not games:
+                break
+            page += 1
+    return pages
+
+
+FILTERS = [{}, {"category": "SQL"}, {"date_from": datetime.date(2024, 2, 10), "date_to": datetime.date(2024, 4, 3)}]
+
+
+@pytest.mark.parametrize("compression", ["gzip", "lzma"])
+def test_pages_are_unchanged_by_compaction(history, compression):
+    backend, path = history
+    before = [all_pages(backend, path, **filters) for filters in FILTERS]
+    games = backend.load_history(path)
+
+    archived, created = compact(backend, path, datetime.datetime(2024, 6, 15), compression)
+    assert created == ["2024-01", "2024-02"]
+    assert archived == sum(1 for game in games if game["date"] < "2024-03")
+    assert len(backend.history_log(path)) == len(games) - archived
+    directory = history_archive.archive_dir_for(path)
+    assert all(os.path.exists(os.path.join(directory, name + history_archive.COMPRESSION[compression]))
+               for name in created)
+    assert not [name for name in os.listdir(directory) if ".tmp" in name]
+
+    assert [all_pages(backend, path, **filters) for filters in FILTERS] == before
+    assert backend.load_history(path) == games
+    assert backend.load_history(path, 2) == [game for game in games if game["user_id"] == 2]
+
+    # Archived and recent games are both opened from their page refs
+    by_id = {game["id"]: game for game in games}
+    for user_id in USERS:
+        page = 1
+        while True:
+            summaries, _ = backend.history_page(path, user_id, page, 7)
+            if not summaries:
+                break
+            for summary in summaries:
+                assert backend.load_history_game(path, summary["ref"]) == by_id[summary["id"]]
+            page += 1
+
+
+def test_pages_in_another_process(history):
+    backend, path = history
+    before = all_pages(backend, path)
+    compact(backend, path, datetime.datetime(2024, 6, 15))
+    assert all_pages(storage.JsonStorage(), path) == before
+
+
+def test_cursors_survive_compaction(history):
+    backend, path = history
+    stream = list(backend.history_since(path))
+    games = [game for game, _ in stream]
+    cursors = {game["id"]: cursor for game, cursor in stream}
+
+    compact(backend, path, datetime.datetime(2024, 6, 15))
+    assert [game for game, _ in backend.history_since(path)] == games
+    for last_id in (0, 10, backend.history_archive(path).last_id, 120, games[-1]["id"]):
+        cursor = cursors.get(last_id)
+        assert [game for game, _ in backend.history_since(path, cursor)] == games[last_id:]
+
+    # A second compaction, and a cursor taken between the two
+    cursor = cursors[100]
+    compact(backend, path, datetime.datetime(2024, 8, 20))
+    assert len(backend.history_archive(path).segments) > 2
+    assert [game for game, _ in backend.history_since(path, cursor)] == games[100:]
+
+    # New games keep following the archived ones
+    last = None
+    for _, last in backend.history_since(path, cursor):
+        pass
+    new_id = backend.append_history(path, dict(games[0], date="2024-08-21 10:00:00"))
+    assert new_id == games[-1]["id"] + 1
+    assert [game["id"] for game, _ in backend.history_since(path, last)] == [new_id]
+
+
+def test_compaction_is_idempotent(history):
+    backend, path = history
+    before = all_pages(backend, path)
+    compact(backend, path, datetime.datetime(2024, 6, 15))
+    assert compact(backend, path, datetime.datetime(2024, 6, 15)) == (0, [])
+    assert all_pages(backend, path) == before
+
+
+def test_rollup(history):
+    backend, path = history
+    games = backend.load_history(path)
+    compact(backend, path, datetime.datetime(2024, 6, 15))
+    archive = backend.history_archive(path)
+    archived = [game for game in games if game["id"] <= archive.last_id and game["user_id"] == 1]
+    rollup = archive.rollup(1)
+    assert sum(totals["attempts"] for totals in rollup.values()) == len(archived)
+    for category, totals in rollup.items():
+        scores = [game["score"] for game in archived if game["category"] == category]
+        assert totals["correct"] == sum(int(score.split("/")[0]) for score in scores)
+        assert totals["answered"] == sum(int(score.split("/")[1]) for score in scores)
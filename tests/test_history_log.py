@@ -0,0 +1,164 @@
+import json
+import os
+
+import pytest
+
+import history_log
+
+
+def game(user_id, score="1/1", category="Python"):
+    return {"user_id": user_id, "category": category, "questions": [], "score": score,
+            "date": "2024-05-01 10:00:00"}
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "history.jsonl")
+
+
+def log_lines(path):
+    with open(path, 'rb') as file:
+        return file.read().split(b"\n")
+
+
+def test_append_and_read(path):
+    log = history_log.HistoryLog(path)
+    assert log.append(game(1)) == 1
+    assert log.append_many([game(2), game(1, "0/1")]) == [2, 3]
+    assert len(log) == 3
+    assert [g["id"] for g in log.read_user(1)] == [1, 3]
+    assert [s["score"] for s in log.user_summaries(1)] == ["1/1", "0/1"]
+    ref = log.user_summaries(2)[0]["ref"]
+    assert log.read_game(ref)["user_id"] == 2
+
+
+def test_torn_tail_is_cut_before_the_next_append(path):
+    history_log.HistoryLog(path).append_many([game(1), game(2)])
+    with open(path, 'ab') as file:
+        file.write(b'{"id":3,"user_id":1,"cat')  # crash in the middle of a write
+
+    log = history_log.HistoryLog(path)
+    assert len(log) == 2
+    assert [g["id"] for g in log.iter_all()] == [1, 2]
+    assert log.append(game(1, "0/1")) == 3
+    lines = log_lines(path)
+    assert lines[-1] == b""
+    assert [json.loads(line)["id"] for line in lines[:-1]] == [1, 2, 3]
+    assert [g["id"] for g in log.read_user(1)] == [1, 3]
+
+
+@pytest.mark.parametrize("sidecar", [".idx", ".sum"])
+def test_missing_sidecar_is_rebuilt(path, sidecar):
+    history_log.HistoryLog(path).append_many([game(1), game(2), game(1)])
+    os.remove(path + sidecar)
+    log = history_log.HistoryLog(path)
+    assert len(log) == 3
+    assert [s["id"] for s in log.user_summaries(1)] == [1, 3]
+
+
+def test_games_missing_from_the_index_are_reindexed(path):
+    log = history_log.HistoryLog(path)
+    log.append_many([game(1), game(2)])
+    with open(path + ".idx", 'r+b') as file:  # crash after the log write, before the index records
+        file.truncate(len(history_log.INDEX_MAGIC) + history_log.INDEX_RECORD.size)
+    with open(path + ".idx", 'ab') as file:
+        file.write(b"\x01\x02\x03")  # and a torn record
+
+    log = history_log.HistoryLog(path)
+    assert len(log) == 2
+    assert [s["id"] for s in log.user_summaries(2)] == [2]
+    assert log.append(game(2)) == 3
+
+
+def test_stale_index_is_discarded(path):
+    history_log.HistoryLog(path).append_many([game(1)] * 5)
+    with open(path + ".idx", 'rb') as file:
+        stale_index = file.read()
+    os.remove(path)
+    history_log.HistoryLog(path).append(game(2))
+    with open(path + ".idx", 'wb') as file:
+        file.write(stale_index)  # points past the end of the new, shorter log
+
+    log = history_log.HistoryLog(path)
+    assert len(log) == 1
+    assert log.read_user(1) == []
+    assert [g["id"] for g in log.read_user(2)] == [1]
+
+
+def test_appends_from_another_process_are_seen(path):
+    reader = history_log.HistoryLog(path)
+    writer = history_log.HistoryLog(path)
+    writer.append_many([game(1), game(1)])
+    assert len(reader) == 2
+    assert reader.append(game(1)) == 3
+    assert [g["id"] for g in writer.read_user(1)] == [1, 2, 3]
+
+
+def test_iter_from_resumes_at_the_returned_offset(path):
+    log = history_log.HistoryLog(path)
+    log.append_many([game(1), game(2)])
+    _, end = list(log.iter_from(0))[-1]
+    log.append(game(3))
+    assert [g["id"] for g, _ in log.iter_from(end)] == [3]
+
+
+def test_drop_through(path):
+    log = history_log.HistoryLog(path)
+    log.append_many([game(i % 2) for i in range(6)])
+    other = history_log.HistoryLog(path)  # another process with the old log open
+
+    assert log.drop_through(4) == 4
+    assert log.id_base == 4
+    assert [g["id"] for g in log.iter_all()] == [5, 6]
+    assert [g["id"] for g in log.read_user(0)] == [5]
+    assert log.drop_through(3) == 0  # already dropped
+
+    assert other.append(game(1)) == 7  # ids go on after the dropped games
+    assert [g["id"] for g in other.read_user(1)] == [6, 7]
+    assert len(log) == 3
+    assert [s["id"] for s in log.user_summaries(1)] == [6, 7]
+
+    reopened = history_log.HistoryLog(path)
+    assert (reopened.id_base, len(reopened)) == (4, 3)
+    assert not any(os.path.exists(path + ".new" + suffix) for suffix in ("", ".idx", ".sum", ".base"))
+
+
+@pytest.mark.parametrize("renames", [0, 1, 2, 3])
+def test_crash_during_drop_through(path, monkeypatch, renames):
+    history_log.HistoryLog(path).append_many([game(i % 3) for i in range(10)])
+    replace = os.replace
+    done = []
+
+    def crashing_replace(src, dst):
+        if len(done) == renames:
+            raise OSError("crash")
+        done.append(dst)
+        replace(src, dst)
+
+    monkeypatch.setattr(os, "replace", crashing_replace)
+    with pytest.raises(OSError):
+        history_log.HistoryLog(path).drop_through(2)
+    monkeypatch.setattr(os, "replace", replace)
+
+    log = history_log.HistoryLog(path)
+    ids = [g["id"] for g in log.iter_all()]
+    assert ids == (list(range(1, 11)) if renames < 2 else list(range(3, 11)))  # the log swap is the commit point
+    assert [g["id"] for g in log.read_user(0)] == [i for i in ids if (i - 1) % 3 == 0]
+    assert [s["id"] for s in log.user_summaries(1)] == [i for i in ids if (i - 1) % 3 == 1]
+    assert log.append(game(2)) == 11
+    assert log.drop_through(2) == (2 if renames < 2 else 0)
+    assert [g["id"] for g in log.read_user(2)] == [3, 6, 9, 11]
+
+
+def test_sidecars_of_another_log_are_rebuilt(path, tmp_path):
+    history_log.HistoryLog(path).append_many([game(i % 3) for i in range(10)])
+    other = str(tmp_path / "other.jsonl")
+    with open(other, 'wb') as file:
+        file.write(b"\n".join(log_lines(path)[2:]))  # the same log after dropping games 1 and 2
+    history_log.HistoryLog(other)
+    for sidecar in (".idx", ".sum"):
+        os.replace(other + sidecar, path + sidecar)
+
+    log = history_log.HistoryLog(path)
+    assert [g["id"] for g in log.read_user(0)] == [1, 4, 7, 10]
+    assert log.append(game(0)) == 11
@@ -0,0 +1,55 @@
+import datetime
+
+import pytest
+
+import leaderboard
+
+NOW = datetime.datetime(2024, 5, 6, 12, 0)
+
+
+def game(game_id, correct, total=10, category="Python", user_id=1, minutes=0):
+    return {"id": game_id, "user_id": user_id, "category": category, "score": f"{correct}/{total}",
+            "date": str(NOW - datetime.timedelta(minutes=minutes))}
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "leaderboard.json")
+
+
+def test_top_k(path):
+    boards = leaderboard.Leaderboards(path, k=3)
+    for game_id, correct in enumerate([4, 9, 7, 9, 2, 8], 1):
+        boards.record(game(game_id, correct, minutes=game_id))
+    boards.record(game(7, 5, category="SQL"))
+    # Ties go to the earlier game
+    assert [e["id"] for e in boards.top("Python", now=NOW)] == [4, 2, 6]
+    assert [e["id"] for e in boards.top(now=NOW)] == [4, 2, 6]
+    assert [e["id"] for e in boards.top("SQL", "day", now=NOW)] == [7]
+    assert boards.top("SQL", "day", now=NOW + datetime.timedelta(days=1)) == []
+    assert not boards.record(game(8, 0, total=0))
+
+
+def test_duplicates_are_ignored(path):
+    boards = leaderboard.Leaderboards(path, k=2)
+    boards.record(game(1, 5))
+    boards.record(game(1, 5))
+    boards.record(game(2, 9))
+    assert [e["id"] for e in boards.top("Python", now=NOW)] == [2, 1]
+    boards.record(game(3, 10))  # pushes game 1 out
+    boards.record(game(1, 5))
+    assert [e["id"] for e in boards.top("Python", now=NOW)] == [3, 2]
+    for key, heap in boards._boards.items():
+        assert boards._ids[key] == {item[5]["id"] for item in heap}
+
+
+def test_boards_of_other_processes_are_merged(path):
+    first = leaderboard.Leaderboards(path, k=3)
+    second = leaderboard.Leaderboards(path, k=3)
+    first.record(game(1, 6))
+    first.save()
+    second.record(game(2, 8))
+    second.record(game(1, 6))  # the same game, seen by both
+    second.save()
+    assert [e["id"] for e in first.top("Python", now=NOW)] == [2, 1]
+    assert [e["id"] for e in leaderboard.Leaderboards(path).top("Python", now=NOW)] == [2, 1]
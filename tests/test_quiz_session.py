@@ -0,0 +1,126 @@
+import json
+
+import pytest
+
+import sampler
+from quiz_session import ACTIVE, EXPIRED, FINISHED, QuizSession
+
+
+def make_category(count=12):
+    questions = [{"id": i, "uid": f"q{i}", "question": f"Question {i}?", "correct_answer": "a",
+                  "options": [{"id": o, "text": f"{o}{i}"} for o in "abcd"]} for i in range(count)]
+    return {"id": 1, "name": "Python", "questions": questions}
+
+
+@pytest.fixture
+def category():
+    return make_category()
+
+
+def start(category, num_questions=3, now=1000.0):
+    return QuizSession.start(7, category, num_questions, seconds_per_question=20, seed=5, now=now)
+
+
+def test_start_draws_from_the_seed(category):
+    session = start(category)
+    positions = sampler.draw_indices(12, 3, 5)
+    assert session.question_ids == [f"q{i}" for i in positions]
+    assert session.positions == positions
+    assert (session.length, session.deadline, session.state) == (3, 1060.0, ACTIVE)
+    assert session.question() is category["questions"][positions[0]]
+
+
+def test_length_is_capped_by_the_category(category):
+    session = start(category, num_questions=30)
+    assert session.length == 12
+    assert session.num_questions == 30
+    assert session.score_text() == "0/12"
+
+
+def test_answers_and_transitions(category):
+    session = start(category)
+    assert session.next(now=1001) is session.question()  # nothing answered: stays put
+    assert session.cursor == 0
+
+    assert session.answer("a", now=1001) is True
+    assert session.answer("b", now=1001) is True  # a rerun keeps the first answer
+    assert session.current_answer() == "a"
+    session.next(now=1002)
+    assert session.answer("c", now=1003) is False
+    session.next(now=1004)
+    session.answer("a", now=1005)
+    assert session.next(now=1006) is None
+
+    assert session.state == FINISHED
+    assert session.question() is None
+    assert session.answer("a", now=1007) is None
+    assert session.score_text() == "2/3"
+    assert [record[0] for record in session.answers] == session.question_ids
+    assert session.finalize() is True
+    assert session.finalize() is False  # stored exactly once
+
+
+def test_expiry(category):
+    session = start(category)
+    assert session.finalize() is False  # still running
+    session.answer("a", now=1010)
+    assert session.remaining(now=1050) == 10
+    assert session.answer("a", now=1060) is None
+    assert session.state == EXPIRED
+    assert session.next(now=1061) is None
+    assert session.check_deadline(now=2000) == EXPIRED
+    assert session.score_text() == "1/3"
+    assert session.finalize() is True
+    assert session.finalize() is False
+
+
+def test_checkpoint_round_trip(category):
+    session = start(category)
+    session.answer("a", now=1001)
+    session.next(now=1001)
+    restored = QuizSession.from_dict(json.loads(json.dumps(session.to_dict())), category)
+    assert restored.to_dict() == session.to_dict()
+    assert restored.question() is session.question()
+
+    for attempt in (session, restored):
+        attempt.answer("b", now=1002)
+        attempt.next(now=1002)
+        attempt.answer("a", now=1003)
+        attempt.next(now=1003)
+    assert restored.to_dict() == session.to_dict()
+    assert restored.state == FINISHED and restored.score_text() == "2/3"
+
+
+def test_checkpoint_without_positions(category):
+    data = start(category).to_dict()
+    del data["positions"]  # saved before positions were recorded
+    restored = QuizSession.from_dict(data, category)
+    assert restored.positions == []
+    assert restored.question()["uid"] == data["question_ids"][0]
+
+
+def test_restore_after_the_bank_changed(category):
+    session = start(category)
+    edited = dict(category, questions=list(reversed(category["questions"])))  # every position moved
+    restored = QuizSession.from_dict(session.to_dict(), edited)
+    assert restored.question()["uid"] == session.question_ids[0]
+
+    removed = dict(category, questions=[q for q in category["questions"] if q["uid"] != session.question_ids[0]])
+    assert QuizSession.from_dict(session.to_dict(), removed).question() is None
+
+
+def test_adaptive_questions_are_picked_one_at_a_time(category):
+    class Engine:
+        def next_question(self, user_id, category, asked):
+            return next(q for q in category["questions"] if q not in asked)
+
+    session = QuizSession.start(7, category, 2, 20, adaptive_mode=True, now=1000.0)
+    assert session.seed is None and session.question() is None
+    session.pick_adaptive(Engine())
+    assert session.question_ids == ["q0"] and session.positions == [None]
+    session.answer("a", now=1001)
+    session.pick_adaptive(Engine())
+    session.next(now=1001)
+    assert session.question()["uid"] == "q1"
+    assert session.pick_adaptive(Engine()) is None  # the quiz is full
+    assert QuizSession.from_dict(session.to_dict(), category).question()["uid"] == "q1"
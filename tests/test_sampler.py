@@ -0,0 +1,31 @@
+import sampler
+
+
+def test_draw_indices_is_deterministic():
+    assert sampler.draw_indices(1000, 10, 42) == sampler.draw_indices(1000, 10, 42)
+    assert sampler.draw_indices(1000, 10, 42) != sampler.draw_indices(1000, 10, 43)
+
+
+def test_draw_indices_are_distinct_and_in_range():
+    for seed in range(50):
+        picked = sampler.draw_indices(30, 10, seed)
+        assert len(picked) == len(set(picked)) == 10
+        assert all(0 <= i < 30 for i in picked)
+
+
+def test_draw_indices_caps_k_at_n():
+    assert sorted(sampler.draw_indices(5, 10, 7)) == [0, 1, 2, 3, 4]
+    assert sampler.draw_indices(0, 10, 7) == []
+
+
+def test_shorter_draw_is_a_prefix():
+    # The partial shuffle picks in order, so asking for more questions extends the same draw
+    assert sampler.draw_indices(100, 20, 3)[:10] == sampler.draw_indices(100, 10, 3)
+
+
+def test_draw_leaves_the_list_untouched():
+    questions = [{"question": str(i)} for i in range(20)]
+    before = list(questions)
+    drawn = sampler.draw(questions, 5, 11)
+    assert questions == before
+    assert drawn == [questions[i] for i in sampler.draw_indices(20, 5, 11)]
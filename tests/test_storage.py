@@ -0,0 +1,128 @@
+import datetime
+
+import pytest
+
+import storage
+
+BANK = {
+    "categories": [
+        {"id": 1, "name": "Python", "questions": [
+            {"id": 1, "uid": "q1", "question": "2 + 2?", "correct_answer": "b",
+             "options": [{"id": "a", "text": "3"}, {"id": "b", "text": "4"},
+                         {"id": "c", "text": "5"}, {"id": "d", "text": "22"}]},
+            {"id": 2, "uid": "q2", "question": "len('ab')?", "correct_answer": "a",
+             "options": [{"id": "a", "text": "2"}, {"id": "b", "text": "1"},
+                         {"id": "c", "text": "0"}, {"id": "d", "text": "3"}]}
+        ]},
+        {"id": 2, "name": "Empty", "questions": []}
+    ]
+}
+
+
+def game(user_id, category, score, day):
+    return {"user_id": user_id, "category": category, "questions": [["q1", "b", 1, "x"]],
+            "score": score, "date": f"2024-05-{day:02d} 10:00:00"}
+
+
+@pytest.fixture(params=["json", "sqlite"])
+def backend(request, tmp_path):
+    """Each backend with its files in a temporary directory, and the paths to pass it."""
+    paths = {name: str(tmp_path / name) for name in ("users.json", "qcm.json", "history.json")}
+    backend = storage.make_storage(request.param, str(tmp_path / "qcm.db"))
+    yield backend, paths
+    if request.param == "sqlite":
+        backend.close()
+
+
+def without_refs(games):
+    return [{k: v for k, v in game.items() if k != "ref"} for game in games]
+
+
+def test_users(backend):
+    backend, paths = backend
+    assert backend.load_users(paths["users.json"]) == []
+    alice = backend.add_user(paths["users.json"], "Alice", "secret")
+    bob = backend.add_user(paths["users.json"], "bob", "hunter2")
+    assert backend.add_user(paths["users.json"], "ALICE", "other") is None  # usernames are case-insensitive
+    assert [user["username"] for user in backend.load_users(paths["users.json"])] == ["Alice", "bob"]
+    assert backend.find_user(paths["users.json"], "alice") == alice
+    assert backend.find_user(paths["users.json"], "carol") is None
+    assert backend.get_user_by_id(paths["users.json"], bob["id"]) == bob
+
+
+def test_bank_round_trip(backend):
+    backend, paths = backend
+    before = backend.bank_signature(paths["qcm.json"])
+    backend.save_bank(paths["qcm.json"], BANK)
+    assert backend.bank_signature(paths["qcm.json"]) != before
+    assert backend.load_bank(paths["qcm.json"]) == BANK
+    assert backend.load_categories(paths["qcm.json"]) == [
+        {"id": 1, "name": "Python", "count": 2},
+        {"id": 2, "name": "Empty", "count": 0}
+    ]
+    assert backend.load_category(paths["qcm.json"], 1) == BANK["categories"][0]
+    assert backend.load_category(paths["qcm.json"], 3) is None
+
+
+def test_history(backend):
+    backend, paths = backend
+    path = paths["history.json"]
+    first = backend.append_history(path, game(1, "Python", "3/5", 1))
+    ids = backend.append_history_many(path, [game(2, "Python", "1/5", 2), game(1, "SQL", "5/5", 3),
+                                             game(1, "Python", "4/5", 4)])
+    assert [first] + ids == [1, 2, 3, 4]
+
+    assert [g["id"] for g in backend.load_history(path)] == [1, 2, 3, 4]
+    assert [g["id"] for g in backend.load_history(path, 1)] == [1, 3, 4]
+    assert [g["id"] for g, _ in backend.history_since(path)] == [1, 2, 3, 4]
+
+    games, total = backend.history_page(path, 1, page=1, page_size=2)
+    assert total == 3
+    assert without_refs(games) == [
+        {"id": 4, "category": "Python", "score": "4/5", "date": "2024-05-04 10:00:00", "questions": 1},
+        {"id": 3, "category": "SQL", "score": "5/5", "date": "2024-05-03 10:00:00", "questions": 1}
+    ]
+    assert backend.load_history_game(path, games[1]["ref"])["category"] == "SQL"
+    assert [g["id"] for g in backend.history_page(path, 1, page=2, page_size=2)[0]] == [1]
+
+    games, total = backend.history_page(path, 1, category="Python", date_from=datetime.date(2024, 5, 2))
+    assert ([g["id"] for g in games], total) == ([4], 1)
+
+
+def test_history_since_resumes(backend):
+    backend, paths = backend
+    path = paths["history.json"]
+    backend.append_history_many(path, [game(1, "Python", "1/5", 1), game(1, "Python", "2/5", 2)])
+    cursor = None
+    for _, cursor in backend.history_since(path):
+        pass
+    backend.append_history(path, game(2, "Python", "3/5", 3))
+    assert [g["id"] for g, _ in backend.history_since(path, cursor)] == [3]
+
+
+def test_json_history_seeded_from_legacy_file(tmp_path):
+    path = tmp_path / "history.json"
+    path.write_text('[{"user_id": 1, "category": "Python", "questions": [], "score": "1/1", '
+                    '"date": "2024-05-01 10:00:00"}]', encoding="utf-8")
+    backend = storage.JsonStorage()
+    assert [(g["id"], g["score"]) for g in backend.load_history(str(path))] == [(1, "1/1")]
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        storage.make_storage("xml")
+
+
+def test_save_category(backend):
+    backend, paths = backend
+    backend.save_bank(paths["qcm.json"], BANK)
+    python = dict(BANK["categories"][0], name="Python 3", questions=BANK["categories"][0]["questions"][:1])
+    backend.save_category(paths["qcm.json"], python)
+    backend.save_category(paths["qcm.json"], {"id": 5, "name": "SQL", "questions": []})
+    assert backend.load_categories(paths["qcm.json"]) == [
+        {"id": 1, "name": "Python 3", "count": 1},
+        {"id": 2, "name": "Empty", "count": 0},
+        {"id": 5, "name": "SQL", "count": 0}
+    ]
+    assert backend.load_category(paths["qcm.json"], 1) == python
+    assert backend.load_bank(paths["qcm.json"])["categories"][1] == BANK["categories"][1]
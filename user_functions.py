@@ -1,89 +1,145 @@
-import json
-
-def load_json_file(file_path):
-    """Load JSON data from a file."""
-    try:
-        with open(file_path, 'r', encoding='utf-8') as file:
-            return json.load(file)
-    except FileNotFoundError:
-        return {"users": []}  # Return an empty structure if the file doesn't exist
-    except json.JSONDecodeError:
-        return {"users": []}  # Return an empty structure if JSON is invalid
-
-def save_json_file(file_path, data):
-    """Save data to a JSON file."""
-    with open(file_path, 'w', encoding='utf-8') as file:
-        json.dump(data, file, indent=2, ensure_ascii=False)
+import threading
+import metrics
+import storage
+import question_ids
+
+class UserStore:
+    """In-memory index over the accounts of one user file.
+
+    Usernames are matched case-insensitively through a casefolded hash index,
+    so lookups cost the same with 10 or 100k accounts. The index is loaded
+    once and rebuilt only when the backend reports that the file changed.
+    """
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self._lock = threading.Lock()
+        self._signature = object()  # never equal to a real signature: forces the first load
+        self._by_name = {}
+        self._by_id = {}
+
+    def _refresh(self):
+        backend = storage.get_storage()
+        signature = backend.users_signature(self.file_path)
+        if signature is not None and signature == self._signature:
+            return
+        with self._lock:
+            if signature is not None and signature == self._signature:
+                return
+            users = backend.load_users(self.file_path)
+            self._by_name = {user["username"].casefold(): user for user in users}
+            self._by_id = {user["id"]: user for user in users}
+            self._signature = signature
+
+    def find(self, username):
+        self._refresh()
+        return self._by_name.get(username.casefold())
+
+    def get_by_id(self, user_id):
+        self._refresh()
+        return self._by_id.get(user_id)
+
+    def add(self, username, password):
+        """Create an account and return it, or None if the username is taken."""
+        if self.find(username) is not None:
+            return None
+        # The backend assigns the id under its own lock, after re-reading the file
+        new_user = storage.get_storage().add_user(self.file_path, username, password)
+        if new_user is not None:
+            with self._lock:
+                self._by_name[new_user["username"].casefold()] = new_user
+                self._by_id[new_user["id"]] = new_user
+        return new_user
+
+    def __len__(self):
+        self._refresh()
+        return len(self._by_id)
+
+_user_stores = {}
+_user_stores_lock = threading.Lock()
+
+def get_user_store(file_path):
+    """Return the shared UserStore for a user file."""
+    with _user_stores_lock:
+        store = _user_stores.get(file_path)
+        if store is None:
+            store = _user_stores[file_path] = UserStore(file_path)
+        return store
 
 def user_exists(username, file_path):
-    """Check if a user exists in the JSON file."""
-    data = load_json_file(file_path)
-    return any(user["username"].lower() == username.lower() for user in data["users"])
+    """Check if a user exists in the user store."""
+    return get_user_store(file_path).find(username) is not None
 
 def add_user(username, password, file_path):
-    """Add a new user to the JSON file."""
-    data = load_json_file(file_path)
-
-    if user_exists(username, file_path):
+    """Add a new user to the user store."""
+    new_user = get_user_store(file_path).add(username, password)
+    if new_user is None:
         print("Error: User already exists.")
         return
 
-    new_user_id = 1 if not data["users"] else data["users"][-1]["id"] + 1
-    new_user = {
-        "id": new_user_id,
-        "username": username,
-        "password": password
-    }
-    data["users"].append(new_user)
-    save_json_file(file_path, data)
     print("User added successfully.")
 
+@metrics.timed("uf.login")
 def login(username, password, file_path):
     """Authenticate a user."""
-    data = load_json_file(file_path)
-    user = next((user for user in data["users"] if user["username"].lower() == username.lower()), None)
+    user = get_user_store(file_path).find(username)
     return user is not None and user["password"] == password
 
 def get_user_id(username, file_path):
     """Get the user ID from the username."""
-    data = load_json_file(file_path)
-    user = next((user for user in data["users"] if user["username"].lower() == username.lower()), None)
+    user = get_user_store(file_path).find(username)
     if user:
         return user['id']
     else:
         print(f"User '{username}' not found.")
         return None
 
-def check_history(user_id, file_path):
-    """Check the game history of a user."""
-    data = load_json_file(file_path)
-    if not isinstance(data, list):
-        print("Error: Invalid data structure.")
-        return
+HISTORY_PAGE_SIZE = 10
 
-    user_history = [game for game in data if game['user_id'] == user_id]
-    if not user_history:
-        print("No history found.")
-        return
+def check_history(user_id, file_path):
+    """Check the game history of a user, one page at a time (newest first)."""
+    backend = storage.get_storage()
+    page = 1
+    while True:
+        games, total = backend.history_page(file_path, user_id, page, HISTORY_PAGE_SIZE)
+        if not total:
+            print("No history found.")
+            return
 
-    print("Your History:")
-    for index, game in enumerate(user_history, start=1):
-        print(f"{index}. Game {index}, Category: {game['category']}, Score: {game['score']}, Date: {game['date']}")
+        pages = (total + HISTORY_PAGE_SIZE - 1) // HISTORY_PAGE_SIZE
+        print(f"\nYour History (page {page}/{pages}, newest first):")
+        numbered = {}
+        for index, game in enumerate(games):
+            number = total - (page - 1) * HISTORY_PAGE_SIZE - index
+            numbered[number] = game
+            print(f"{number}. Game {number}, Category: {game['category']}, Score: {game['score']}, Date: {game['date']}")
 
-    view_questions = input("\nDo you want to see the questions and answers? (yes/no): ").strip().lower()
-    if view_questions == "yes":
-        while True:
+        choice = input("\nEnter a game number to see its questions, 'n' for older games, 'p' for newer games or 'q' to quit: ").strip().lower()
+        if choice in ["q", ""]:
+            return
+        elif choice == "n":
+            if page < pages:
+                page += 1
+            else:
+                print("There are no older games.")
+        elif choice == "p":
+            if page > 1:
+                page -= 1
+            else:
+                print("There are no newer games.")
+        else:
             try:
-                game_choice = int(input("Which game? (Enter the game number): ").strip())
-                if 1 <= game_choice <= len(user_history):
-                    selected_game = user_history[game_choice - 1]
-                    print(f"\nQuestions and Answers for Game {game_choice}:")
-                    for q in selected_game["questions"]:
-                        print(f" - Question: {q['question']}")
-                        print(f"   Your Answer: {q['user_answer']}")
-                        print(f"   Correct: {'Yes' if q['is_correct'] else 'No'}")
-                    break
-                else:
-                    print("Invalid game number.")
+                game_choice = int(choice)
             except ValueError:
-                print("Invalid input. Please enter a valid game number.")
\ No newline at end of file
+                print("Invalid input. Please enter a game number, 'n', 'p' or 'q'.")
+                continue
+            if game_choice not in numbered:
+                print("Invalid game number. Pick one from the current page.")
+                continue
+            # The full record is only read for the game the user picked
+            selected_game = question_ids.expand_entry(backend.load_history_game(file_path, numbered[game_choice]['ref']))
+            print(f"\nQuestions and Answers for Game {game_choice}:")
+            for q in selected_game["questions"]:
+                print(f" - Question: {q['question']}")
+                print(f"   Your Answer: {q['user_answer']}")
+                print(f"   Correct: {'Yes' if q['is_correct'] else 'No'}")
\ No newline at end of file
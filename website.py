@@ -1,22 +1,101 @@
-import os
-import subprocess
 import time
-import webbrowser
 
-def launch_streamlit_app():
-    # Start the Streamlit app as a subprocess
-    streamlit_process = subprocess.Popen(
-        ["streamlit", "run", "streamlit_app.py", "--server.headless=true"]
-    )
+_STARTED = time.perf_counter()  # before any other import, to split interpreter and import time
+
+import os
+import threading
+import urllib.request
+
+# Launcher for the Streamlit app.
+# The server runs in this process, so the question bank and the user index are
+# loaded into the app's caches before the first page is served, and the
+# browser is opened as soon as the health endpoint answers instead of after a
+# fixed delay. Streamlit itself is only imported once the data is loaded.
+#   python website.py [--port 8501] [--no-browser]
+# prints a startup breakdown: interpreter, imports, data load, server bind.
+
+PORT = 8501
+HEALTH_PATH = "/_stcore/health"
+READY_TIMEOUT = 60
+POLL_INTERVAL = 0.05
+
 
-    # Wait for the server to start
-    time.sleep(2)  # Adjust the delay if needed
+def interpreter_seconds():
+    """Time from process start to the first line of this module (Linux only, None elsewhere)."""
+    try:
+        with open("/proc/self/stat") as file:
+            start_ticks = int(file.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as file:
+            uptime = float(file.read().split()[0])
+        return max(uptime - start_ticks / os.sysconf("SC_CLK_TCK") - (time.perf_counter() - _STARTED), 0.0)
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
 
-    # Open the default web browser to the Streamlit app's URL
-    webbrowser.open("http://localhost:8501")
+def prewarm():
+    """Load the bank and the user index into the caches the app pages read from.
 
-    # Wait for the Streamlit process to finish
-    streamlit_process.wait()
+    Runs before the server starts, so the health endpoint only answers once
+    the first quiz can start without parsing anything.
+    """
+    import quiz_app as qa
+    import user_functions as uf
+    loaded = time.perf_counter()
+    for summary in qa.load_categories():  # a plain qcm.json is parsed once, here
+        qa.load_category(summary["id"])    # sharded or mapped banks: every category
+    uf.get_user_store('users.json').find("")  # same key as the app's own calls
+    return loaded
+
+def wait_until_ready(url, timeout=READY_TIMEOUT):
+    """Poll the health endpoint until it answers 200. Returns False on timeout."""
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            with urllib.request.urlopen(url, timeout=1) as response:
+                if response.status == 200:
+                    return True
+        except OSError:  # not listening yet
+            pass
+        time.sleep(POLL_INTERVAL)
+    return False
+
+def report_when_ready(port, timings, open_browser):
+    url = f"http://localhost:{port}"
+    if not wait_until_ready(url + HEALTH_PATH):
+        print(f"Error: The app did not answer on {url} within {READY_TIMEOUT}s.")
+        return
+    timings["server bind"] = time.perf_counter() - timings.pop("_serving")
+    parts = ", ".join(f"{name} {'n/a' if seconds is None else f'{seconds:.2f}s'}" for name, seconds in timings.items())
+    print(f"Ready on {url} in {time.perf_counter() - _STARTED:.2f}s ({parts})")
+    if open_browser:
+        import webbrowser
+        webbrowser.open(url)
+
+def launch_streamlit_app(port=PORT, open_browser=True):
+    timings = {"interpreter": interpreter_seconds()}
+    imported = prewarm()
+    timings["imports"] = imported - _STARTED
+    timings["data load"] = time.perf_counter() - imported
+
+    step = time.perf_counter()
+    try:
+        from streamlit.web import bootstrap
+    except ImportError:
+        print("Error: Streamlit is not installed (pip install streamlit).")
+        return
+    timings["imports"] += time.perf_counter() - step
+
+    timings["_serving"] = time.perf_counter()
+    threading.Thread(target=report_when_ready, args=(port, timings, open_browser), daemon=True).start()
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "streamlit_app.py")
+    flag_options = {"server_headless": True, "server_port": port}
+    bootstrap.load_config_options(flag_options=flag_options)
+    bootstrap.run(script, False, [], flag_options)  # blocks until the server stops
 
 if __name__ == "__main__":
-    launch_streamlit_app()
\ No newline at end of file
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Start the quiz website")
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--no-browser", action="store_true", help="do not open a browser tab")
+    args = parser.parse_args()
+    launch_streamlit_app(args.port, not args.no_browser)